@@ -0,0 +1,500 @@
+"""
+Carving benchmarks on deterministic synthetic images.
+
+Builds a raw image with embedded JPEG/PNG/PDF/ZIP/MP4 samples, random filler,
+sparse (zero) regions and some fragmented files, plus a small FAT16 image with
+deleted files, then times each carver against the known layout:
+
+    python benchmark.py --size-mb 64 --json bench.json
+
+Every benchmark runs in a fresh process so its peak RSS is its own. Reported
+per benchmark: seconds, MB/s, hits, hits/s, peak RSS and recall (files carved
+intact / files embedded). The same --seed always produces the same images.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import struct
+import zlib
+import zipfile
+import hashlib
+import argparse
+import datetime
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.core.recoverer import Recoverer
+from src.core.scan_progress import ScanProgress
+
+try:
+    from src.core.deleted_scanner import DeletedScanner
+    HAS_PYTSK = True
+except ImportError:
+    HAS_PYTSK = False
+
+try:
+    from recoverease.backend.scanner.signature_matcher import StreamCarver, detect_file_signatures
+    HAS_MATCHER = True
+except ImportError:
+    HAS_MATCHER = False
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# The signature set the web app carves with (web_app.SIGNATURE_FILE), so the
+# benchmark measures what production runs.
+SIGNATURE_FILE = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data",
+                                              "file_signatures.json"))
+REPORT_VERSION = 1
+MiB = 1024 * 1024
+SECTOR = 512
+STREAM_CHUNK = 8 * MiB
+# (min, max) size in bytes of each embedded sample type.
+SAMPLE_SIZES = {
+    "jpg": (20 * 1024, 200 * 1024),
+    "png": (10 * 1024, 120 * 1024),
+    "pdf": (5 * 1024, 60 * 1024),
+    "zip": (20 * 1024, 200 * 1024),
+    "mp4": (50 * 1024, 400 * 1024),
+}
+HOLE_SIZES = (MiB, 4 * MiB)
+FRAGMENT_GAP = (4 * 1024, 64 * 1024)
+# Fixed timestamp for FAT entries and ZIP members, so images are reproducible.
+SAMPLE_TIME = (2024, 1, 15, 12, 0, 0)
+BENCHMARKS = ("recoverer", "detect_file_signatures", "stream_carver", "deleted")
+
+
+# ---------------- Samples ----------------
+
+def _jpeg(rng: random.Random, size: int) -> bytes:
+    seg = lambda marker, data: b"\xff" + bytes([marker]) + struct.pack(">H", len(data) + 2) + data
+    # Entropy-coded data: 0xff is always stuffed with 0x00, so no marker appears by chance.
+    scan = rng.randbytes(size).replace(b"\xff", b"\xff\x00")
+    return (b"\xff\xd8" + seg(0xe0, b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00")
+            + seg(0xdb, b"\x00" + rng.randbytes(64))
+            + seg(0xc0, b"\x08\x00\x10\x00\x10\x01\x01\x11\x00")
+            + seg(0xc4, b"\x00" + bytes(16))
+            + seg(0xda, b"\x01\x01\x00\x00\x3f\x00") + scan + b"\xff\xd9")
+
+
+def _png(rng: random.Random, size: int) -> bytes:
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+    width = 256
+    height = max(size // (width * 3 + 1), 1)
+    raw = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 0)) + chunk(b"IEND", b""))
+
+
+def _pdf(rng: random.Random, size: int) -> bytes:
+    stream = rng.randbytes(size).replace(b"%%EOF", b"%%EOG")
+    return (b"%PDF-1.4\n1 0 obj\n<< /Length " + str(len(stream)).encode() + b" >>\nstream\n"
+            + stream + b"\nendstream\nendobj\ntrailer\n<< /Root 1 0 R >>\n%%EOF\n")
+
+
+def _zip(rng: random.Random, size: int) -> bytes:
+    # One stored member: every further member would add a local header that
+    # carvers see as another ZIP start.
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr(zipfile.ZipInfo("data.bin", date_time=SAMPLE_TIME), rng.randbytes(size))
+    return buf.getvalue()
+
+
+def _mp4(rng: random.Random, size: int) -> bytes:
+    ftyp = struct.pack(">I", 24) + b"ftypmp42" + b"\x00\x00\x00\x00" + b"mp42isom"
+    moov = struct.pack(">I", 8 + 100) + b"moov" + rng.randbytes(100)
+    mdat = struct.pack(">I", 8 + size) + b"mdat" + rng.randbytes(size)
+    return ftyp + moov + mdat
+
+
+SAMPLES: Dict[str, Callable[[random.Random, int], bytes]] = {
+    "jpg": _jpeg, "png": _png, "pdf": _pdf, "zip": _zip, "mp4": _mp4,
+}
+
+
+def _truth(kind: str, data: bytes, **info) -> Dict:
+    """
+    Ground-truth record. core_size excludes a trailing end-of-line after the
+    PDF footer, which carvers legitimately keep or drop.
+    """
+    core = len(data) - 1 if kind == "pdf" else len(data)
+    return dict(info, type=kind, size=len(data), core_size=core, head=data[:32].hex(),
+                sha256=hashlib.sha256(data[:core]).hexdigest())
+
+
+def _sample(rng: random.Random) -> Tuple[str, bytes]:
+    kind = rng.choice(sorted(SAMPLES))
+    lo, hi = SAMPLE_SIZES[kind]
+    return kind, SAMPLES[kind](rng, rng.randrange(lo, hi))
+
+
+# ---------------- Images ----------------
+
+def build_image(path: str, size: int, seed: int = 1, density: float = 2.0, sparse: float = 0.25,
+                fragmented: float = 0.1) -> Dict:
+    """
+    Write a raw image of `size` bytes and return its manifest. About `density`
+    files per MiB are embedded at sector offsets between random filler; a
+    `fragmented` share of them is split in two around a filler gap, and about
+    `sparse` of the image is left as unwritten holes (zeros).
+    """
+    rng = random.Random(seed)
+    files: List[Dict] = []
+    n_files = max(int(density * size / MiB), 1)
+    mean_file = sum(lo + hi for lo, hi in SAMPLE_SIZES.values()) / (2 * len(SAMPLE_SIZES))
+    mean_hole = sum(HOLE_SIZES) / 2
+    hole_chance = min(sparse * size / (n_files * mean_hole), 1.0)
+    mean_gap = max(size * (1 - sparse) / n_files - mean_file, SECTOR)
+    holes = 0
+
+    with open(path, "wb") as f:
+        pos = 0
+        while True:
+            if rng.random() < hole_chance:
+                hole = rng.randrange(*HOLE_SIZES) // SECTOR * SECTOR
+                holes += min(hole, size - pos)
+                pos += hole
+            gap = rng.randrange(int(2 * mean_gap)) // SECTOR * SECTOR
+            kind, data = _sample(rng)
+            split = rng.random() < fragmented
+            frag_gap = rng.randrange(*FRAGMENT_GAP) // SECTOR * SECTOR if split else 0
+            end = pos + gap + len(data) + frag_gap
+            if end > size:
+                break
+            f.seek(pos)
+            f.write(rng.randbytes(gap))
+            start = pos + gap
+            if split:
+                cut = rng.randrange(SECTOR, len(data) // SECTOR * SECTOR or SECTOR, SECTOR)
+                f.write(data[:cut] + rng.randbytes(frag_gap) + data[cut:])
+            else:
+                f.write(data)
+            files.append(_truth(kind, data, offset=start, fragmented=split))
+            pos = -(-end // SECTOR) * SECTOR
+        f.seek(pos)
+        f.write(rng.randbytes(max(size - pos, 0)))
+        f.truncate(size)
+
+    return {"path": path, "size": size, "seed": seed, "density": density, "files": files,
+            "fragmented": sum(1 for t in files if t["fragmented"]), "sparse_bytes": holes}
+
+
+def _fat_date(year: int, month: int, day: int) -> int:
+    return ((year - 1980) << 9) | (month << 5) | day
+
+
+def _fat_time(hour: int, minute: int, second: int) -> int:
+    return (hour << 11) | (minute << 5) | (second // 2)
+
+
+def build_fat_image(path: str, size: int = 32 * MiB, seed: int = 1, n_files: int = 48,
+                    deleted: float = 0.75) -> Dict:
+    """
+    Write a FAT16 image with n_files samples in the root directory, a `deleted`
+    share of which are then deleted the way FAT does it: the first name byte
+    becomes 0xE5 and the cluster chain is freed, while the data stays in place.
+    Returns the manifest; its "files" list holds only the deleted files.
+    """
+    rng = random.Random(seed)
+    spc, reserved, nfats, root_entries = 4, 1, 2, 512
+    n_files = min(n_files, root_entries)
+    cluster = spc * SECTOR
+    total = size // SECTOR
+    root_secs = root_entries * 32 // SECTOR
+    fat_secs = -(-(total - reserved - root_secs) // (256 * spc + nfats))
+    data_start = reserved + nfats * fat_secs + root_secs
+    clusters = (total - data_start) // spc
+    if not 4085 <= clusters < 65525:
+        raise ValueError(f"{size} bytes doesn't make a FAT16 volume")
+
+    boot = bytearray(SECTOR)
+    boot[0:3] = b"\xeb\x3c\x90"
+    boot[3:11] = b"MSWIN4.1"
+    struct.pack_into("<HBHBHHBHHHII", boot, 11, SECTOR, spc, reserved, nfats, root_entries,
+                     total if total < 0x10000 else 0, 0xF8, fat_secs, 32, 64, 0,
+                     total if total >= 0x10000 else 0)
+    struct.pack_into("<BBBI11s8s", boot, 36, 0x80, 0, 0x29, seed & 0xFFFFFFFF, b"BENCH      ", b"FAT16   ")
+    boot[510:512] = b"\x55\xaa"
+
+    fat = [0] * (clusters + 2)
+    fat[0], fat[1] = 0xFFF8, 0xFFFF
+    root = bytearray(root_secs * SECTOR)
+    date, tm = _fat_date(*SAMPLE_TIME[:3]), _fat_time(*SAMPLE_TIME[3:])
+    files: List[Dict] = []
+    live = 0
+
+    with open(path, "wb") as f:
+        f.truncate(size)
+        next_cluster = 2
+        for i in range(n_files):
+            kind, data = _sample(rng)
+            count = -(-len(data) // cluster)
+            if next_cluster + count > clusters + 2:
+                break
+            first = next_cluster
+            is_deleted = rng.random() < deleted
+            if not is_deleted:
+                for c in range(first, first + count - 1):
+                    fat[c] = c + 1
+                fat[first + count - 1] = 0xFFFF
+                live += 1
+            name = f"F{i:07d}".encode() + kind.upper().encode()
+            entry = struct.pack("<11sBBBHHHHHHHI", name, 0x20, 0, 0, tm, date, date, 0, tm, date, first, len(data))
+            if is_deleted:
+                entry = b"\xe5" + entry[1:]
+                files.append(_truth(kind, data, name=f"F{i:07d}.{kind.upper()}", cluster=first))
+            root[i * 32:(i + 1) * 32] = entry
+            f.seek((data_start + (first - 2) * spc) * SECTOR)
+            f.write(data)
+            next_cluster += count
+
+        f.seek(0)
+        f.write(boot)
+        table = struct.pack(f"<{len(fat)}H", *fat)
+        for n in range(nfats):
+            f.seek((reserved + n * fat_secs) * SECTOR)
+            f.write(table)
+        f.seek((reserved + nfats * fat_secs) * SECTOR)
+        f.write(root)
+
+    return {"path": path, "size": size, "seed": seed, "files": files, "live_files": live}
+
+
+# ---------------- Benchmarks ----------------
+
+def _peak_rss() -> Optional[int]:
+    """Peak resident set size in bytes of this process or its children, or None if unknown."""
+    if resource is not None:
+        scale = 1 if sys.platform == "darwin" else 1024
+        return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    return None
+
+
+def _intact(carve: Optional[bytes], truth: Dict) -> bool:
+    core = truth["core_size"]
+    return carve is not None and len(carve) >= core and hashlib.sha256(carve[:core]).hexdigest() == truth["sha256"]
+
+
+def _score(truth: List[Dict], found: List[Dict], hits: int, elapsed: float, size: int) -> Dict:
+    contiguous = [t for t in truth if not t.get("fragmented")]
+    found_contiguous = [t for t in found if not t.get("fragmented")]
+    return {
+        "seconds": round(elapsed, 4),
+        "mb_per_s": round(size / MiB / elapsed, 2) if elapsed else None,
+        "hits": hits,
+        "hits_per_s": round(hits / elapsed, 2) if elapsed else None,
+        "expected": len(truth),
+        "found": len(found),
+        "extra": hits - len(found),
+        "recall": round(len(found) / len(truth), 4) if truth else None,
+        "recall_contiguous": round(len(found_contiguous) / len(contiguous), 4) if contiguous else None,
+        "peak_rss": _peak_rss(),
+    }
+
+
+def _match_carves(carves: List[bytes], truth: List[Dict]) -> List[Dict]:
+    """Truth records carved intact by a carver that doesn't report offsets."""
+    by_head: Dict[str, List[bytes]] = {}
+    for carve in carves:
+        by_head.setdefault(carve[:32].hex(), []).append(carve)
+    return [t for t in truth if any(_intact(c, t) for c in by_head.get(t["head"], ()))]
+
+
+def bench_recoverer(manifest: Dict, workers: int = 1, signature_file: str = SIGNATURE_FILE) -> Dict:
+    out = tempfile.mkdtemp(prefix="bench-carve-")
+    try:
+        # No content store: a second run would link to the first one's files.
+        rec = Recoverer(signature_file, dedupe=False)
+        progress = ScanProgress()
+        start = time.perf_counter()
+        results = rec.scan_device(manifest["path"], out, None, workers=workers, progress=progress)
+        elapsed = time.perf_counter() - start
+        by_offset = {r["offset"]: r["path"] for r in results}
+        found = []
+        for t in manifest["files"]:
+            path = by_offset.get(t["offset"])
+            if path:
+                with open(path, "rb") as f:
+                    if _intact(f.read(t["core_size"]), t):
+                        found.append(t)
+        report = _score(manifest["files"], found, len(results), elapsed, manifest["size"])
+        report["metrics"] = progress.metrics.snapshot()
+        return report
+    finally:
+        shutil.rmtree(out, ignore_errors=True)
+
+
+def bench_detect_file_signatures(manifest: Dict) -> Dict:
+    start = time.perf_counter()
+    with open(manifest["path"], "rb") as f:
+        data = f.read()
+    carves = [content for _, content in detect_file_signatures(data)]
+    elapsed = time.perf_counter() - start
+    del data
+    found = _match_carves(carves, manifest["files"])
+    return _score(manifest["files"], found, len(carves), elapsed, manifest["size"])
+
+
+def bench_stream_carver(manifest: Dict, chunk: int = STREAM_CHUNK) -> Dict:
+    start = time.perf_counter()
+    carver = StreamCarver()
+    carves = []
+    with open(manifest["path"], "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            carves.extend(content for _, content in carver.feed(block))
+    carves.extend(content for _, content in carver.finish())
+    elapsed = time.perf_counter() - start
+    found = _match_carves(carves, manifest["files"])
+    return _score(manifest["files"], found, len(carves), elapsed, manifest["size"])
+
+
+def bench_deleted(manifest: Dict, workers: int = 1) -> Dict:
+    out = tempfile.mkdtemp(prefix="bench-deleted-")
+    try:
+        start = time.perf_counter()
+        scanner = DeletedScanner(manifest["path"], out)
+        results = scanner.scan_deleted_files(workers=max(workers, 1))
+        elapsed = time.perf_counter() - start
+        digests = set()
+        for r in results:
+            with open(r["path"], "rb") as f:
+                digests.add(hashlib.sha256(f.read()).hexdigest())
+        found = [t for t in manifest["files"] if t["sha256"] in digests]
+        return _score(manifest["files"], found, len(results), elapsed, manifest["size"])
+    finally:
+        shutil.rmtree(out, ignore_errors=True)
+
+
+def _available(name: str) -> Optional[str]:
+    """Why a benchmark can't run here, or None if it can."""
+    if name == "deleted" and not HAS_PYTSK:
+        return "pytsk3 is not installed"
+    if name in ("detect_file_signatures", "stream_carver") and not HAS_MATCHER:
+        return "recoverease signature matcher not importable"
+    return None
+
+
+def run_benchmarks(workdir: str, names=BENCHMARKS, size: int = 64 * MiB, seed: int = 1, density: float = 2.0,
+                   sparse: float = 0.25, fragmented: float = 0.1, fat_size: int = 32 * MiB, fat_files: int = 48,
+                   workers: int = 1, signature_file: str = SIGNATURE_FILE) -> Dict:
+    """Build the images in workdir, run each named benchmark in its own process and return the report."""
+    os.makedirs(workdir, exist_ok=True)
+    raw = build_image(os.path.join(workdir, f"bench_{seed}.img"), size, seed, density, sparse, fragmented)
+    fat = None
+    if "deleted" in names:
+        fat = build_fat_image(os.path.join(workdir, f"bench_{seed}_fat16.img"), fat_size, seed, fat_files)
+
+    jobs = {
+        "recoverer": (bench_recoverer, raw, workers, signature_file),
+        "detect_file_signatures": (bench_detect_file_signatures, raw),
+        "stream_carver": (bench_stream_carver, raw),
+        "deleted": (bench_deleted, fat, workers),
+    }
+    results = {}
+    # spawn: a forked child would start with the parent's memory counted in its RSS.
+    ctx = multiprocessing.get_context("spawn")
+    for name in names:
+        reason = _available(name)
+        if reason:
+            print(f"[skip] {name}: {reason}")
+            results[name] = {"skipped": reason}
+            continue
+        print(f"[bench] {name} ...")
+        fn, *args = jobs[name]
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            results[name] = pool.submit(fn, *args).result()
+
+    def summary(manifest: Optional[Dict]) -> Optional[Dict]:
+        if manifest is None:
+            return None
+        return {k: v for k, v in manifest.items() if k not in ("path", "files")} | {"embedded": len(manifest["files"])}
+
+    return {
+        "version": REPORT_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"size": size, "seed": seed, "density": density, "sparse": sparse, "fragmented": fragmented,
+                   "fat_size": fat_size, "fat_files": fat_files, "workers": workers,
+                   "signature_file": signature_file},
+        "images": {"raw": summary(raw), "fat16": summary(fat)},
+        "benchmarks": results,
+    }
+
+
+def _print_report(report: Dict) -> None:
+    print(f"{'benchmark':<24}{'MB/s':>10}{'hits/s':>10}{'recall':>9}{'contig':>9}{'extra':>7}{'RSS MB':>9}")
+    for name, r in report["benchmarks"].items():
+        if "skipped" in r:
+            print(f"{name:<24}skipped: {r['skipped']}")
+            continue
+        fmt = lambda v, spec: format(v, spec) if v is not None else "-"
+        rss = r["peak_rss"] / MiB if r["peak_rss"] is not None else None
+        print(f"{name:<24}{fmt(r['mb_per_s'], '10.1f')}{fmt(r['hits_per_s'], '10.1f')}"
+              f"{fmt(r['recall'], '9.3f')}{fmt(r['recall_contiguous'], '9.3f')}{r['extra']:>7}{fmt(rss, '9.1f')}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the carvers on synthetic disk images")
+    parser.add_argument("--size-mb", type=int, default=64, help="Raw image size in MiB")
+    parser.add_argument("--density", type=float, default=2.0, help="Embedded files per MiB")
+    parser.add_argument("--sparse", type=float, default=0.25, help="Share of the image left as zero holes")
+    parser.add_argument("--fragmented", type=float, default=0.1, help="Share of files split around a gap")
+    parser.add_argument("--fat-mb", type=int, default=32, help="FAT16 image size in MiB (8-128)")
+    parser.add_argument("--fat-files", type=int, default=48, help="Files written to the FAT16 image")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1, help="Workers for Recoverer and DeletedScanner")
+    parser.add_argument("--signatures", type=str, default=SIGNATURE_FILE,
+                        help="Signature file for Recoverer (default: the web app's)")
+    parser.add_argument("--only", type=str, help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--json", type=str, help="Write the report to this file")
+    parser.add_argument("--workdir", type=str, help="Where images are built (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated images")
+    args = parser.parse_args(argv)
+
+    names = tuple(n.strip() for n in args.only.split(",")) if args.only else BENCHMARKS
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+    if "recoverer" in names and not os.path.isfile(args.signatures):
+        parser.error(f"signature file not found: {args.signatures} (pass --signatures)")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench-")
+    try:
+        report = run_benchmarks(workdir, names, args.size_mb * MiB, args.seed, args.density, args.sparse,
+                                args.fragmented, args.fat_mb * MiB, args.fat_files, args.workers, args.signatures)
+    finally:
+        # A --workdir may hold other files; only a temp dir made here is removed.
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bench] Report written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,425 @@
+import re
+import zlib
+from typing import Optional
+
+
+class InvalidStructure(ValueError):
+    """The bytes after a header match can't belong to a file of that type."""
+
+
+# Structural checks run on a carve candidate before anything is written. Each
+# takes a buffer (mmap, bytes, bytearray or memoryview) and the [start, end)
+# range of the candidate, and returns None if it looks intact or a short reason
+# string if it should be rejected.
+
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+
+# Inside JPEG entropy-coded data 0xFF may only be followed by a stuffed 0x00,
+# a restart marker, EOI, fill, or the tables/SOS of a further progressive scan.
+_JPEG_BAD_SCAN_MARKER = re.compile(b"\xff[^\x00\xd0-\xd7\xd9\xc4\xda\xdb\xdd\xff]")
+
+
+def check_jpeg(buf, start: int, end: int) -> Optional[str]:
+    if buf[start:start + 2] != b"\xff\xd8":
+        return "jpeg_no_soi"
+    pos = start + 2
+    seen_frame = False
+    while True:
+        if pos + 4 > end:
+            return "jpeg_truncated"
+        if buf[pos] != 0xFF:
+            return "jpeg_bad_marker"
+        marker = buf[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker == 0xD9:
+            return "jpeg_no_scan"
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            pos += 2
+            continue
+        length = int.from_bytes(buf[pos + 2:pos + 4], "big")
+        if length < 2:
+            return "jpeg_bad_segment"
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            seen_frame = True
+        pos += 2 + length
+        if marker == 0xDA:
+            break
+    if not seen_frame:
+        return "jpeg_no_frame"
+    if pos > end - 2 or buf[end - 2:end] != b"\xff\xd9":
+        return "jpeg_truncated"
+    if _JPEG_BAD_SCAN_MARKER.search(buf, pos, end - 2):
+        return "jpeg_bad_scan_data"
+    return None
+
+
+def check_png(buf, start: int, end: int) -> Optional[str]:
+    if buf[start:start + 8] != PNG_MAGIC:
+        return "png_no_signature"
+    pos = start + 8
+    with memoryview(buf) as view:
+        while pos + 12 <= end:
+            length = int.from_bytes(view[pos:pos + 4], "big")
+            ctype = bytes(view[pos + 4:pos + 8])
+            if not ctype.isalpha():
+                return "png_bad_chunk"
+            if pos == start + 8 and ctype != b"IHDR":
+                return "png_no_ihdr"
+            chunk_end = pos + 12 + length
+            if chunk_end > end:
+                return "png_truncated"
+            if zlib.crc32(view[pos + 4:chunk_end - 4]) != int.from_bytes(view[chunk_end - 4:chunk_end], "big"):
+                return "png_bad_crc"
+            pos = chunk_end
+            if ctype == b"IEND":
+                return None
+    return "png_truncated"
+
+
+def check_gif(buf, start: int, end: int) -> Optional[str]:
+    if buf[start:start + 6] not in (b"GIF87a", b"GIF89a"):
+        return "gif_no_signature"
+    try:
+        length_end = gif_length(buf, start, end)
+    except InvalidStructure as e:
+        return str(e)
+    except IndexError:
+        return "gif_truncated"
+    return None if length_end is not None and length_end <= end else "gif_truncated"
+
+
+VALIDATORS = {
+    "jpg": check_jpeg,
+    "png": check_png,
+    "gif": check_gif,
+}
+
+
+def validate(ext: str, buf, start: int, end: int) -> Optional[str]:
+    check = VALIDATORS.get(ext)
+    return check(buf, start, end) if check else None
+
+
+# Length resolvers find where a file really ends from its own structure, so a
+# carve reads only the bytes it needs instead of searching for a footer or
+# taking max_size. Each takes a buffer supporting slicing and find() (mmap,
+# bytes) plus the hit offset and the furthest offset the carve may reach, and
+# returns the end offset (which the caller clamps to limit), None if the length
+# can't be determined from what is available, or raises InvalidStructure when
+# the header match is a false positive. Signatures pick one by name through the
+# "length" key in file_signatures.json.
+
+PE_MAX_HEADER_OFFSET = 4096
+PE_MAX_SECTIONS = 96
+
+_MPEG_BITRATES = {
+    (3, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (3, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (3, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MPEG_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _u16(b, o: int) -> int:
+    return int.from_bytes(b[o:o + 2], "little")
+
+
+def _u32(b, o: int) -> int:
+    return int.from_bytes(b[o:o + 4], "little")
+
+
+def _is_fourcc(tag: bytes) -> bool:
+    return len(tag) == 4 and all(0x20 <= c < 0x7F for c in tag)
+
+
+def jpeg_length(buf, start: int, limit: int) -> Optional[int]:
+    # Walk the marker segments so the EOI of an embedded EXIF thumbnail isn't
+    # mistaken for the end of the image, then take the first EOI after SOS.
+    pos = start + 2
+    while True:
+        hdr = buf[pos:pos + 4]
+        if len(hdr) < 4 or pos + 4 > limit:
+            return None
+        if hdr[0] != 0xFF:
+            raise InvalidStructure("jpeg_bad_marker")
+        marker = hdr[1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            pos += 2
+            continue
+        if marker == 0xD9:
+            raise InvalidStructure("jpeg_no_scan")
+        length = int.from_bytes(hdr[2:4], "big")
+        if length < 2:
+            raise InvalidStructure("jpeg_bad_segment")
+        pos += 2 + length
+        if marker == 0xDA:
+            break
+    eoi = buf.find(b"\xff\xd9", pos, limit)
+    return eoi + 2 if eoi != -1 else None
+
+
+def png_length(buf, start: int, limit: int) -> Optional[int]:
+    pos = start + 8
+    while pos + 12 <= limit:
+        hdr = buf[pos:pos + 8]
+        if len(hdr) < 8:
+            return None
+        ctype = bytes(hdr[4:8])
+        if not ctype.isalpha():
+            raise InvalidStructure("png_bad_chunk")
+        pos += 12 + int.from_bytes(hdr[:4], "big")
+        if ctype == b"IEND":
+            return pos
+    return None
+
+
+def gif_length(buf, start: int, limit: int) -> Optional[int]:
+    if start + 13 > limit:
+        return None
+    pos = start + 13
+    flags = buf[start + 10]
+    if flags & 0x80:
+        pos += 3 * (2 << (flags & 7))
+    while pos < limit:
+        block = buf[pos]
+        if block == 0x3B:
+            return pos + 1
+        if block == 0x21:
+            pos += 2
+        elif block == 0x2C:
+            if pos + 10 > limit:
+                return None
+            flags = buf[pos + 9]
+            pos += 10
+            if flags & 0x80:
+                pos += 3 * (2 << (flags & 7))
+            pos += 1
+        else:
+            raise InvalidStructure("gif_bad_block")
+        # Data sub-blocks, terminated by a zero-length block.
+        while True:
+            if pos >= limit:
+                return None
+            size = buf[pos]
+            pos += 1 + size
+            if not size:
+                break
+    return None
+
+
+def riff_length(buf, start: int, limit: int, form: Optional[bytes] = None) -> Optional[int]:
+    # form is the RIFF form type the signature stands for (b"AVI ", b"WAVE");
+    # AVI and WAV share the RIFF header, so without it each matches the other.
+    hdr = buf[start:start + 12]
+    if len(hdr) < 12:
+        return None
+    size = _u32(hdr, 4)
+    if size < 4 or not _is_fourcc(bytes(hdr[8:12])):
+        raise InvalidStructure("riff_bad_header")
+    if form is not None and bytes(hdr[8:12]) != form:
+        raise InvalidStructure("riff_wrong_form")
+    return start + 8 + size
+
+
+def mp4_length(buf, start: int, limit: int) -> Optional[int]:
+    # Top-level boxes are laid end to end; the file ends where the chain stops.
+    pos = start
+    while pos + 8 <= limit:
+        hdr = buf[pos:pos + 16]
+        if len(hdr) < 8:
+            break
+        size = int.from_bytes(hdr[:4], "big")
+        btype = bytes(hdr[4:8])
+        if pos == start and btype != b"ftyp":
+            raise InvalidStructure("mp4_no_ftyp")
+        if not _is_fourcc(btype):
+            break
+        if size == 1:
+            if len(hdr) < 16:
+                break
+            size = int.from_bytes(hdr[8:16], "big")
+            if size < 16:
+                break
+        elif size == 0:
+            # Last box runs to the end of the container; nothing records where that is.
+            return None
+        elif size < 8:
+            break
+        pos += size
+    return pos if pos > start else None
+
+
+def mp3_length(buf, start: int, limit: int) -> Optional[int]:
+    hdr = buf[start:start + 10]
+    if len(hdr) < 10:
+        return None
+    if hdr[3] > 4 or any(b & 0x80 for b in hdr[6:10]):
+        raise InvalidStructure("id3_bad_header")
+    tag_size = (hdr[6] << 21) | (hdr[7] << 14) | (hdr[8] << 7) | hdr[9]
+    pos = start + 10 + tag_size + (10 if hdr[5] & 0x10 else 0)
+    frames = 0
+    while pos + 4 <= limit:
+        length = _mpeg_frame_length(buf[pos:pos + 4])
+        if not length:
+            break
+        pos += length
+        frames += 1
+    if not frames:
+        if pos + 4 > limit:
+            return None
+        raise InvalidStructure("mp3_no_frames")
+    if buf[pos:pos + 3] == b"TAG":
+        pos += 128
+    return pos
+
+
+def _mpeg_frame_length(h) -> int:
+    if len(h) < 4 or h[0] != 0xFF or (h[1] & 0xE0) != 0xE0:
+        return 0
+    version = (h[1] >> 3) & 3
+    layer = (h[1] >> 1) & 3
+    br_idx = h[2] >> 4
+    sr_idx = (h[2] >> 2) & 3
+    pad = (h[2] >> 1) & 1
+    if version == 1 or layer == 0 or br_idx in (0, 15) or sr_idx == 3:
+        return 0
+    bitrate = _MPEG_BITRATES[(3 if version == 3 else 2, layer)][br_idx] * 1000
+    rate = _MPEG_SAMPLE_RATES[version][sr_idx]
+    if layer == 3:
+        return (12 * bitrate // rate + pad) * 4
+    if layer == 1 and version != 3:
+        return 72 * bitrate // rate + pad
+    return 144 * bitrate // rate + pad
+
+
+def pe_length(buf, start: int, limit: int) -> Optional[int]:
+    dos = buf[start:start + 64]
+    if len(dos) < 64:
+        return None
+    e_lfanew = _u32(dos, 0x3C)
+    if e_lfanew < 64 or e_lfanew > PE_MAX_HEADER_OFFSET:
+        raise InvalidStructure("pe_bad_lfanew")
+    pe = start + e_lfanew
+    coff = buf[pe:pe + 24]
+    if len(coff) < 24:
+        return None
+    if coff[:4] != b"PE\0\0":
+        raise InvalidStructure("pe_no_signature")
+    nsections = _u16(coff, 6)
+    opt_size = _u16(coff, 20)
+    if not 0 < nsections <= PE_MAX_SECTIONS:
+        raise InvalidStructure("pe_bad_sections")
+    opt = buf[pe + 24:pe + 24 + opt_size]
+    table_start = pe + 24 + opt_size
+    table = buf[table_start:table_start + 40 * nsections]
+    if len(opt) < opt_size or len(table) < 40 * nsections:
+        return None
+
+    end = table_start + 40 * nsections
+    for i in range(nsections):
+        raw_size = _u32(table, i * 40 + 16)
+        raw_ptr = _u32(table, i * 40 + 20)
+        if raw_size:
+            end = max(end, start + raw_ptr + raw_size)
+    # An Authenticode signature is appended after the sections and is only
+    # listed in the certificate data directory (a file offset, not an RVA).
+    magic = _u16(opt, 0)
+    dirs = 96 if magic == 0x10B else 112 if magic == 0x20B else None
+    if dirs is not None and len(opt) >= dirs + 40:
+        cert_off = _u32(opt, dirs + 32)
+        cert_size = _u32(opt, dirs + 36)
+        if cert_off and cert_size:
+            end = max(end, start + cert_off + cert_size)
+    return end
+
+
+def zip_length(buf, start: int, limit: int) -> Optional[int]:
+    # Follow local headers, then the central directory, to the end record.
+    pos = start
+    while pos < limit:
+        sig = buf[pos:pos + 4]
+        if sig == b"PK\x03\x04":
+            hdr = buf[pos:pos + 30]
+            if len(hdr) < 30:
+                return None
+            if _u16(hdr, 6) & 0x08:
+                # Sizes live in a data descriptor after the data; only the end
+                # record can tell where the archive stops.
+                return _zip_eocd(buf, pos, limit)
+            pos += 30 + _u16(hdr, 26) + _u16(hdr, 28) + _u32(hdr, 18)
+        elif sig == b"PK\x01\x02":
+            hdr = buf[pos:pos + 46]
+            if len(hdr) < 46:
+                return None
+            pos += 46 + _u16(hdr, 28) + _u16(hdr, 30) + _u16(hdr, 32)
+        elif sig == b"PK\x06\x06":
+            hdr = buf[pos:pos + 12]
+            if len(hdr) < 12:
+                return None
+            pos += 12 + int.from_bytes(hdr[4:12], "little")
+        elif sig == b"PK\x06\x07":
+            pos += 20
+        elif sig == b"PK\x05\x06":
+            hdr = buf[pos:pos + 22]
+            if len(hdr) < 22:
+                return None
+            return pos + 22 + _u16(hdr, 20)
+        elif pos == start:
+            raise InvalidStructure("zip_bad_header")
+        else:
+            return _zip_eocd(buf, pos, limit)
+    return None
+
+
+def _zip_eocd(buf, pos: int, limit: int) -> Optional[int]:
+    eocd = buf.find(b"PK\x05\x06", pos, limit)
+    if eocd == -1:
+        return None
+    hdr = buf[eocd:eocd + 22]
+    return eocd + 22 + _u16(hdr, 20) if len(hdr) == 22 else None
+
+
+def sevenzip_length(buf, start: int, limit: int) -> Optional[int]:
+    hdr = buf[start:start + 32]
+    if len(hdr) < 32:
+        return None
+    if zlib.crc32(bytes(hdr[12:32])) != _u32(hdr, 8):
+        raise InvalidStructure("7z_bad_start_header")
+    return start + 32 + int.from_bytes(hdr[12:20], "little") + int.from_bytes(hdr[20:28], "little")
+
+
+LENGTH_RESOLVERS = {
+    "jpeg": jpeg_length,
+    "png": png_length,
+    "gif": gif_length,
+    "riff": riff_length,
+    "mp4": mp4_length,
+    "mp3": mp3_length,
+    "pe": pe_length,
+    "zip": zip_length,
+    "7z": sevenzip_length,
+}
+
+
+def resolve_length(name: Optional[str], buf, start: int, limit: int, form: Optional[bytes] = None) -> Optional[int]:
+    """
+    End offset of the file at start by its own structure, or None when the
+    format has no resolver or the structure runs past limit. form is the
+    signature's "form" (the RIFF form type), passed to resolvers that take one.
+    """
+    resolver = LENGTH_RESOLVERS.get(name) if name else None
+    if not resolver:
+        return None
+    try:
+        end = resolver(buf, start, limit) if form is None else resolver(buf, start, limit, form)
+    except IndexError:
+        return None
+    return min(end, limit) if end is not None else None
@@ -0,0 +1,79 @@
+import sqlite3
+import os
+import hashlib
+
+STORE_PATH = os.path.join(os.path.dirname(__file__), "content_store.db")
+HASH_CHUNK = 4 * 1024 * 1024
+
+try:
+    import xxhash
+    HASH_NAME = "xxh3_128"
+except ImportError:
+    xxhash = None
+    HASH_NAME = "blake2b"
+
+def init_store():
+    with sqlite3.connect(STORE_PATH) as conn:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(contents)")]
+        if columns and "inode" not in columns:
+            # Stores from before inode/mtime were recorded can't be verified; the
+            # store is only a cache, so it is started over.
+            conn.execute("DROP TABLE contents")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS contents (
+                digest TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS contents_path ON contents (path)")
+        conn.commit()
+
+def content_digest(data):
+    """
+    Digest of a buffer (bytes, memoryview, mmap slice view), fed to the hash in
+    HASH_CHUNK pieces. Prefixed with the algorithm so stores built with and
+    without xxhash never match each other's entries.
+    """
+    h = xxhash.xxh3_128() if xxhash else hashlib.blake2b(digest_size=32)
+    with memoryview(data) as view:
+        for pos in range(0, len(view), HASH_CHUNK):
+            with view[pos:pos + HASH_CHUNK] as piece:
+                h.update(piece)
+    return f"{HASH_NAME}:{h.hexdigest()}"
+
+def lookup(digest, size):
+    """
+    Path of an existing file with this content, or None. The file must still
+    be the one that was recorded (same inode, size and mtime); entries whose
+    file is gone or was replaced are dropped.
+    """
+    with sqlite3.connect(STORE_PATH) as conn:
+        row = conn.execute("SELECT path, inode, mtime_ns FROM contents WHERE digest = ?", (digest,)).fetchone()
+        if not row:
+            return None
+        path, inode, mtime_ns = row
+        try:
+            st = os.stat(path)
+            if st.st_size == size and st.st_ino == inode and st.st_mtime_ns == mtime_ns:
+                return path
+        except OSError:
+            pass
+        conn.execute("DELETE FROM contents WHERE digest = ?", (digest,))
+        conn.commit()
+        return None
+
+def record(digest, path, size):
+    st = os.stat(path)
+    with sqlite3.connect(STORE_PATH) as conn:
+        conn.execute("INSERT OR REPLACE INTO contents (digest, path, size, inode, mtime_ns) VALUES (?, ?, ?, ?, ?)",
+                     (digest, path, size, st.st_ino, st.st_mtime_ns))
+        conn.commit()
+
+def forget(path):
+    """Drop entries for a path that is about to be removed or rewritten."""
+    with sqlite3.connect(STORE_PATH) as conn:
+        conn.execute("DELETE FROM contents WHERE path = ?", (path,))
+        conn.commit()
@@ -1,39 +1,295 @@
 import pytsk3
 import os
 import datetime
+import time
+import hashlib
+import queue
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.core.fs_geometry import image_key, list_filesystems
+from src.core.offset_index import IntervalSet
+from src.core.scan_metrics import ScanMetrics
+from src.core.scan_progress import ScanCancelled
+
+DATA_ATTR_TYPES = (pytsk3.TSK_FS_ATTR_TYPE_DEFAULT, pytsk3.TSK_FS_ATTR_TYPE_NTFS_DATA)
+EXTRACT_WORKERS = 4
+# Candidates queued ahead of the oldest unfinished extraction.
+EXTRACT_BACKLOG = 64
+EXTRACT_CHUNK = 1024 * 1024
+LISTING_CACHE_SIZE = 8
+# Entries the partition walkers may run ahead of the extraction pool.
+WALK_BACKLOG = 256
+_WALK_DONE = object()
+
+# Deleted-entry listings per image, keyed by _listing_key(). A listing is only
+# stored once a walk has completed, and not at all for a device whose writes
+# can't be tracked (see fs_geometry.image_key).
+_listings = OrderedDict()
+_listings_lock = threading.Lock()
 
 class DeletedScanner:
-    def __init__(self, image_path, output_dir):
+    def __init__(self, image_path, output_dir, partitions=None):
+        """
+        Opens every filesystem on the image (see fs_geometry.list_filesystems),
+        or only those whose partition id is in partitions. Raises ValueError
+        when none can be opened.
+        """
         self.image_path = image_path
         self.output_dir = output_dir
 
+        volumes = list_filesystems(image_path)
+        if partitions is not None:
+            wanted = {str(p) for p in partitions}
+            volumes = [v for v in volumes if v["id"] in wanted]
+            if not volumes:
+                raise ValueError(f"No filesystem with partition id {', '.join(sorted(wanted))} on {image_path}")
+        if not volumes:
+            raise ValueError(f"No filesystem found on {image_path}")
+        self.volumes = {v["id"]: v for v in volumes}
+
         img = pytsk3.Img_Info(image_path)
+        self.fs = {v["id"]: pytsk3.FS_Info(img, offset=v["offset"]) for v in volumes}
+        # Block ranges (per partition) already claimed by a recovered file; another
+        # directory entry pointing at the same data is skipped instead of being
+        # extracted again.
+        self.claimed_blocks = {v["id"]: IntervalSet() for v in volumes}
+        self._claim_lock = threading.Lock()
+        self._local = threading.local()
+        self._hashes = {}
+        self.hash_algo = None
+        self.dedupe_blocks = True
+        self.progress = None
+        self.metrics = ScanMetrics()
 
-        # Detect partition offset
-        try:
-            volume = pytsk3.Volume_Info(img)
-            offset = None
-            for part in volume:
-                desc = part.desc.decode("utf-8", errors="ignore").lower()
-                if "ntfs" in desc or "fat" in desc or "linux" in desc:
-                    offset = part.start * 512
-                    print(f"[debug] Using partition offset: {offset}")
-                    break
-            if offset is None:
-                raise Exception("No valid partition found")
-        except Exception as e:
-            print(f"[warn] Partition scan failed or not needed: {e}")
-            offset = 0  # fallback for flat image or logical volume
+    def scan_deleted_files(self, extensions=None, start_date=None, end_date=None, min_size=512, name_filter=None,
+                           progress=None, workers=EXTRACT_WORKERS, max_size=None, hash_algo=None):
+        """
+        Walk the directory tree of every partition for deleted entries and
+        extract them on a thread pool. The walks only read metadata and hand
+        each candidate to a worker with its own FS_Info, so directory reads and
+        file reads overlap. Results keep walk order within a partition and
+        carry its id in "partition".
+
+        Files are copied EXTRACT_CHUNK bytes at a time; entries larger than
+        max_size are skipped. With hash_algo (any hashlib name) each file is
+        hashed while it is copied, and a file whose content was already
+        recovered under another name is removed again.
+        """
+        start_dt = self._parse_date(start_date)
+        end_dt = self._parse_date(end_date)
+        self._use_progress(progress)
+        self.hash_algo = hash_algo
+        # Dedupe is per scan; what an earlier scan or extraction saw doesn't count.
+        self.claimed_blocks = {part: IntervalSet() for part in self.claimed_blocks}
+        self._hashes = {}
+        if hash_algo:
+            # Fail before the walk on an unknown algorithm name.
+            hashlib.new(hash_algo)
+        if progress:
+            progress.start()
 
-        self.fs = pytsk3.FS_Info(img, offset=offset)
+        candidates = (c for c in self._iter_all()
+                      if self._passes(c, extensions, start_dt, end_dt, min_size, max_size, name_filter))
+        return self._extract_all(candidates, workers)
 
-    def scan_deleted_files(self, extensions=None, start_date=None, end_date=None, min_size=512, name_filter=None):
+    def list_deleted_files(self, extensions=None, start_date=None, end_date=None, min_size=512, name_filter=None,
+                           progress=None, max_size=None):
+        """
+        Metadata-only listing of deleted entries; nothing is read or written.
+        The walk is cached per image, so filtering again or extracting a
+        selection later doesn't walk the tree a second time.
+        """
         start_dt = self._parse_date(start_date)
         end_dt = self._parse_date(end_date)
+        self._use_progress(progress)
+        if progress:
+            progress.start()
+        listed = []
+        for cand in self._iter_all():
+            if not self._passes(cand, extensions, start_dt, end_dt, min_size, max_size, name_filter):
+                continue
+            listed.append(self._listing_record(cand))
+            if progress:
+                progress.add_hit()
+        print(self.metrics.summary())
+        return listed
+
+    def extract_files(self, inodes, progress=None, workers=EXTRACT_WORKERS, hash_algo=None):
+        """
+        Extract the listed entries with the given ids: "partition:inode" as in
+        a listing's "id", or a bare inode number for that inode on every
+        partition. The user picked these explicitly, so entries sharing data
+        blocks or content are each written. The scanner's own hash and dedupe
+        settings are restored afterwards, so later scans on it behave as before.
+        """
+        wanted = set()
+        for item in inodes:
+            part, _, inode = str(item).rpartition(":")
+            wanted.add((part or None, int(inode)))
+        self._use_progress(progress)
+        saved = self.hash_algo, self.dedupe_blocks
+        self.hash_algo = hash_algo
+        self.dedupe_blocks = False
+        try:
+            if progress:
+                progress.start()
+            candidates = [c for c in self._iter_all()
+                          if (c["partition"], c["inode"]) in wanted or (None, c["inode"]) in wanted]
+            return self._extract_all(candidates, workers)
+        finally:
+            self.hash_algo, self.dedupe_blocks = saved
+
+    def _extract_all(self, candidates, workers):
         results = []
-        self._scan_dir(self.fs.open_dir(path="/"), extensions, results, start_dt, end_dt, min_size, name_filter)
+        pending = deque()
+        pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="deleted-extract")
+        try:
+            for cand in candidates:
+                pending.append(pool.submit(self._extract, cand))
+                while pending and (pending[0].done() or len(pending) > EXTRACT_BACKLOG):
+                    self._collect(pending.popleft(), results)
+            while pending:
+                self._collect(pending.popleft(), results)
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+        pool.shutdown(wait=True)
+        print(self.metrics.summary())
         return results
 
+    def _use_progress(self, progress):
+        # Stage timings go to the caller's progress when there is one, so they
+        # show up with the job; otherwise a fresh set per call.
+        self.progress = progress
+        self.metrics = progress.metrics if progress else ScanMetrics()
+
+    def _iter_all(self):
+        """
+        Deleted entries of every partition. Several partitions are walked
+        concurrently, each on its own thread and FS_Info, and their entries are
+        yielded as they are found; a single one is walked inline.
+        """
+        volumes = list(self.volumes)
+        if len(volumes) == 1:
+            yield from self._iter_deleted(volumes[0])
+            return
+        found = queue.Queue(maxsize=WALK_BACKLOG)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    found.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def walk(part):
+            try:
+                for cand in self._iter_deleted(part):
+                    if not put(cand):
+                        return
+            except ScanCancelled as e:
+                put(e)
+            except Exception as e:
+                print(f"[warn] Walking partition {part} failed: {e}")
+            put(_WALK_DONE)
+
+        walkers = [threading.Thread(target=walk, args=(part,), name=f"deleted-walk-{part}", daemon=True)
+                   for part in volumes]
+        for t in walkers:
+            t.start()
+        try:
+            running = len(walkers)
+            while running:
+                item = found.get()
+                if item is _WALK_DONE:
+                    running -= 1
+                elif isinstance(item, ScanCancelled):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+            for t in walkers:
+                t.join()
+
+    def _iter_deleted(self, part):
+        key = _listing_key(self.image_path, self.volumes[part]["offset"])
+        with _listings_lock:
+            cached = _listings.get(key) if key else None
+            if cached is not None:
+                _listings.move_to_end(key)
+        if cached is not None:
+            yield from cached["entries"]
+            return
+        entries = []
+        walk = self._walk(self.fs[part].open_dir(path="/"), set(), part)
+        while True:
+            started = time.perf_counter()
+            cand = next(walk, None)
+            self.metrics.add_time("walk", time.perf_counter() - started)
+            if cand is None:
+                break
+            entries.append(cand)
+            yield cand
+        if key is None:
+            return
+        with _listings_lock:
+            _listings[key] = {"image_path": self.image_path, "entries": entries,
+                              "by_name": {_out_name(c): c for c in entries}}
+            while len(_listings) > LISTING_CACHE_SIZE:
+                _listings.popitem(last=False)
+
+    def _passes(self, cand, extensions, start_dt, end_dt, min_size, max_size, name_filter):
+        name = cand["name"]
+        if extensions and cand["ext"] not in extensions:
+            return False
+        if name_filter and name_filter.lower() not in name.lower():
+            return False
+        if cand["size"] < min_size:
+            return False
+        if max_size and cand["size"] > max_size:
+            # Counted rather than logged; the total shows in the metrics summary.
+            self.metrics.count("rejects", "size_cap")
+            return False
+
+        mtime = cand["mtime"]
+        if mtime:
+            mtime_dt = datetime.datetime.fromtimestamp(mtime)
+            if start_dt and mtime_dt < start_dt:
+                return False
+            if end_dt and mtime_dt > end_dt:
+                return False
+        elif start_dt or end_dt:
+            return False
+        return True
+
+    def _listing_record(self, cand):
+        out_path = os.path.join(self.output_dir, _out_name(cand))
+        return {
+            "filename": _out_name(cand),
+            "id": f"{cand['partition']}:{cand['inode']}",
+            "partition": cand["partition"],
+            "inode": cand["inode"],
+            "type": cand["ext"],
+            "size": cand["size"],
+            "mtime": datetime.datetime.fromtimestamp(cand["mtime"]).isoformat() if cand["mtime"] else None,
+            "dir": cand["dir"],
+            "extracted": os.path.exists(out_path)
+        }
+
+    def _collect(self, future, results):
+        result = future.result()
+        if result:
+            results.append(result)
+            if self.progress:
+                self.progress.advance(result["size"])
+                self.progress.add_hit()
+
     def _parse_date(self, date_str):
         if not date_str:
             return None
@@ -42,60 +298,177 @@ class DeletedScanner:
         except Exception:
             return None
 
-    def _scan_dir(self, directory, extensions, results, start_dt, end_dt, min_size, name_filter, path="/"):
+    def _data_runs(self, file_obj):
+        runs = []
+        for attr in file_obj:
+            if attr.info.type not in DATA_ATTR_TYPES:
+                continue
+            for run in attr:
+                if run.len > 0 and not (run.flags & pytsk3.TSK_FS_ATTR_RUN_FLAG_SPARSE):
+                    runs.append((run.addr, run.addr + run.len))
+        return runs
+
+    def _worker_fs(self, part):
+        # FS_Info handles aren't safe to share between threads; each worker opens its own per partition.
+        handles = getattr(self._local, "fs", None)
+        if handles is None:
+            handles = self._local.fs = {}
+        fs = handles.get(part)
+        if fs is None:
+            fs = handles[part] = pytsk3.FS_Info(pytsk3.Img_Info(self.image_path), offset=self.volumes[part]["offset"])
+        return fs
+
+    def _extract(self, cand):
+        if self.progress and self.progress.cancelled:
+            return None
+        try:
+            return self._recover_entry(cand)
+        except ScanCancelled:
+            return None
+        except Exception as e:
+            print(f"[error] Failed to recover {cand['name']}: {e}")
+            self.metrics.count("rejects", "error")
+            return None
+
+    def _recover_entry(self, cand):
+        inode, name, size = cand["inode"], cand["name"], cand["size"]
+        file_obj = self._worker_fs(cand["partition"]).open_meta(inode=inode)
+        claimed = self.claimed_blocks[cand["partition"]]
+        # Block ranges this entry claimed that nobody had before; released again
+        # if it can't be recovered.
+        fresh = []
+        if self.dedupe_blocks:
+            runs = self._data_runs(file_obj)
+            with self._claim_lock:
+                if runs and all(claimed.covers(start, end) for start, end in runs):
+                    print(f"[debug] Skipping {name}: data already recovered")
+                    self.metrics.count("rejects", "blocks_claimed")
+                    return None
+                # Claimed before reading so a concurrent worker holding another entry
+                # for the same data skips it.
+                for start, end in runs:
+                    fresh.extend(claimed.gaps(start, end))
+                    claimed.add(start, end)
+
+        out_name = _out_name(cand)
+        out_path = os.path.join(self.output_dir, out_name)
+
+        digest = hashlib.new(self.hash_algo) if self.hash_algo else None
+        written = 0
+        clock = time.perf_counter
+        timings = {"read": 0.0, "write": 0.0, "hash": 0.0}
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(out_path, "wb") as f:
+                while written < size:
+                    if self.progress:
+                        self.progress.check()
+                    started = clock()
+                    data = file_obj.read_random(written, min(EXTRACT_CHUNK, size - written))
+                    timings["read"] += clock() - started
+                    if not data:
+                        break
+                    started = clock()
+                    f.write(data)
+                    timings["write"] += clock() - started
+                    if digest:
+                        started = clock()
+                        digest.update(data)
+                        timings["hash"] += clock() - started
+                    written += len(data)
+        except BaseException:
+            # Nothing was recovered: drop the partial file and give the blocks back,
+            # so other entries sharing them aren't skipped as already recovered.
+            if fresh:
+                with self._claim_lock:
+                    for start, end in fresh:
+                        claimed.remove(start, end)
+            try:
+                os.remove(out_path)
+            except OSError:
+                pass
+            raise
+        finally:
+            for stage, seconds in timings.items():
+                if seconds:
+                    self.metrics.add_time(stage, seconds)
+            self.metrics.add_bytes(written)
+
+        result = {
+            "filename": out_name,
+            "partition": cand["partition"],
+            "type": cand["ext"],
+            "size": written,
+            "mtime": datetime.datetime.fromtimestamp(cand["mtime"]).isoformat() if cand["mtime"] else None,
+            "path": out_path
+        }
+        if digest:
+            result["hash"] = digest.hexdigest()
+        if digest and self.dedupe_blocks:
+            with self._claim_lock:
+                first = self._hashes.setdefault(result["hash"], out_path)
+            if first != out_path:
+                print(f"[debug] Skipping {name}: same content as {os.path.basename(first)}")
+                os.remove(out_path)
+                self.metrics.count("rejects", "duplicate_content")
+                return None
+        self.metrics.count("files", cand["ext"] or "none")
+        return result
+
+    def _walk(self, directory, visited, part, path="/"):
+        """Yield a candidate record (partition, inode, name, ext, size, mtime, dir) for each deleted file."""
         for entry in directory:
+            if self.progress:
+                self.progress.check()
             if not entry.info.name or entry.info.name.name in [b".", b".."]:
                 continue
 
             name = entry.info.name.name.decode("utf-8", errors="ignore")
             meta = entry.info.meta
             full_path = os.path.join(path, name)
-
-            if not meta or not (meta.flags & pytsk3.TSK_FS_META_FLAG_UNALLOC):
+            if not meta:
                 continue
 
-            ext = os.path.splitext(name)[1].lower().strip(".")
-            if extensions and ext not in extensions:
-                continue
-            if name_filter and name_filter.lower() not in name.lower():
+            if meta.type == pytsk3.TSK_FS_META_TYPE_DIR:
+                # Live directories can hold deleted entries too; recurse into every
+                # directory once, whatever its allocation state.
+                if meta.addr in visited:
+                    continue
+                visited.add(meta.addr)
+                try:
+                    subdir = entry.as_directory()
+                except Exception:
+                    continue
+                try:
+                    yield from self._walk(subdir, visited, part, full_path)
+                except ScanCancelled:
+                    raise
+                except Exception as e:
+                    print(f"[warn] Failed to walk {full_path}: {e}")
                 continue
-            if meta.size < min_size:
+
+            if not (meta.flags & pytsk3.TSK_FS_META_FLAG_UNALLOC):
                 continue
 
-            mtime = meta.mtime
-            if mtime:
-                mtime_dt = datetime.datetime.fromtimestamp(mtime)
-                if start_dt and mtime_dt < start_dt:
-                    continue
-                if end_dt and mtime_dt > end_dt:
-                    continue
-            else:
-                if start_dt or end_dt:
-                    continue
+            ext = os.path.splitext(name)[1].lower().strip(".")
+            yield {"partition": part, "inode": meta.addr, "name": name, "ext": ext, "size": meta.size,
+                   "mtime": meta.mtime, "dir": path}
 
-            try:
-                file_obj = self.fs.open_meta(inode=meta.addr)
-                data = file_obj.read_random(0, meta.size)
-                out_name = f"deleted_{meta.addr}_{name}"
-                out_path = os.path.join(self.output_dir, out_name)
 
-                os.makedirs(self.output_dir, exist_ok=True)
-                with open(out_path, "wb") as f:
-                    f.write(data)
+def _out_name(cand):
+    return f"deleted_p{cand['partition']}_{cand['inode']}_{cand['name']}"
 
-                results.append({
-                    "filename": out_name,
-                    "type": ext,
-                    "size": meta.size,
-                    "mtime": mtime_dt.isoformat() if mtime else None,
-                    "path": out_path
-                })
-            except Exception as e:
-                print(f"[error] Failed to recover {name}: {e}")
 
-            if meta.type == pytsk3.TSK_FS_META_TYPE_DIR:
-                try:
-                    subdir = entry.as_directory()
-                    self._scan_dir(subdir, extensions, results, start_dt, end_dt, min_size, name_filter, full_path)
-                except Exception:
-                    continue
+def _listing_key(image_path, offset):
+    key = image_key(image_path)
+    return key + (offset,) if key else None
+
+
+def find_listed(filename):
+    """(image_path, partition, inode) of a cached listing entry that extracts to filename, or None."""
+    with _listings_lock:
+        for listing in reversed(_listings.values()):
+            cand = listing["by_name"].get(filename)
+            if cand:
+                return listing["image_path"], cand["partition"], cand["inode"]
+    return None
@@ -0,0 +1,340 @@
+import os
+import re
+import stat
+import bisect
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.core.offset_index import IntervalSet
+
+try:
+    import pytsk3
+    HAS_PYTSK = True
+except ImportError:
+    HAS_PYTSK = False
+
+SECTOR_SIZE = 512
+# Partition tables inside partitions (e.g. a BSD disklabel in an MBR slice)
+# followed this many levels deep.
+MAX_VOLUME_DEPTH = 2
+PARTITION_CACHE_SIZE = 8
+# MFT entry of the NTFS cluster allocation bitmap.
+NTFS_BITMAP_INODE = 6
+BITMAP_CHUNK = 4 * 1024 * 1024
+ALLOCATION_CACHE_SIZE = 4
+# Whole bytes of an allocation bitmap: all clusters in use, or a mix.
+_BITMAP_RUN = re.compile(rb"\xff+|[\x01-\xfe]+")
+
+# Kernel I/O counters of a block device, by major:minor.
+SYSFS_BLOCK_STAT = "/sys/dev/block/{}:{}/stat"
+# Filesystem lists and allocated ranges per image, keyed by image_key(), so a
+# rewritten image is parsed again.
+_partitions = OrderedDict()
+_partitions_lock = threading.Lock()
+_allocations = OrderedDict()
+_allocations_lock = threading.Lock()
+
+
+class Alignment:
+    """
+    Grid that file starts sit on: every `size` bytes counted from `origin`
+    (the filesystem's first byte in the image). Header searches restricted to
+    it only test cluster starts.
+    """
+
+    def __init__(self, size: int, origin: int = 0):
+        if size < 1:
+            raise ValueError(f"Alignment must be a positive number of bytes, got {size}")
+        self.size = size
+        self.origin = origin % size
+
+    def __repr__(self) -> str:
+        return f"Alignment(size={self.size}, origin={self.origin})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Alignment) and (self.size, self.origin) == (other.size, other.origin)
+
+    def aligned(self, offset: int) -> bool:
+        return (offset - self.origin) % self.size == 0
+
+    def ceil(self, offset: int) -> int:
+        """First grid offset at or after offset."""
+        return offset + (self.origin - offset) % self.size
+
+
+class PartitionAlignment(Alignment):
+    """
+    One grid per partition: an offset is aligned when it sits on the cluster
+    grid of the partition containing it, so partitions with different
+    cluster sizes or starts are each searched on their own grid. Space outside
+    every partition (gaps, the area before the first one) uses the fallback
+    grid, sectors by default. size and origin are the fallback's.
+    """
+
+    def __init__(self, regions: List[Tuple[int, int, Alignment]], fallback: Optional[Alignment] = None):
+        fallback = fallback or Alignment(SECTOR_SIZE)
+        super().__init__(fallback.size, fallback.origin)
+        # Non-overlapping [start, end) ranges covering the whole device; the last
+        # one is open-ended.
+        self.regions: List[Tuple[int, Optional[int], Alignment]] = []
+        pos = 0
+        for start, end, grid in sorted(regions, key=lambda r: r[0]):
+            start = max(start, pos)
+            if end <= start:
+                continue
+            if start > pos:
+                self.regions.append((pos, start, fallback))
+            self.regions.append((start, end, grid))
+            pos = end
+        self.regions.append((pos, None, fallback))
+        self._starts = [r[0] for r in self.regions]
+
+    def __repr__(self) -> str:
+        return "PartitionAlignment(" + ", ".join(f"{start}-{end if end is not None else ''}: {grid!r}"
+                                                 for start, end, grid in self.regions) + ")"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PartitionAlignment) and self.regions == other.regions
+
+    def _region(self, offset: int) -> int:
+        return max(bisect.bisect_right(self._starts, offset) - 1, 0)
+
+    def aligned(self, offset: int) -> bool:
+        return self.regions[self._region(offset)][2].aligned(offset)
+
+    def ceil(self, offset: int) -> int:
+        i = self._region(offset)
+        while True:
+            start, end, grid = self.regions[i]
+            nxt = grid.ceil(max(offset, start))
+            if end is None or nxt < end:
+                return nxt
+            i += 1
+
+
+def image_key(device_path: str) -> Optional[Tuple]:
+    """
+    Cache key that changes when the image is written: path, size and mtime,
+    plus for a block device its write and discard counters, since writes
+    through a mounted filesystem leave the device node's size and mtime alone.
+    None when those counters can't be read; the caller shouldn't cache then.
+    """
+    st = os.stat(device_path)
+    key = (os.path.realpath(device_path), st.st_size, st.st_mtime_ns)
+    if not stat.S_ISBLK(st.st_mode):
+        return key
+    writes = _device_writes(st.st_rdev)
+    return key + writes if writes else None
+
+
+def _device_writes(rdev: int) -> Optional[Tuple[int, ...]]:
+    try:
+        with open(SYSFS_BLOCK_STAT.format(os.major(rdev), os.minor(rdev)), "r") as f:
+            fields = f.read().split()
+    except OSError:
+        return None
+    # Writes completed, sectors written, then (kernel 4.18+) discards and sectors discarded.
+    return tuple(int(v) for v in fields[4:7:2] + fields[11:14:2]) or None
+
+
+def list_filesystems(device_path: str) -> List[Dict]:
+    """
+    Every filesystem pytsk3 can open on device_path, in partition table
+    order: each allocated partition of the table TSK detects (MBR with its
+    extended partitions, GPT, ...), partition tables nested in partitions up
+    to MAX_VOLUME_DEPTH, or the whole image when it has no partition table.
+    Records are {"id", "offset", "size", "desc", "block_size"}; ids are the
+    partition's slot in its table ("2", or "2.1" when nested). The list is
+    parsed once per image and cached.
+    """
+    if not HAS_PYTSK:
+        raise ValueError("pytsk3 is required to read partitions")
+    key = image_key(device_path)
+    with _partitions_lock:
+        cached = _partitions.get(key) if key else None
+        if cached is not None:
+            _partitions.move_to_end(key)
+            return cached
+    img = pytsk3.Img_Info(device_path)
+    found = []
+    if not _walk_volumes(img, 0, "", 0, found):
+        fs = _open_fs(img, 0)
+        if fs is not None:
+            found.append({"id": "0", "offset": 0, "size": img.get_size(), "desc": "whole image",
+                          "block_size": fs.info.block_size})
+    print(f"[partitions] {device_path}: " + (", ".join(f"{p['id']} {p['desc']} @{p['offset']}" for p in found)
+                                             or "no filesystem"))
+    if key is None:
+        return found
+    with _partitions_lock:
+        _partitions[key] = found
+        while len(_partitions) > PARTITION_CACHE_SIZE:
+            _partitions.popitem(last=False)
+    return found
+
+
+def _open_fs(img, offset: int):
+    try:
+        return pytsk3.FS_Info(img, offset=offset)
+    except (IOError, OSError):
+        return None
+
+
+def _walk_volumes(img, offset: int, prefix: str, depth: int, found: List[Dict]) -> bool:
+    """Add the filesystems of the partition table at offset to found; False if there is no table there."""
+    try:
+        volume = pytsk3.Volume_Info(img, pytsk3.TSK_VS_TYPE_DETECT, offset)
+    except (IOError, OSError):
+        return False
+    sector = getattr(volume.info, "block_size", SECTOR_SIZE) or SECTOR_SIZE
+    for part in volume:
+        if not part.flags & pytsk3.TSK_VS_PART_FLAG_ALLOC:
+            continue
+        # Partition starts are relative to the table's own offset.
+        start = offset + part.start * sector
+        part_id = f"{prefix}{part.addr}"
+        desc = part.desc.decode("utf-8", errors="ignore")
+        fs = _open_fs(img, start)
+        if fs is not None:
+            found.append({"id": part_id, "offset": start, "size": part.len * sector, "desc": desc,
+                          "block_size": fs.info.block_size})
+        elif depth < MAX_VOLUME_DEPTH and part.start:
+            _walk_volumes(img, start, part_id + ".", depth + 1, found)
+    return True
+
+
+def detect_alignment(device_path: str, block_size: Optional[int] = None) -> Alignment:
+    """
+    Cluster grid of the filesystems on device_path: each one's block size as
+    reported by pytsk3 (FS_Info.info.block_size), counted from its partition
+    start. With several partitions, or space outside the only one, this is a
+    PartitionAlignment with a grid per partition and sectors elsewhere.
+    block_size overrides the detected sizes. Falls back to the sector size
+    when pytsk3 is missing or no filesystem can be opened.
+    """
+    if not HAS_PYTSK:
+        print("[warn] pytsk3 is not installed; aligning to " + (f"{block_size} bytes" if block_size else "sectors"))
+        return Alignment(block_size or SECTOR_SIZE)
+    try:
+        filesystems = list_filesystems(device_path)
+    except (IOError, OSError) as e:
+        filesystems = []
+        print(f"[warn] Can't read {device_path}: {e}")
+    if not filesystems:
+        print(f"[warn] No filesystem found on {device_path}; aligning to sectors")
+        return Alignment(block_size or SECTOR_SIZE)
+    grids = [(fs["offset"], fs["offset"] + fs["size"], Alignment(block_size or fs["block_size"], fs["offset"]))
+             for fs in filesystems]
+    if len(grids) == 1 and grids[0][0] == 0:
+        # A filesystem at offset 0 has no partition table around it: it is the whole device.
+        return grids[0][2]
+    if len({(grid.size, grid.origin) for _, _, grid in grids}) > 1:
+        print(f"[partitions] {device_path}: cluster grids differ between partitions; "
+              + ", ".join(f"{fs['id']} {grid.size}@{grid.origin}" for fs, (_, _, grid) in zip(filesystems, grids)))
+    return PartitionAlignment(grids)
+
+
+def allocated_space(device_path: str, progress=None) -> IntervalSet:
+    """
+    Byte ranges of device_path in use by its filesystems: live files,
+    directories and, on NTFS, its own metadata. Carving only the rest finds
+    deleted data without re-"recovering" live files. NTFS is read from its
+    cluster bitmap ($Bitmap); other filesystems from the data runs of every
+    allocated entry. The map is built once per image and cached.
+    Raises ValueError when pytsk3 is missing or no filesystem can be opened,
+    rather than silently carving allocated space too.
+    """
+    if not HAS_PYTSK:
+        raise ValueError("pytsk3 is required to map allocated space")
+    key = image_key(device_path)
+    with _allocations_lock:
+        cached = _allocations.get(key) if key else None
+        if cached is not None:
+            _allocations.move_to_end(key)
+            return cached
+    filesystems = list_filesystems(device_path)
+    if not filesystems:
+        raise ValueError(f"No filesystem found on {device_path}")
+
+    img = pytsk3.Img_Info(device_path)
+    allocated = IntervalSet()
+    for part in filesystems:
+        fs = pytsk3.FS_Info(img, offset=part["offset"])
+        block_size = fs.info.block_size
+        if fs.info.ftype == pytsk3.TSK_FS_TYPE_NTFS:
+            runs = _ntfs_bitmap_runs(fs, progress)
+        else:
+            runs = _allocated_runs(fs, progress)
+        for start, end in runs:
+            allocated.add(part["offset"] + start * block_size, part["offset"] + end * block_size)
+    print(f"[alloc] {device_path}: {allocated.total()} bytes allocated in {len(allocated)} ranges")
+    if key is None:
+        return allocated
+    with _allocations_lock:
+        _allocations[key] = allocated
+        while len(_allocations) > ALLOCATION_CACHE_SIZE:
+            _allocations.popitem(last=False)
+    return allocated
+
+
+def _ntfs_bitmap_runs(fs, progress=None) -> Iterator[Tuple[int, int]]:
+    bitmap = fs.open_meta(inode=NTFS_BITMAP_INODE)
+    size = bitmap.info.meta.size
+    for pos in range(0, size, BITMAP_CHUNK):
+        if progress:
+            progress.check()
+        yield from _bitmap_runs(bitmap.read_random(pos, min(BITMAP_CHUNK, size - pos)), pos * 8)
+
+
+def _bitmap_runs(bitmap: bytes, first_block: int) -> Iterator[Tuple[int, int]]:
+    """Allocated [start, end) block runs of an allocation bitmap (bit set = in use, LSB first)."""
+    run = run_end = None
+    for m in _BITMAP_RUN.finditer(bitmap):
+        base = first_block + m.start() * 8
+        if run is not None and base != run_end:
+            yield run, run_end
+            run = None
+        if m.group()[0] == 0xFF:
+            if run is None:
+                run = base
+            run_end = first_block + m.end() * 8
+            continue
+        for i, value in enumerate(m.group()):
+            for bit in range(8):
+                block = base + i * 8 + bit
+                if value >> bit & 1:
+                    if run is None:
+                        run = block
+                    run_end = block + 1
+                elif run is not None:
+                    yield run, run_end
+                    run = None
+    if run is not None:
+        yield run, run_end
+
+
+def _allocated_runs(fs, progress=None) -> Iterator[Tuple[int, int]]:
+    """Block runs of every allocated file and directory reachable from the root."""
+    visited = set()
+    pending = [fs.open_dir(path="/")]
+    while pending:
+        for entry in pending.pop():
+            if progress:
+                progress.check()
+            meta = entry.info.meta
+            if not meta or not entry.info.name or entry.info.name.name in (b".", b".."):
+                continue
+            if not (meta.flags & pytsk3.TSK_FS_META_FLAG_ALLOC) or meta.addr in visited:
+                continue
+            visited.add(meta.addr)
+            try:
+                for attr in entry:
+                    for run in attr:
+                        if run.len > 0 and not (run.flags & pytsk3.TSK_FS_ATTR_RUN_FLAG_SPARSE):
+                            yield run.addr, run.addr + run.len
+                if meta.type == pytsk3.TSK_FS_META_TYPE_DIR:
+                    pending.append(entry.as_directory())
+            except (IOError, OSError) as e:
+                name = entry.info.name.name.decode("utf-8", errors="ignore")
+                print(f"[warn] Can't map {name}: {e}")
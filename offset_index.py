@@ -0,0 +1,111 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterator, Tuple
+
+
+class OffsetIndex:
+    """
+    Sorted array of offsets with O(log n) proximity checks.
+    Offsets usually arrive in increasing order, so add() is an append in the common case.
+    """
+
+    def __init__(self):
+        self._offsets = array("q")
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._offsets)
+
+    def near(self, offset: int, gap: int) -> bool:
+        """True if some recorded offset s satisfies abs(offset - s) < gap."""
+        i = bisect_left(self._offsets, offset - gap + 1)
+        return i < len(self._offsets) and self._offsets[i] < offset + gap
+
+    def add(self, offset: int) -> None:
+        if not self._offsets or offset >= self._offsets[-1]:
+            self._offsets.append(offset)
+        else:
+            self._offsets.insert(bisect_right(self._offsets, offset), offset)
+
+
+class IntervalSet:
+    """
+    Disjoint half-open [start, end) ranges kept in two parallel sorted arrays.
+    Overlapping or touching ranges are merged on insert.
+    """
+
+    def __init__(self):
+        self._starts = array("q")
+        self._ends = array("q")
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self._starts, self._ends)
+
+    def total(self) -> int:
+        return sum(self._ends) - sum(self._starts)
+
+    def add(self, start: int, end: int) -> None:
+        if end <= start:
+            return
+        # First range that could touch [start, end) and the first one wholly past it.
+        lo = bisect_left(self._ends, start)
+        hi = bisect_right(self._starts, end)
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+            del self._starts[lo:hi]
+            del self._ends[lo:hi]
+        self._starts.insert(lo, start)
+        self._ends.insert(lo, end)
+
+    def remove(self, start: int, end: int) -> None:
+        """Drop [start, end) from the recorded ranges, splitting a range that spans it."""
+        if end <= start:
+            return
+        # First range ending after start and the first one starting at or past end.
+        lo = bisect_right(self._ends, start)
+        hi = bisect_left(self._starts, end)
+        if lo >= hi:
+            return
+        first_start, last_end = self._starts[lo], self._ends[hi - 1]
+        del self._starts[lo:hi]
+        del self._ends[lo:hi]
+        if last_end > end:
+            self._starts.insert(lo, end)
+            self._ends.insert(lo, last_end)
+        if first_start < start:
+            self._starts.insert(lo, first_start)
+            self._ends.insert(lo, start)
+
+    def contains(self, offset: int) -> bool:
+        i = bisect_right(self._starts, offset) - 1
+        return i >= 0 and offset < self._ends[i]
+
+    def covers(self, start: int, end: int) -> bool:
+        """True if [start, end) lies entirely inside one recorded range."""
+        i = bisect_right(self._starts, start) - 1
+        return i >= 0 and end <= self._ends[i]
+
+    def overlaps(self, start: int, end: int) -> bool:
+        i = bisect_left(self._ends, start + 1)
+        return i < len(self._starts) and self._starts[i] < end
+
+    def gaps(self, start: int, end: int) -> Iterator[Tuple[int, int]]:
+        """Yield the sub-ranges of [start, end) not covered by any recorded range."""
+        pos = start
+        i = bisect_left(self._ends, start + 1)
+        while pos < end and i < len(self._starts):
+            s, e = self._starts[i], self._ends[i]
+            if s >= end:
+                break
+            if s > pos:
+                yield pos, s
+            pos = max(pos, e)
+            i += 1
+        if pos < end:
+            yield pos, end
@@ -0,0 +1,106 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+WRITER_THREADS = 4
+WRITER_BACKLOG = 64
+
+
+class OutputWriter:
+    """
+    Background stage for output files. submit() hands a write to one of the
+    writer threads and blocks while `backlog` writes are already queued, so a
+    scan runs at source speed until the destination falls that far behind.
+    With threads=0 every write runs inline on the caller's thread.
+    close() waits for the queue and, with fsync, syncs all tracked files in one
+    batch at the end instead of after each file.
+    """
+
+    def __init__(self, threads: int = WRITER_THREADS, backlog: int = WRITER_BACKLOG, fsync: bool = False):
+        self.fsync = fsync
+        self._queue: queue.Queue = queue.Queue(maxsize=max(backlog, 1))
+        self._paths: List[str] = []
+        self._threads = [threading.Thread(target=self._run, name=f"output-writer-{i}", daemon=True)
+                         for i in range(threads)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        fut: Future = Future()
+        if self._threads:
+            self._queue.put((fut, fn, args))
+        else:
+            _call(fut, fn, args)
+        return fut
+
+    def track(self, path: str) -> None:
+        """Remember a written file for the batched fsync in close()."""
+        if self.fsync:
+            self._paths.append(path)
+
+    def close(self, cancel: bool = False) -> None:
+        """
+        Wait for the writer threads to finish. With cancel, writes still queued
+        are dropped (their futures are cancelled) and nothing is synced.
+        """
+        if cancel:
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        if self.fsync and not cancel:
+            sync_files(self._paths)
+        self._paths = []
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            _call(*item)
+
+
+def _call(fut: Future, fn: Callable[..., Any], args: tuple) -> None:
+    if not fut.set_running_or_notify_cancel():
+        return
+    try:
+        fut.set_result(fn(*args))
+    except BaseException as e:
+        fut.set_exception(e)
+
+
+def sync_files(paths: List[str]) -> None:
+    """fsync each file, then each directory holding one, so new entries are durable too."""
+    dirs = set()
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"[warn] fsync failed for {path}: {e}")
+        dirs.add(os.path.dirname(path))
+    for d in dirs:
+        try:
+            fd = os.open(d, os.O_RDONLY)
+        except OSError:
+            # Directories can't be opened (or synced) this way on Windows.
+            continue
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
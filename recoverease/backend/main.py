@@ -52,7 +52,7 @@ def run_recovery(file_types=None, usb_only=False, preview=False, output_dir=None
         print(f" - {m['type'].upper()} file from {m['start']} to {m['end']} ({m['size']} bytes)")
 
     fragments = extract_fragments(raw_data, matches)
-    stitched = stitch_fragments(fragments)
+    stitched = stitch_fragments(fragments, raw_data)
     print(f"🧵 Stitched {len(stitched)} fragments from {len(fragments)} raw pieces")
 
     if preview:
@@ -84,7 +84,7 @@ def run_folder_recovery(folder_path, file_types=None, preview=False, output_dir=
                 matches = detect_file_signatures(data, file_types)
                 if matches:
                     print(f"🧩 {fname}: Found {len(matches)} fragment(s)")
-                    extracted = extract_fragments(data, matches)
+                    extracted = stitch_fragments(extract_fragments(data, matches), data)
                     fragments.extend(extracted)
                     if preview:
                         for i, frag in enumerate(extracted):
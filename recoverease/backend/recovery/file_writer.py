@@ -1,12 +1,93 @@
 import os
+import queue
+import threading
 
-def save_fragments(fragments, output_dir, dryrun=False):
+WRITER_THREADS = 4
+WRITER_BACKLOG = 32
+
+class AsyncWriter:
+    """
+    Writes files on background threads so scanning isn't held up by the
+    output disk. write() queues a file and blocks once `backlog` files are
+    waiting (backpressure). close() waits for the queue, fsyncs every written
+    file in one batch if asked, and returns how many files were written.
+    """
+
+    def __init__(self, threads=WRITER_THREADS, backlog=WRITER_BACKLOG, fsync=False, verbose=False):
+        self.fsync = fsync
+        self.verbose = verbose
+        self.written = []
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max(backlog, 1))
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(max(threads, 1))]
+        for t in self._threads:
+            t.start()
+
+    def write(self, path, data):
+        self._queue.put((path, data))
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        if self.fsync:
+            for path in self.written:
+                try:
+                    fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                except OSError as e:
+                    if self.verbose:
+                        print(f"⚠️ Could not fsync {path}: {e}")
+        return len(self.written)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, data = item
+            try:
+                with open(path, "wb") as f:
+                    f.write(data)
+                with self._lock:
+                    self.written.append(path)
+                if self.verbose:
+                    print(f"💾 Saved {path} ({len(data)} bytes)")
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                if self.verbose:
+                    print(f"⚠️ Could not save {path}: {e}")
+
+def save_fragments(fragments, output_dir, dryrun=False, writer=None):
+    """
+    Save (ext, data) fragments. Writes go through an AsyncWriter; pass one to
+    share it across calls, otherwise a writer is made and closed here.
+    """
     os.makedirs(output_dir, exist_ok=True)
-    for i, (ext, data) in enumerate(fragments):
-        if dryrun:
-            continue
-        with open(os.path.join(output_dir, f"{ext}_fragment_{i+1}.{ext}"), "wb") as f:
-            f.write(data)
+    if dryrun:
+        return
+    own = writer is None
+    if own:
+        writer = AsyncWriter()
+    try:
+        for i, (ext, data) in enumerate(fragments):
+            writer.write(os.path.join(output_dir, f"{ext}_fragment_{i+1}.{ext}"), data)
+    finally:
+        if own:
+            writer.close()
 
 def save_raw_fallback(data, output_dir):
     os.makedirs(output_dir, exist_ok=True)
@@ -1,5 +1,6 @@
 from recoverease.backend.scanner.scanner_config import ENTROPY_THRESHOLD
-from recoverease.backend.recovery.file_writer import entropy, is_valid_jpeg, is_valid_pdf
+from recoverease.backend.utils.entropy import entropy
+from recoverease.backend.recovery.reassembly import Reassembler, CLUSTER_SIZE, is_valid_jpeg, is_valid_pdf
 
 def extract_fragments(raw_data: bytes, matches: list) -> list:
     fragments = []
@@ -21,6 +22,7 @@ def extract_fragments(raw_data: bytes, matches: list) -> list:
 
         fragments.append({
             "type": frag_type,
+            "start": start,
             "data": frag_data,
             "size": size,
             "entropy": ent,
@@ -28,7 +30,16 @@ def extract_fragments(raw_data: bytes, matches: list) -> list:
         })
     return fragments
 
-def stitch_fragments(fragments: list) -> list:
-    return fragments  # placeholder for future stitching logic
+def stitch_fragments(fragments: list, source=None, cluster_size: int = CLUSTER_SIZE) -> list:
+    """
+    Reassembles fragmented files from the image they were carved from.
+    source is that image (bytes, mmap or a binary file); fragments need their
+    "start" offset in it. Reassembled fragments get the joined data, their
+    image "runs" and stitched=True when more than one run was needed; the rest
+    are returned as they are. Without a source nothing can be stitched.
+    """
+    if source is None:
+        return fragments
+    return Reassembler(source, cluster_size).stitch(fragments)
 
 
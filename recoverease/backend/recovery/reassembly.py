@@ -0,0 +1,569 @@
+import re
+import copy
+import mmap
+import zlib
+import bisect
+from collections import OrderedDict
+
+from recoverease.backend.scanner.signature_matcher import FOOTER_SIGS, FIXED_SIGS
+from recoverease.backend.utils.entropy import entropy, is_constant_fill
+
+CLUSTER_SIZE = 4096
+MAX_FILE_SIZE = 32 * 1024 * 1024    # largest file that will be reassembled
+MAX_GAP_CLUSTERS = 2048             # how far past a break a continuation is looked for
+MAX_FRAGMENTS = 4                   # fragments per file
+MAX_CANDIDATES = 64                 # joins tested per break
+CLASS_CACHE_CLUSTERS = 65536        # cluster classes kept (a few MB at most)
+SEARCH_BLOCK = 1024 * 1024          # read size when searching for a footer
+HIGH_ENTROPY = 7.0                  # bits/byte above which a cluster is compressed or encrypted
+TEXT_RATIO = 0.9                    # printable share above which a cluster is text
+
+# Cluster classes
+ZERO, TEXT, BINARY, HIGH, HEADER = range(5)
+HEADERS = tuple(FOOTER_SIGS) + tuple(FIXED_SIGS)
+_PRINTABLE = bytes(range(32, 127)) + b"\t\r\n"
+
+_OBJ = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj\b")
+_STARTXREF = re.compile(rb"startxref\s+(\d+)\s+%%EOF(\r\n|\r|\n)?")
+_PDF_HEADER = re.compile(rb"%PDF-\d\.\d")
+_ANY_OBJ = re.compile(rb"\d+\s+\d+\s+obj\b")
+
+
+def classify(data):
+    """Class of one cluster: ZERO, HEADER (starts another file), HIGH, TEXT or BINARY."""
+    if is_constant_fill(data):
+        return ZERO
+    if data.startswith(HEADERS):
+        return HEADER
+    if entropy(data) >= HIGH_ENTROPY:
+        return HIGH
+    if len(data.translate(None, _PRINTABLE)) <= len(data) * (1 - TEXT_RATIO):
+        return TEXT
+    return BINARY
+
+
+class ClusterSource:
+    """
+    Cluster-granular reads over an image held in memory (bytes, bytearray,
+    mmap) or a seekable binary file. Cluster i covers
+    [base + i * cluster_size, base + (i + 1) * cluster_size). Cluster classes
+    are cached in a bounded LRU, so memory stays fixed however large the image.
+    """
+
+    def __init__(self, source, cluster_size=CLUSTER_SIZE, base=0):
+        self.cluster_size = cluster_size
+        self.base = base
+        if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            self._buf, self._file = source, None
+            self.size = len(source)
+        else:
+            self._buf, self._file = None, source
+            self.size = source.seek(0, 2)
+        self.count = max(-(-(self.size - base) // cluster_size), 0)
+        self._classes = OrderedDict()
+
+    def read(self, start, end):
+        start, end = max(start, 0), min(end, self.size)
+        if end <= start:
+            return b""
+        if self._buf is not None:
+            return bytes(self._buf[start:end])
+        self._file.seek(start)
+        return self._file.read(end - start)
+
+    def index(self, offset):
+        return (offset - self.base) // self.cluster_size
+
+    def start(self, i):
+        return self.base + i * self.cluster_size
+
+    def cluster(self, i):
+        return self.read(self.start(i), self.start(i + 1))
+
+    def classify(self, i):
+        cls = self._classes.get(i)
+        if cls is None:
+            cls = classify(self.cluster(i))
+            self._classes[i] = cls
+            if len(self._classes) > CLASS_CACHE_CLUSTERS:
+                self._classes.popitem(last=False)
+        else:
+            self._classes.move_to_end(i)
+        return cls
+
+    def find(self, pattern, start, limit):
+        """First offset of pattern in [start, limit), searched SEARCH_BLOCK bytes at a time."""
+        pos = start
+        while pos < limit:
+            block = self.read(pos, min(pos + SEARCH_BLOCK + len(pattern) - 1, limit))
+            idx = block.find(pattern)
+            if idx != -1:
+                return pos + idx
+            pos += SEARCH_BLOCK
+        return -1
+
+
+class _Claims:
+    """Sorted, merged byte ranges already assigned to a reassembled file."""
+
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+
+    def add(self, start, end):
+        i = bisect.bisect_left(self._ends, start)
+        j = bisect.bisect_right(self._starts, end)
+        if i < j:
+            start = min(start, self._starts[i])
+            end = max(end, self._ends[j - 1])
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+
+    def overlaps(self, start, end):
+        i = bisect.bisect_right(self._ends, start)
+        return i < len(self._starts) and self._starts[i] < end
+
+
+class JpegChecker:
+    """
+    Incremental JPEG structure check. Segments are walked by their lengths;
+    in entropy-coded data every 0xFF must be stuffed (FF 00), a fill byte, a
+    restart marker in sequence (RST0..RST7), EOI or a table/scan segment of a
+    progressive image. Anything else means the bytes fed don't continue this
+    file. Copies are cheap, so a candidate join is tested on a copy.
+    """
+
+    OK, DONE, BAD = range(3)
+    _MARKER, _LENGTH, _SKIP, _SCAN = range(4)
+    # Segments that may follow entropy-coded data (tables and scans of a
+    # progressive image); their lengths are checked, since random bytes
+    # taken for one would otherwise skip unchecked data.
+    _SCAN_SEGMENTS = (0xC4, 0xDA, 0xDB, 0xDD)
+
+    def __init__(self):
+        self.mode = self._MARKER
+        self.ff = False
+        self.marker = None
+        self.need = 0
+        self.length = b""
+        self.rst = None
+
+    def copy(self):
+        return copy.copy(self)
+
+    @property
+    def in_scan(self):
+        return self.mode == self._SCAN
+
+    def feed(self, data):
+        """(status, n): DONE with n bytes up to and including EOI, BAD at byte n, or OK."""
+        i, n = 0, len(data)
+        while i < n:
+            mode = self.mode
+            if mode == self._SCAN:
+                if not self.ff:
+                    j = data.find(b"\xff", i)
+                    if j == -1:
+                        return self.OK, n
+                    i, self.ff = j + 1, True
+                    continue
+                b = data[i]
+                i += 1
+                if b == 0xFF:
+                    continue
+                self.ff = False
+                if b == 0x00:
+                    continue
+                if 0xD0 <= b <= 0xD7:
+                    if self.rst is not None and b - 0xD0 != self.rst:
+                        return self.BAD, i - 2
+                    self.rst = (b - 0xD0 + 1) % 8
+                elif b == 0xD9:
+                    return self.DONE, i
+                elif b in self._SCAN_SEGMENTS:
+                    self.mode, self.marker, self.length = self._LENGTH, b, b""
+                else:
+                    return self.BAD, i - 2
+            elif mode == self._MARKER:
+                b = data[i]
+                i += 1
+                if not self.ff:
+                    if b != 0xFF:
+                        return self.BAD, i - 1
+                    self.ff = True
+                    continue
+                if b == 0xFF:
+                    continue
+                self.ff = False
+                if b == 0xD9:
+                    return self.DONE, i
+                if b in (0xD8, 0x01) or 0xD0 <= b <= 0xD7:
+                    continue
+                self.mode, self.marker, self.length = self._LENGTH, b, b""
+            elif mode == self._LENGTH:
+                take = 2 - len(self.length)
+                self.length += data[i:i + take]
+                i += take
+                if len(self.length) == 2:
+                    size = int.from_bytes(self.length, "big")
+                    if not _segment_length_ok(self.marker, size):
+                        return self.BAD, i
+                    self.need, self.mode = size - 2, self._SKIP
+                    if not self.need:
+                        self._end_segment()
+            else:
+                take = min(self.need, n - i)
+                i += take
+                self.need -= take
+                if not self.need:
+                    self._end_segment()
+        return self.OK, n
+
+    def _end_segment(self):
+        if self.marker == 0xDA:
+            self.mode, self.rst = self._SCAN, None
+        else:
+            self.mode = self._MARKER
+
+
+def _segment_length_ok(marker, size):
+    if marker == 0xDA:
+        return size in (8, 10, 12, 14)          # 1-4 components
+    if marker == 0xDD:
+        return size == 4
+    if marker == 0xDB:
+        # 1-4 tables of 65 (8-bit) or 129 (16-bit) bytes
+        return any(65 * a + 129 * b == size - 2 for a in range(5) for b in range(5 - a)) and size > 2
+    if marker == 0xC4:
+        return 19 <= size <= 2 + 4 * (17 + 256)
+    return size >= 2
+
+
+def is_valid_jpeg(data):
+    """
+    Whether data starts like a real JPEG: SOI, then marker segments with sane
+    lengths up to the first scan (or EOI). Entropy-coded data isn't judged,
+    so a file broken by fragmentation still passes and can be stitched.
+    """
+    if not data.startswith(b"\xff\xd8\xff"):
+        return False
+    checker = JpegChecker()
+    status, _ = checker.feed(data)
+    # A BAD status inside the scan is a break in the data, not a bad header.
+    return status == JpegChecker.DONE or checker.in_scan
+
+
+def is_valid_pdf(data):
+    """Whether data starts like a real PDF: a %PDF-x.y header and an object within the first cluster."""
+    return _PDF_HEADER.match(data) is not None and _ANY_OBJ.search(data, 0, CLUSTER_SIZE) is not None
+
+
+class Reassembler:
+    """
+    Rebuilds files whose clusters aren't contiguous. Each file is a chain of
+    cluster runs found by a bounded search:
+
+    - JPEG: the structure is checked cluster by cluster; at the first cluster
+      that breaks it, candidate continuations within MAX_GAP_CLUSTERS are
+      tried nearest first, skipping clusters that are claimed by another file,
+      start another file, or whose class can't be entropy-coded data.
+      At most MAX_CANDIDATES joins are tested per break and MAX_FRAGMENTS
+      runs are allowed per file.
+    - PDF and ZIP (bifragment): the footer records where the xref table or
+      central directory sits in the file, so its position in the image gives
+      the gap size. Each split point is then tested against the xref object
+      offsets, or against the local header chain and member CRCs.
+
+    Only cluster classes (LRU-cached) and claimed ranges are kept between
+    files, so memory doesn't grow with the image.
+    """
+
+    def __init__(self, source, cluster_size=CLUSTER_SIZE, base=0):
+        self.src = source if isinstance(source, ClusterSource) else ClusterSource(source, cluster_size, base)
+        self.claims = _Claims()
+        self.handlers = {"jpg": self._jpeg, "pdf": self._pdf, "zip": self._zip}
+
+    def reassemble(self, offset, ftype, max_fragments=MAX_FRAGMENTS):
+        """List of (start, end) image byte runs making up the file at offset, or None."""
+        handler = self.handlers.get(ftype)
+        if handler is None:
+            return None
+        try:
+            return handler(offset, max_fragments)
+        except (IndexError, ValueError):
+            return None
+
+    def claim(self, runs):
+        for start, end in runs:
+            self.claims.add(start, end)
+
+    def join(self, runs):
+        return b"".join(self.src.read(start, end) for start, end in runs)
+
+    def stitch(self, fragments):
+        """
+        Reassemble carved fragments (dicts with "type", "data" and "start").
+        Files that are intact on their own are resolved and claimed first, so
+        their clusters aren't taken as continuations of broken ones. Fragments
+        that can't be reassembled are returned unchanged.
+        """
+        runs = [None] * len(fragments)
+        for max_fragments in (1, MAX_FRAGMENTS):
+            for i, frag in enumerate(fragments):
+                if runs[i] is None and frag.get("start") is not None:
+                    runs[i] = self.reassemble(frag["start"], frag["type"], max_fragments)
+                    if runs[i]:
+                        self.claim(runs[i])
+        out = []
+        for frag, found in zip(fragments, runs):
+            if found:
+                data = self.join(found)
+                frag = dict(frag, data=data, size=len(data), runs=found, stitched=len(found) > 1)
+            out.append(frag)
+        return out
+
+    # ---------------- JPEG ----------------
+
+    def _jpeg(self, offset, max_fragments):
+        src = self.src
+        checker = JpegChecker()
+        runs = []
+        run_start = offset
+        c = src.index(offset)
+        pos = offset
+        total = 0
+        while total < MAX_FILE_SIZE and c < src.count:
+            data = src.read(pos, src.start(c + 1))
+            trial = checker.copy()
+            status, n = trial.feed(data)
+            if status == JpegChecker.DONE:
+                runs.append((run_start, pos + n))
+                return runs
+            if status == JpegChecker.OK and (pos == offset or self._continues(c, trial, checker)):
+                checker = trial
+                total += len(data)
+                c += 1
+                pos = src.start(c)
+                continue
+            # Cluster c doesn't continue the file; the current run ends before it.
+            if pos == offset or len(runs) + 1 >= max_fragments:
+                return None
+            runs.append((run_start, pos))
+            c = self._jpeg_continuation(c, checker)
+            if c is None:
+                return None
+            run_start = pos = src.start(c)
+        return None
+
+    def _continues(self, c, after, before):
+        """Whether cluster c may belong to the file, beyond passing the structure check."""
+        start = self.src.start(c)
+        if self.claims.overlaps(start, start + self.src.cluster_size):
+            return False
+        cls = self.src.classify(c)
+        if before.in_scan or after.in_scan:
+            return cls in (HIGH, BINARY)
+        return cls not in (ZERO, HEADER)
+
+    def _jpeg_continuation(self, broken, checker):
+        src = self.src
+        tried = 0
+        for c in range(broken + 1, min(broken + 1 + MAX_GAP_CLUSTERS, src.count)):
+            trial = checker.copy()
+            if not self._continues(c, checker, checker):
+                continue
+            tried += 1
+            if tried > MAX_CANDIDATES:
+                return None
+            status, _ = trial.feed(src.cluster(c))
+            if status != JpegChecker.BAD:
+                return c
+        return None
+
+    # ---------------- Bifragment (PDF, ZIP) ----------------
+
+    def _splits(self, offset, gap, limit):
+        """Candidate split points: cluster boundaries after offset where the gap of `gap` bytes may start."""
+        src = self.src
+        first = src.index(offset) + 1
+        last = src.index(offset + limit)
+        for c in range(first, last + 1):
+            b = src.start(c)
+            if b - offset <= limit and not self.claims.overlaps(b, b + gap):
+                yield b
+
+    def _gap(self, offset, anchor_img, anchor_file):
+        """Gap in bytes implied by a structure at file offset anchor_file found at image offset anchor_img."""
+        gap = (anchor_img - offset) - anchor_file
+        if gap < 0 or gap % self.src.cluster_size or gap > MAX_GAP_CLUSTERS * self.src.cluster_size:
+            return None
+        return gap
+
+    def _pick(self, offset, gap, valid):
+        """
+        Among split points that all pass validation, choose the one whose gap
+        looks most foreign to the file (zero, other headers, or a cluster class
+        unlike the file's first cluster); ties go to the latest split.
+        """
+        if len(valid) == 1:
+            return valid[0]
+        src = self.src
+        ref = src.classify(src.index(offset) + 1) if src.index(offset) + 1 < src.count else None
+        n = gap // src.cluster_size
+
+        def foreign(c):
+            cls = src.classify(c)
+            return cls in (ZERO, HEADER) or cls != ref
+
+        best, best_score = None, -1
+        for b in valid:
+            c = src.index(b)
+            score = sum(foreign(k) for k in range(c, c + n))
+            if score >= best_score:
+                best, best_score = b, score
+        return best
+
+    def _bifragment(self, offset, gap, file_len, anchor_file, check, max_fragments):
+        if gap == 0:
+            return [(offset, offset + file_len)] if check(None) else None
+        if max_fragments < 2:
+            return None
+        valid = []
+        for b in self._splits(offset, gap, anchor_file):
+            if check(b - offset):
+                valid.append(b)
+                if len(valid) >= MAX_CANDIDATES:
+                    break
+        if not valid:
+            return None
+        b = self._pick(offset, gap, valid)
+        return [(offset, b), (b + gap, offset + file_len + gap)]
+
+    def _mapper(self, offset, gap, split):
+        if split is None:
+            return lambda p: offset + p
+        return lambda p: offset + p if p < split else offset + p + gap
+
+    def _read_mapped(self, offset, gap, split, start, end):
+        if split is None or end <= split or start >= split:
+            img = self._mapper(offset, gap, split)
+            return self.src.read(img(start), img(start) + end - start)
+        return self.src.read(offset + start, offset + split) + self.src.read(offset + split + gap, offset + end + gap)
+
+    def _pdf(self, offset, max_fragments):
+        src = self.src
+        limit = min(offset + MAX_FILE_SIZE + MAX_GAP_CLUSTERS * src.cluster_size, src.size)
+        sx = src.find(b"startxref", offset, limit)
+        if sx == -1:
+            return None
+        m = _STARTXREF.match(src.read(sx, sx + 64))
+        if not m:
+            return None
+        xref_file = int(m.group(1))
+        end_img = sx + m.end()
+        window = max(offset, sx - SEARCH_BLOCK)
+        tail = src.read(window, sx)
+        x = tail.rfind(b"xref")
+        if x == -1 or (x and tail[x - 1:x] not in b"\r\n \t"):
+            return None      # cross-reference streams (PDF 1.5+) aren't handled
+        xref_img = window + x
+        gap = self._gap(offset, xref_img, xref_file)
+        if gap is None:
+            return None
+        entries = _xref_entries(src.read(xref_img, sx))
+        if not entries:
+            return None
+        file_len = end_img - offset - gap
+
+        def check(split):
+            for num, off in entries:
+                if off >= xref_file:
+                    return False
+                m = _OBJ.match(self._read_mapped(offset, gap, split, off, off + 32))
+                if not m or int(m.group(1)) != num:
+                    return False
+            return True
+
+        return self._bifragment(offset, gap, file_len, xref_file, check, max_fragments)
+
+    def _zip(self, offset, max_fragments):
+        src = self.src
+        limit = min(offset + MAX_FILE_SIZE + MAX_GAP_CLUSTERS * src.cluster_size, src.size)
+        eocd = src.find(b"PK\x05\x06", offset, limit)
+        if eocd == -1:
+            return None
+        rec = src.read(eocd, eocd + 22)
+        if len(rec) < 22:
+            return None
+        cd_size = int.from_bytes(rec[12:16], "little")
+        cd_file = int.from_bytes(rec[16:20], "little")
+        comment = int.from_bytes(rec[20:22], "little")
+        cd_img = eocd - cd_size
+        gap = self._gap(offset, cd_img, cd_file)
+        if gap is None:
+            return None
+        members = _zip_members(src.read(cd_img, eocd))
+        if not members:
+            return None
+        file_len = eocd + 22 + comment - offset - gap
+
+        def check(split):
+            for lho, crc, csize, method, name in members:
+                if lho >= cd_file:
+                    return False
+                hdr = self._read_mapped(offset, gap, split, lho, lho + 30 + len(name))
+                if hdr[:4] != b"PK\x03\x04" or hdr[30:] != name:
+                    return False
+                data_start = lho + 30 + len(name) + int.from_bytes(hdr[28:30], "little")
+                data_end = data_start + csize
+                # Only the member the split falls in depends on where exactly the split is.
+                if split is None or data_start < split < data_end:
+                    if not _member_crc_ok(self._read_mapped(offset, gap, split, data_start, data_end), method, crc):
+                        return False
+            return True
+
+        return self._bifragment(offset, gap, file_len, cd_file, check, max_fragments)
+
+
+def _xref_entries(table):
+    """(object number, offset) of every in-use entry of a classic xref table."""
+    lines = table.split(b"\n")
+    entries = []
+    num = None
+    for line in lines[1:]:
+        parts = line.split()
+        if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+            num = int(parts[0])
+        elif len(parts) == 3 and num is not None and parts[2] in (b"n", b"f"):
+            if parts[2] == b"n":
+                entries.append((num, int(parts[0])))
+            num += 1
+        elif parts and parts[0] == b"trailer":
+            break
+    return entries
+
+
+def _zip_members(cd):
+    """(local header offset, crc, compressed size, method, name) per central directory entry."""
+    members = []
+    pos = 0
+    while cd[pos:pos + 4] == b"PK\x01\x02" and pos + 46 <= len(cd):
+        method = int.from_bytes(cd[pos + 10:pos + 12], "little")
+        crc = int.from_bytes(cd[pos + 16:pos + 20], "little")
+        csize = int.from_bytes(cd[pos + 20:pos + 24], "little")
+        nlen, elen, clen = (int.from_bytes(cd[pos + k:pos + k + 2], "little") for k in (28, 30, 32))
+        lho = int.from_bytes(cd[pos + 42:pos + 46], "little")
+        members.append((lho, crc, csize, method, bytes(cd[pos + 46:pos + 46 + nlen])))
+        pos += 46 + nlen + elen + clen
+    return members
+
+
+def _member_crc_ok(data, method, crc):
+    if method == 8:
+        try:
+            data = zlib.decompressobj(-15).decompress(data)
+        except zlib.error:
+            return False
+    elif method != 0:
+        return True     # other methods can't be checked here; the header chain still is
+    return zlib.crc32(data) & 0xFFFFFFFF == crc
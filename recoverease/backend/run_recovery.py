@@ -4,7 +4,7 @@ if __name__ == "__main__":
     DRIVE = "D"
     OUTPUT = "recovered"
     SECTOR_SIZE = 512
-    CHUNK_SECTORS = 100          # 50 KB per chunk
+    CHUNK_SECTORS = 16384        # 8 MiB per chunk
     MAX_BYTES = 20 * 1024 * 1024 # Limit to 20 MB for testing
     FILE_TYPES = ["jpg", "png", "pdf", "mp4", "zip"]
     FRAGMENT_SIZE = 1024 * 500   # 500 KB per carved file
@@ -1,7 +1,9 @@
 import os
 import msvcrt
 import ctypes
-from scanner.signature_matcher import match_signatures
+from scanner.signature_matcher import StreamCarver
+from utils.entropy import is_constant_fill, is_low_entropy
+from recovery.file_writer import AsyncWriter, WRITER_THREADS
 
 GENERIC_READ = 0x80000000
 FILE_SHARE_READ = 0x00000001
@@ -10,6 +12,9 @@ OPEN_EXISTING = 3
 FILE_FLAG_NO_BUFFERING = 0x20000000
 FILE_FLAG_RANDOM_ACCESS = 0x10000000
 
+# Default read size; a whole number of sectors as FILE_FLAG_NO_BUFFERING requires.
+CHUNK_BYTES = 8 * 1024 * 1024
+
 def open_raw_handle(drive_letter="D"):
     path = f"\\\\.\\{drive_letter.strip(':')}:"
     handle = ctypes.windll.kernel32.CreateFileW(
@@ -25,13 +30,18 @@ def open_raw_handle(drive_letter="D"):
         raise OSError(f"Failed to open raw handle for {drive_letter}. Run as Administrator.")
     return handle
 
-def read_chunks(drive_letter="D", sector_size=512, chunk_sectors=100, max_bytes=None, verbose=True):
+def read_chunks(drive_letter="D", sector_size=512, chunk_sectors=None, max_bytes=None, verbose=True, skip_fill=True):
     """
-    Read the volume in fixed-size chunks.
+    Read the volume in chunks of chunk_sectors sectors (CHUNK_BYTES by default).
+    Chunks that are a single repeated byte (zeroed or erased space) are not
+    yielded when skip_fill is set.
     """
     handle = open_raw_handle(drive_letter)
     os_handle = msvcrt.open_osfhandle(handle, os.O_RDONLY)
     total = 0
+    skipped = 0
+    if not chunk_sectors:
+        chunk_sectors = max(CHUNK_BYTES // sector_size, 1)
     chunk_size = sector_size * chunk_sectors
     try:
         with os.fdopen(os_handle, 'rb') as f:
@@ -44,37 +54,58 @@ def read_chunks(drive_letter="D", sector_size=512, chunk_sectors=100, max_bytes=
                     break
                 i += 1
                 total += len(data)
-                if verbose and i % 50 == 0:
+                if verbose and i % 10 == 0:
                     print(f"✅ Read {i} chunks, total {total // 1024} KB")
+                if skip_fill and is_constant_fill(data):
+                    skipped += len(data)
+                    continue
                 yield data
     except Exception as e:
         raise RuntimeError(f"Raw read failed: {e}")
+    if verbose and skipped:
+        print(f"⏭️ Skipped {skipped // 1024} KB of empty space")
 
-def recover_files(drive_letter="D", output_dir="recovered", sector_size=512, chunk_sectors=100,
-                  max_bytes=None, file_types=None, fragment_size=1024 * 500, verbose=True):
+def recover_files(drive_letter="D", output_dir="recovered", sector_size=512, chunk_sectors=None,
+                  max_bytes=None, file_types=None, fragment_size=1024 * 500, verbose=True, skip_low_entropy=True,
+                  writer_threads=WRITER_THREADS, fsync=False, alignment=None, embedded=None):
     """
     Full recovery pipeline:
-    - Streams the drive in chunks
-    - Detects signatures and carves fragments
-    - Saves files into output_dir
+    - Streams the drive in chunks (CHUNK_BYTES unless chunk_sectors is given)
+    - Skips blank/low-entropy chunks (skip_low_entropy) while no carve is open
+    - Carves with a StreamCarver, so files spanning chunk boundaries come out whole;
+      with alignment (the filesystem cluster size) headers only count at cluster
+      starts, except for the types listed in embedded
+    - Saves files into output_dir on writer_threads background threads
+      (fsync syncs them all once the scan is done)
     """
     os.makedirs(output_dir, exist_ok=True)
-    file_count = 0
+    skipped = 0
+    # Content hashes are kept for the whole run, so a file seen again later
+    # isn't written twice.
+    carver = StreamCarver(file_types=file_types, fragment_size=fragment_size, alignment=alignment, embedded=embedded)
+    writer = AsyncWriter(threads=writer_threads, fsync=fsync, verbose=verbose)
 
-    for idx, chunk in enumerate(read_chunks(drive_letter, sector_size, chunk_sectors, max_bytes, verbose)):
-        hits = match_signatures(chunk, file_types=file_types, fragment_size=fragment_size)
+    def save(hits, idx):
         for fname, content in hits:
-            out_path = os.path.join(output_dir, f"{idx}_{fname}")
-            try:
-                with open(out_path, "wb") as out_f:
-                    out_f.write(content)
-                file_count += 1
-                if verbose:
-                    print(f"💾 Saved {out_path} ({len(content)} bytes)")
-            except Exception as e:
-                if verbose:
-                    print(f"⚠️ Could not save {out_path}: {e}")
+            writer.write(os.path.join(output_dir, f"{idx}_{fname}"), content)
+
+    idx = 0
+    try:
+        # Fill chunks are skipped here rather than in read_chunks, so the carver's
+        # offsets stay continuous and an open carve still sees the bytes.
+        for idx, chunk in enumerate(read_chunks(drive_letter, sector_size, chunk_sectors, max_bytes, verbose,
+                                                skip_fill=False)):
+            if skip_low_entropy and carver.idle and is_low_entropy(chunk):
+                carver.skip(len(chunk))
+                skipped += 1
+                continue
+            save(carver.feed(chunk), idx)
+        save(carver.finish(), idx)
+    finally:
+        file_count = writer.close()
 
+    if verbose and skipped:
+        print(f"⏭️ Skipped {skipped} low-entropy chunks")
     if verbose:
         print(f"🎉 Recovery complete: {file_count} files saved to {output_dir}")
     return file_count
@@ -0,0 +1,8 @@
+# Settings shared by the raw scanner and the recovery pipeline.
+
+# Carved fragments below this entropy (bits/byte) are padding or text left in
+# slack space, not file data.
+ENTROPY_THRESHOLD = 2.0
+
+# Where main.run_recovery saves the raw sectors it read.
+RAW_DUMP_FILE = "raw_dump.bin"
@@ -17,54 +17,188 @@ FIXED_SIGS = {
     b"\x00\x00\x00\x1cftypMSNV": "mp4",
 }
 
-def detect_file_signatures(data, file_types=None, fragment_size=1024 * 500):
+# Bytes a footer-aware carve in StreamCarver may span while its footer is
+# searched for; the memory ceiling of a streaming scan beyond its chunk size.
+MAX_CARVE_SIZE = 16 * 1024 * 1024
+
+def find_header(buf, header, pos, end=None, alignment=None, base=0):
+    """
+    buf.find(header, pos, end), restricted to offsets where base + offset is a
+    multiple of alignment (cluster starts when base is the stream offset of
+    buf[0]). Unaligned occurrences are stepped over to the next boundary.
+    """
+    end = len(buf) if end is None else end
+    idx = buf.find(header, pos, end)
+    if alignment:
+        while idx != -1 and (base + idx) % alignment:
+            idx = buf.find(header, idx + alignment - (base + idx) % alignment, end)
+    return idx
+
+def detect_file_signatures(data, file_types=None, fragment_size=1024 * 500, seen_hashes=None,
+                           alignment=None, embedded=None):
     """
     Detects file signatures in raw data.
     - Uses footer-aware carving for JPG, PDF, PNG, ZIP
     - Uses fixed-size carving for MP4
-    - Deduplicates by MD5 hash
+    - Deduplicates by BLAKE2 content hash; pass the same seen_hashes set
+      across calls to dedupe across chunks
+    - With alignment (the cluster size, data starting on a cluster), headers
+      only count at cluster starts; types in embedded are still matched at
+      any offset, for objects stored inside other files
     Returns list of (filename, bytes).
     """
-    seen_hashes = set()
+    if seen_hashes is None:
+        seen_hashes = set()
     results = []
 
     # Footer-aware carving
     for header, (footer, ext) in FOOTER_SIGS.items():
         if file_types and ext not in file_types:
             continue
-        start = data.find(header)
+        step = None if embedded and ext in embedded else alignment
+        start = find_header(data, header, 0, alignment=step)
         while start != -1:
             end = data.find(footer, start + len(header))
             if end != -1:
                 fragment = data[start:end + len(footer)]
             else:
                 fragment = data[start:start + fragment_size]
-            h = hashlib.md5(fragment).hexdigest()
+            h = hashlib.blake2b(fragment, digest_size=16).hexdigest()
             if h not in seen_hashes:
                 seen_hashes.add(h)
                 filename = f"{ext}_{h[:8]}.{ext}"
                 results.append((filename, fragment))
-            start = data.find(header, start + 1)
+            start = find_header(data, header, start + 1, alignment=step)
 
     # Fixed-size carving
     for sig, ext in FIXED_SIGS.items():
         if file_types and ext not in file_types:
             continue
-        start = data.find(sig)
+        step = None if embedded and ext in embedded else alignment
+        start = find_header(data, sig, 0, alignment=step)
         while start != -1:
             fragment = data[start:start + fragment_size]
-            h = hashlib.md5(fragment).hexdigest()
+            h = hashlib.blake2b(fragment, digest_size=16).hexdigest()
             if h not in seen_hashes:
                 seen_hashes.add(h)
                 filename = f"{ext}_{h[:8]}.{ext}"
                 results.append((filename, fragment))
-            start = data.find(sig, start + 1)
+            start = find_header(data, sig, start + 1, alignment=step)
 
     return results
 
 # Alias for disk_scanner integration
-def match_signatures(data, file_types=None, fragment_size=1024 * 500):
-    return detect_file_signatures(data, file_types=file_types, fragment_size=fragment_size)
+def match_signatures(data, file_types=None, fragment_size=1024 * 500, seen_hashes=None, alignment=None, embedded=None):
+    return detect_file_signatures(data, file_types=file_types, fragment_size=fragment_size, seen_hashes=seen_hashes,
+                                  alignment=alignment, embedded=embedded)
+
+class StreamCarver:
+    """
+    Carves a stream fed in consecutive chunks with the same rules as
+    detect_file_signatures, except that headers, open carves and footer
+    searches carry over chunk boundaries. A footer-aware carve is given up to
+    max_carve bytes to find its footer before falling back to fragment_size,
+    so memory stays within one chunk plus max_carve bytes.
+    alignment and embedded work as in detect_file_signatures, with cluster
+    boundaries counted from the start of the stream.
+    """
+
+    def __init__(self, file_types=None, fragment_size=1024 * 500, seen_hashes=None, max_carve=MAX_CARVE_SIZE,
+                 alignment=None, embedded=None):
+        self.fragment_size = fragment_size
+        self.max_carve = max(max_carve, fragment_size)
+        self.seen_hashes = set() if seen_hashes is None else seen_hashes
+        self._sigs = [(header, footer, ext) for header, (footer, ext) in FOOTER_SIGS.items()]
+        self._sigs += [(sig, None, ext) for sig, ext in FIXED_SIGS.items()]
+        if file_types:
+            self._sigs = [s for s in self._sigs if s[2] in file_types]
+        self._buf = bytearray()
+        self._base = 0                                  # stream offset of _buf[0]
+        self._next = {header: 0 for header, _, _ in self._sigs}  # where each header search resumes
+        self._open = []                                 # [start, footer, ext, footer search resumes at]
+        # Per-header alignment; None where the header is matched at any offset.
+        self._align = {header: None if embedded and ext in embedded else alignment for header, _, ext in self._sigs}
+
+    @property
+    def offset(self):
+        """Stream offset just past the last byte fed or skipped."""
+        return self._base + len(self._buf)
+
+    @property
+    def idle(self):
+        """True when no carve is waiting for more data."""
+        return not self._open
+
+    def feed(self, chunk):
+        """Append the next chunk; returns the (filename, bytes) carves it completed."""
+        self._buf += chunk
+        end = self.offset
+        results = []
+
+        for header, footer, ext in self._sigs:
+            align = self._align[header]
+            pos = find_header(self._buf, header, self._next[header] - self._base, alignment=align, base=self._base)
+            while pos != -1:
+                start = self._base + pos
+                self._open.append([start, footer, ext, start + len(header)])
+                pos = find_header(self._buf, header, pos + 1, alignment=align, base=self._base)
+            # A match starting later than this would have been found already.
+            self._next[header] = max(self._next[header], end - len(header) + 1)
+
+        still_open = []
+        for carve in self._open:
+            start, footer, ext, search_from = carve
+            if footer is None:
+                if end - start < self.fragment_size:
+                    still_open.append(carve)
+                    continue
+                stop = start + self.fragment_size
+            else:
+                pos = self._buf.find(footer, search_from - self._base, start + self.max_carve - self._base)
+                if pos != -1:
+                    stop = self._base + pos + len(footer)
+                elif end - start < self.max_carve:
+                    carve[3] = max(search_from, end - len(footer) + 1)
+                    still_open.append(carve)
+                    continue
+                else:
+                    stop = start + self.fragment_size
+            self._emit(start, stop, ext, results)
+        self._open = still_open
+
+        keep = min([c[0] for c in self._open] + list(self._next.values()) + [end])
+        if keep > self._base:
+            del self._buf[:keep - self._base]
+            self._base = keep
+        return results
+
+    def skip(self, nbytes):
+        """
+        Advance past nbytes that are not fed (e.g. blank space). Open carves end
+        where the gap starts; returns them like finish().
+        """
+        results = self.finish()
+        self._base += nbytes
+        for header in self._next:
+            self._next[header] = self._base
+        return results
+
+    def finish(self):
+        """End of stream: carves still waiting for a footer fall back to fragment_size."""
+        results = []
+        for start, _, ext, _ in self._open:
+            self._emit(start, start + self.fragment_size, ext, results)
+        self._open = []
+        self._base = self.offset
+        self._buf = bytearray()
+        return results
+
+    def _emit(self, start, stop, ext, results):
+        fragment = bytes(self._buf[start - self._base:stop - self._base])
+        h = hashlib.blake2b(fragment, digest_size=16).hexdigest()
+        if h not in self.seen_hashes:
+            self.seen_hashes.add(h)
+            results.append((f"{ext}_{h[:8]}.{ext}", fragment))
 
 
 
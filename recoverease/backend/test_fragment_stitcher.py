@@ -0,0 +1,38 @@
+import random
+import struct
+
+from recoverease.backend.recovery.fragment_stitcher import extract_fragments, stitch_fragments
+from recoverease.backend.recovery.reassembly import CLUSTER_SIZE
+
+
+def make_jpeg(scan_bytes=20000, seed=1):
+    rng = random.Random(seed)
+    seg = lambda marker, body: b"\xff" + bytes([marker]) + struct.pack(">H", len(body) + 2) + body
+    scan = rng.randbytes(scan_bytes).replace(b"\xff", b"\xff\x00")
+    return (b"\xff\xd8" + seg(0xE0, b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00")
+            + seg(0xDB, b"\x00" + bytes(range(64))) + seg(0xC0, b"\x08\x00\x10\x00\x10\x01\x01\x11\x00")
+            + seg(0xC4, b"\x00" + bytes([1] * 16) + bytes(range(136)))
+            + seg(0xDA, b"\x01\x01\x00\x00\x3f\x00") + scan + b"\xff\xd9")
+
+
+def test_stitch_fragmented_jpeg():
+    jpeg = make_jpeg()
+    split = 2 * CLUSTER_SIZE
+    foreign = (b"lorem ipsum dolor sit amet " * 200)[:CLUSTER_SIZE]
+    # Cluster 0 empty, the JPEG's first two clusters, a cluster of another file, the rest.
+    image = bytes(CLUSTER_SIZE) + jpeg[:split] + foreign + jpeg[split:]
+    image += bytes(-len(image) % CLUSTER_SIZE)
+    start = CLUSTER_SIZE
+    end = image.find(b"\xff\xd9", start) + 2
+
+    fragments = extract_fragments(image, [{"type": "jpg", "start": start, "end": end}])
+    assert len(fragments) == 1
+    stitched = stitch_fragments(fragments, image)
+    assert stitched[0]["stitched"]
+    assert stitched[0]["data"] == jpeg
+    assert stitched[0]["runs"] == [(start, start + split), (start + split + CLUSTER_SIZE, end)]
+
+
+if __name__ == "__main__":
+    test_stitch_fragmented_jpeg()
+    print("✅ Fragmented JPEG stitched")
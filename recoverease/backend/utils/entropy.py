@@ -1,4 +1,17 @@
 import math
+from collections import Counter
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+BLOCK_SIZE = 4096
+# Blocks below this many bits per byte are zero/constant fill or nearly so.
+LOW_ENTROPY_THRESHOLD = 1.0
+# Blocks per bincount pass in block_entropy; bounds the temporary index array.
+_BATCH_BLOCKS = 256
 
 def entropy(data: bytes) -> float:
     """
@@ -7,14 +20,60 @@ def entropy(data: bytes) -> float:
     if not data:
         return 0.0
 
-    freq = [0] * 256
-    for b in data:
-        freq[b] += 1
-
     total = len(data)
+    if HAS_NUMPY:
+        counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+        p = counts[counts > 0] / total
+        return float(-(p * np.log2(p)).sum())
+
     ent = 0.0
-    for count in freq:
-        if count:
-            p = count / total
-            ent -= p * math.log2(p)
+    for count in Counter(data).values():
+        p = count / total
+        ent -= p * math.log2(p)
     return ent
+
+def block_entropy(data: bytes, block_size: int = BLOCK_SIZE) -> list:
+    """
+    Shannon entropy of every block_size block of data (the last block may be shorter).
+    With NumPy all blocks of a batch are counted in one bincount call.
+    """
+    if not data:
+        return []
+    if not HAS_NUMPY:
+        view = memoryview(data)
+        return [entropy(view[i:i + block_size]) for i in range(0, len(data), block_size)]
+
+    arr = np.frombuffer(data, dtype=np.uint8)
+    full = len(arr) // block_size
+    result = np.empty(full + (1 if len(arr) % block_size else 0))
+    for first in range(0, full, _BATCH_BLOCKS):
+        n = min(_BATCH_BLOCKS, full - first)
+        blocks = arr[first * block_size:(first + n) * block_size].reshape(n, block_size)
+        # Offset each row's byte values by 256 * row so one bincount counts every block.
+        keys = blocks + (np.arange(n, dtype=np.int64) * 256)[:, None]
+        counts = np.bincount(keys.ravel(), minlength=n * 256).reshape(n, 256)
+        p = counts / block_size
+        with np.errstate(divide="ignore", invalid="ignore"):
+            terms = np.where(counts > 0, p * np.log2(p), 0.0)
+        result[first:first + n] = -terms.sum(axis=1)
+    if len(result) > full:
+        result[full] = entropy(data[full * block_size:])
+    return result.tolist()
+
+def is_constant_fill(data: bytes) -> bool:
+    """
+    True if data is one byte value repeated (zeroed or erased space).
+    """
+    if not data:
+        return False
+    first = data[0]
+    if data[-1] != first or data[len(data) // 2] != first:
+        return False
+    return data.count(data[:1]) == len(data)
+
+def is_low_entropy(data: bytes, threshold: float = LOW_ENTROPY_THRESHOLD, block_size: int = BLOCK_SIZE) -> bool:
+    """
+    True if every block of data is below threshold, i.e. the region is blank or
+    filler and can't hold a file header worth searching for.
+    """
+    return all(e < threshold for e in block_entropy(data, block_size))
@@ -1,9 +1,32 @@
 import os
+import io
+import errno
 import json
 import re
 import mmap
-from PIL import Image
-from typing import Optional, Dict, List
+import heapq
+import hashlib
+import time
+import threading
+from itertools import groupby
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Optional, Dict, List, Tuple, Iterator, Iterable, Union
+
+from src.core.carve_formats import InvalidStructure, resolve_length, validate
+from src.core.content_store import content_digest, forget, init_store, lookup, record
+from src.core.fs_geometry import Alignment
+from src.core.scan_index import (STATUS_OK, find_image, image_identity, init_index, query_hits, query_outputs,
+                                  record_outputs, store_scan)
+from src.core.offset_index import IntervalSet, OffsetIndex
+from src.core.output_writer import OutputWriter, WRITER_THREADS
+from src.core.scan_metrics import ScanMetrics
+from src.core.scan_progress import ScanProgress, ScanCancelled
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
 CHUNK_LOG_BYTES = 64 * 1024 * 1024
 MAX_FILE_SIZE = 256 * 1024 * 1024
@@ -11,11 +34,41 @@ MIN_OFFSET_GAP = 1024
 FOOTER_WINDOW = 32 * 1024 * 1024
 FALLBACK_ON_NO_FOOTER = True
 MIN_VALID_SIZE = 512
+PARALLEL_REGIONS_PER_WORKER = 4
+DEEP_VALIDATE_EXTS = ("jpg", "png", "gif", "webp")
+DEEP_VALIDATE_WORKERS = 4
+DEEP_VALIDATE_BACKLOG = 16
+FILL_BLOCK_BYTES = 64 * 1024
+# A single type, several types (iterable or comma-separated), or None/"all" for every signature.
+FileTypes = Optional[Union[str, Iterable[str]]]
+# (min_size, max_size) of the carves a scan keeps; None on either side is unbounded.
+SizeRange = Tuple[Optional[int], Optional[int]]
+# Upper bound for IntervalSet.gaps() when looking for the next free range of a
+# stream whose size isn't known.
+_STREAM_END = 1 << 62
+# Written results a scan may run ahead of before it waits for the writer.
+WRITE_BACKLOG = 64
+# Writer threads committing the same content take the same lock, so the second
+# one finds the first one's file in the content store and links to it.
+_DIGEST_LOCKS = [threading.Lock() for _ in range(64)]
 
 class Recoverer:
-    def __init__(self, signature_file: str):
+    def __init__(self, signature_file: str, deep_validate: bool = False, dedupe: bool = True,
+                 writer_threads: int = WRITER_THREADS, fsync: bool = False):
+        self.deep_validate = deep_validate
+        # Output files are written by a pool of writer threads (inline with 0) so
+        # the scan isn't held up by the destination disk; fsync syncs them all
+        # once the scan is done.
+        self.writer_threads = writer_threads
+        self.fsync = fsync
+        # Content-addressed output: a carve whose bytes were already written (this
+        # run or an earlier one) becomes a hardlink to that file instead of a copy.
+        self.dedupe = dedupe
+        if dedupe:
+            init_store()
         self.signatures = self._load_signatures(signature_file)
         self.compiled = self._compile_signatures(self.signatures)
+        self._matchers: Dict[str, Tuple] = {}
 
     def _load_signatures(self, path: str) -> Dict:
         with open(path, "r", encoding="utf-8") as f:
@@ -33,27 +86,151 @@ class Recoverer:
                 "extension": ext,
                 "header": header,
                 "footer": footer,
-                "max_size": max_size
+                "max_size": max_size,
+                "length": spec.get("length"),
+                # RIFF form type (AVI and WAV share a header).
+                "form": spec["form"].encode("ascii") if "form" in spec else None,
             })
         return compiled
 
-    def _matches_type(self, file_type: Optional[str], sig: Dict) -> bool:
+    def _build_matcher(self, sigs: List[Dict]) -> Tuple[Dict[bytes, List[Dict]], int]:
+        """
+        Group signatures by header so each distinct header is searched once per
+        window and every hit is resolved once, even when several types share it
+        (ZIP/DOCX/XLSX/PPTX, AVI/WAV).
+        """
+        groups: Dict[bytes, List[Dict]] = {}
+        for sig in sigs:
+            groups.setdefault(sig["header"], []).append(sig)
+        overhang = max((len(h) for h in groups), default=1) - 1
+        return groups, overhang
+
+    def _matcher_for(self, file_type: FileTypes) -> Tuple[Dict[bytes, List[Dict]], int]:
+        key = self._normalize_types(file_type)
+        if key not in self._matchers:
+            self._matchers[key] = self._build_matcher(self._signatures_for(key))
+        return self._matchers[key]
+
+    def _normalize_types(self, file_type: FileTypes) -> Tuple[str, ...]:
+        """Requested types as a sorted tuple of lowercase names/extensions; () means every signature."""
         if not file_type:
-            return False
+            return ()
+        if isinstance(file_type, str):
+            file_type = file_type.split(",")
+        types = {ft.lower().strip().lstrip(".") for ft in file_type}
+        types.discard("")
+        return () if "all" in types else tuple(sorted(types))
+
+    def _iter_hits(self, buf, groups: Dict[bytes, List[Dict]], start: int, end: int,
+                   metrics: Optional[ScanMetrics] = None, grid: Optional[Dict[bytes, Optional[Alignment]]] = None,
+                   base: int = 0) -> Iterator[Tuple[int, bytes]]:
+        """
+        Yield (offset, header) for every header occurrence in buf[start:end] in
+        offset order. Each header keeps its own find() cursor and the cursors are
+        merged through a heap, which stays at memchr speed on zero-filled and
+        text-heavy regions where a regex alternation falls off badly.
+        With a grid (see _header_grid) a header only matches where its device
+        offset (base + offset) is on its alignment; other occurrences are
+        stepped over without being resolved.
+        Time spent in find() is reported to metrics as the "search" stage.
+        """
+        clock = time.perf_counter
+        searching = clock()
+        searched = 0.0
+        finds = len(groups)
+
+        def find(header, pos):
+            nonlocal finds
+            idx = buf.find(header, pos, end)
+            step = grid.get(header) if grid else None
+            while step and idx != -1 and not step.aligned(base + idx):
+                idx = buf.find(header, step.ceil(base + idx) - base, end)
+                finds += 1
+            return idx
+
+        try:
+            heap = []
+            for header in groups:
+                idx = find(header, start)
+                if idx != -1:
+                    heap.append((idx, header))
+            heapq.heapify(heap)
+            searched += clock() - searching
+            while heap:
+                idx, header = heap[0]
+                yield idx, header
+                searching = clock()
+                nxt = find(header, idx + len(header))
+                if nxt != -1:
+                    heapq.heapreplace(heap, (nxt, header))
+                else:
+                    heapq.heappop(heap)
+                searched += clock() - searching
+                finds += 1
+        finally:
+            if metrics:
+                metrics.add_time("search", searched, finds)
+
+    def _header_grid(self, groups: Dict[bytes, List[Dict]], alignment: Optional[Alignment],
+                     embedded: FileTypes) -> Optional[Dict[bytes, Optional[Alignment]]]:
+        """
+        Alignment each header is searched on for an aligned scan, or None for a
+        byte-granular one. Headers of embedded types (objects stored inside
+        other files, e.g. "jpg" for images in documents) keep matching at every
+        offset.
+        """
+        if alignment is None:
+            return None
+        inner = self._normalize_types(embedded) if embedded else ()
+        return {header: None if any(self._matches_type(ft, sig) for ft in inner for sig in sigs) else alignment
+                for header, sigs in groups.items()}
+
+    def _matches_type(self, file_type: str, sig: Dict) -> bool:
         ft = file_type.lower().strip().lstrip(".")
         return ft == sig["extension"] or ft == sig["name"].lower()
 
-    def _safe_write(self, base_dir: str, name: str, data: bytes) -> str:
+    def _safe_path(self, base_dir: str, name: str) -> str:
         os.makedirs(base_dir, exist_ok=True)
         safe_name = re.sub(r"[^a-zA-Z0-9._-]", "_", name)
         out_path = os.path.abspath(os.path.join(base_dir, safe_name))
         if not out_path.startswith(os.path.abspath(base_dir) + os.sep):
             raise ValueError("Unsafe output path attempt")
+        return out_path
+
+    def _safe_write(self, base_dir: str, name: str, data: bytes) -> str:
+        out_path = self._safe_path(base_dir, name)
         with open(out_path, "wb") as f:
             f.write(data)
         return out_path
 
+    def _safe_write_range(self, base_dir: str, name: str, fileno: Optional[int], mm: mmap.mmap, start: int, end: int) -> str:
+        """
+        Write bytes [start, end) of the source to a new file without copying them
+        into the Python heap: the kernel copies file-to-file where it can, and a
+        memoryview over the mapping is written otherwise.
+        """
+        out_path = self._safe_path(base_dir, name)
+        with open(out_path, "wb", buffering=0) as out:
+            pos = start
+            if fileno is not None:
+                try:
+                    while pos < end:
+                        copied = _kernel_copy(fileno, out.fileno(), pos, end - pos)
+                        if copied <= 0:
+                            break
+                        pos += copied
+                except OSError:
+                    # Block devices, cross-filesystem copies and platforms without
+                    # copy_file_range/sendfile for regular files end up here.
+                    pass
+            if pos < end:
+                with memoryview(mm) as view, view[pos:end] as chunk:
+                    out.write(chunk)
+        return out_path
+
     def is_valid_image(self, path: str) -> bool:
+        if Image is None:
+            return True
         try:
             with Image.open(path) as img:
                 img.verify()
@@ -70,9 +247,43 @@ class Recoverer:
             return "webp"
         return "bin"
 
-    def scan_device(self, device_path: str, output_dir: str, file_type: Optional[str] = None) -> List[Dict]:
-        results = []
-        seen_offsets: List[int] = []
+    def scan_device(self, device_path: str, output_dir: str, file_type: FileTypes = None, workers: int = 1,
+                    progress: Optional[ScanProgress] = None, alignment: Optional[Alignment] = None,
+                    embedded: FileTypes = None, exclude: Optional[IntervalSet] = None,
+                    min_size: Optional[int] = None, max_size: Optional[int] = None) -> List[Dict]:
+        return list(self.iter_scan(device_path, output_dir, file_type, workers, progress, alignment, embedded,
+                                   exclude, min_size, max_size))
+
+    def iter_scan(self, device_path: str, output_dir: str, file_type: FileTypes = None, workers: int = 1,
+                  progress: Optional[ScanProgress] = None, alignment: Optional[Alignment] = None,
+                  embedded: FileTypes = None, exclude: Optional[IntervalSet] = None,
+                  min_size: Optional[int] = None, max_size: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Yield each carved file as soon as it is written, in offset order.
+        file_type may name several types (or None for all); every requested
+        type is carved in the same read of the device.
+        With alignment (see fs_geometry.detect_alignment) headers are only
+        tested at cluster starts, which is where files begin; types listed in
+        embedded are still searched at every offset.
+        exclude holds byte ranges that are neither read nor searched for
+        headers, e.g. fs_geometry.allocated_space() to carve only unallocated
+        space; a carve starting outside them may still run into them.
+        min_size/max_size drop carves outside that byte range, as in
+        scan_indexed().
+        scan_device() is the list-returning wrapper; callers that stream results
+        (SSE, job runners) iterate this directly and never hold the full list.
+        """
+        if progress is None:
+            progress = ScanProgress()
+        if workers and workers > 1:
+            filesize = self._parallel_size(device_path)
+            if filesize is not None:
+                yield from self._scan_parallel(device_path, output_dir, file_type, workers, filesize, progress,
+                                               alignment, embedded, exclude, (min_size, max_size))
+                self._report(progress)
+                return
+
+        seen_offsets = OffsetIndex()
         fd = open(device_path, "rb")
         try:
             try:
@@ -83,154 +294,812 @@ class Recoverer:
                 mm = None
                 use_mmap = False
 
+            progress.start(filesize if use_mmap else self._device_size(fd))
             if use_mmap:
-                results = self._scan_mmap(mm, filesize, file_type, output_dir, seen_offsets)
+                yield from self._scan_mmap(mm, filesize, file_type, output_dir, seen_offsets, progress=progress,
+                                           fileno=fd.fileno(), alignment=alignment, embedded=embedded,
+                                           exclude=exclude, sizes=(min_size, max_size))
             else:
-                results = self._scan_stream(fd, file_type, output_dir, seen_offsets)
+                yield from self._scan_stream(fd, file_type, output_dir, seen_offsets, progress, alignment, embedded,
+                                             exclude, (min_size, max_size))
         finally:
             if mm: mm.close()
             fd.close()
-        return results
+        self._report(progress)
 
-    def _scan_mmap(self, mm: mmap.mmap, filesize: int, file_type: Optional[str], output_dir: str, seen_offsets: List[int]) -> List[Dict]:
-        results = []
-        pos = 0
-        while pos < filesize:
-            for sig in self.compiled:
-                if not self._matches_type(file_type, sig):
-                    continue
-                header = sig["header"]
-                idx = mm.find(header, pos, min(pos + CHUNK_LOG_BYTES, filesize))
-                while idx != -1:
-                    try:
-                        if any(abs(idx - s) < MIN_OFFSET_GAP for s in seen_offsets):
-                            idx = mm.find(header, idx + len(header), min(pos + CHUNK_LOG_BYTES, filesize))
-                            continue
-                        seen_offsets.append(idx)
+    def _report(self, progress: ScanProgress) -> None:
+        if progress.bytes_skipped:
+            print(f"[skip] {progress.bytes_skipped} of {progress.total_bytes} bytes were holes, constant fill "
+                  "or excluded")
+        print(progress.metrics.summary())
 
-                        data = (
-                            self._carve_with_footer_mmap(mm, idx, header, sig["footer"], sig["max_size"], filesize)
-                            if sig.get("footer")
-                            else self._carve_fixed_mmap(mm, idx, header, sig["max_size"], filesize)
-                        )
+    def _signatures_for(self, file_types: FileTypes) -> List[Dict]:
+        types = self._normalize_types(file_types)
+        if not types:
+            return list(self.compiled)
+        return [sig for sig in self.compiled if any(self._matches_type(ft, sig) for ft in types)]
 
-                        if not data or len(data) < MIN_VALID_SIZE:
-                            idx = mm.find(header, idx + len(header), min(pos + CHUNK_LOG_BYTES, filesize))
-                            continue
+    def signature_digest(self) -> str:
+        """Identifies the signature set an index was built with; edits to it invalidate the index."""
+        spec = json.dumps(self.signatures, sort_keys=True).encode()
+        return hashlib.blake2b(spec, digest_size=16).hexdigest()
 
-                        ext = self.detect_format(data) if sig["extension"] in ["jpg", "png", "webp"] else sig["extension"]
-                        name = f"recovered_{sig['name']}_{idx}.{ext}"
-                        path = self._safe_write(output_dir, name, data)
+    def scan_indexed(self, device_path: str, output_dir: str, file_types: FileTypes = None,
+                     progress: Optional[ScanProgress] = None, min_size: Optional[int] = None,
+                     max_size: Optional[int] = None, alignment: Optional[Alignment] = None,
+                     embedded: FileTypes = None, exclude: Optional[IntervalSet] = None) -> List[Dict]:
+        """
+        Carve file_types (all signatures if empty) using the persistent scan
+        index. The first call on an image runs one pass for every signature and
+        records each hit's carve range and validation result; later calls with
+        any type or size filter are answered from the index and only read the
+        bytes of the files they write. Raises ValueError for sources that can't
+        be mapped (raw block devices on some kernels); callers fall back to
+        scan_device(). The index holds every hit, so alignment, embedded and
+        exclude (as in iter_scan) are applied per query too. With exclude and
+        no index yet, the index isn't built: that would read the excluded
+        space too, so the remaining space is carved directly instead.
+        """
+        if progress is None:
+            progress = ScanProgress()
+        init_index()
+        identity = image_identity(device_path)
+        digest = self.signature_digest()
+        image_id = find_image(identity, digest)
+        if image_id is None and exclude is not None:
+            print(f"[index] No scan index for {device_path}; carving outside the excluded ranges directly")
+            return self.scan_device(device_path, output_dir, file_types, progress=progress, alignment=alignment,
+                                    embedded=embedded, exclude=exclude, min_size=min_size, max_size=max_size)
+        if image_id is None:
+            print(f"[index] Building scan index for {device_path}")
+            image_id = store_scan(identity, digest, self._index_hits(device_path, progress))
+        else:
+            print(f"[index] Using scan index for {device_path}")
 
-                        if ext in ["jpg", "png", "webp"] and not self.is_valid_image(path):
-                            print(f"[warn] Skipping corrupt image: {path}")
-                            idx = mm.find(header, idx + len(header), min(pos + CHUNK_LOG_BYTES, filesize))
-                            continue
+        sigs = self._signatures_for(file_types)
+        by_name = {sig["name"]: sig for sig in sigs}
+        order = {sig["name"]: i for i, sig in enumerate(sigs)}
+        rows = query_hits(image_id, list(by_name))
+        if alignment is not None:
+            inner = self._normalize_types(embedded) if embedded else ()
+            loose = {name for name, sig in by_name.items() if any(self._matches_type(ft, sig) for ft in inner)}
+            rows = [row for row in rows if row[1] in loose or alignment.aligned(row[0])]
+        if exclude is not None:
+            rows = [row for row in rows if not exclude.contains(row[0])]
 
-                        print(f"[write] {name} -> {path} ({len(data)} bytes)")
-                        results.append({"path": path, "type": sig["name"], "size": len(data), "offset": idx})
-                    except Exception as e:
-                        print(f"[error] Failed at offset {idx}: {e}")
-                    idx = mm.find(header, idx + len(header), min(pos + CHUNK_LOG_BYTES, filesize))
-            pos += CHUNK_LOG_BYTES
+        known = query_outputs(image_id)
+        with open(device_path, "rb") as fd:
+            mm = mmap.mmap(fd.fileno(), length=0, access=mmap.ACCESS_READ)
+            pending = deque()
+            deep_pool = self._deep_pool()
+            writer = self._output_writer()
+            results = []
+            written = []
+            try:
+                # Same offset handling as a live scan restricted to these signatures:
+                # hits within MIN_OFFSET_GAP of an earlier one are dropped, and at one
+                # offset the first accepted signature in definition order wins.
+                seen_offsets = OffsetIndex()
+                for offset, group in groupby(rows, key=lambda row: row[0]):
+                    progress.check()
+                    if seen_offsets.near(offset, MIN_OFFSET_GAP):
+                        continue
+                    seen_offsets.add(offset)
+                    for _, name, ext, end, status in sorted(group, key=lambda row: order[row[1]]):
+                        if status != STATUS_OK:
+                            continue
+                        if not _size_ok(end - offset, (min_size, max_size)):
+                            progress.metrics.count("rejects", "size_filter")
+                            break
+                        cand = {"sig": by_name[name], "offset": offset, "end": end, "ext": ext, "data": None}
+                        existing = self._existing_output(cand, output_dir, known)
+                        if existing:
+                            progress.add_hit()
+                            progress.metrics.count("hits", name)
+                            results.append(existing)
+                        else:
+                            self._queue_candidate(pending, cand, deep_pool, mm, progress.metrics)
+                            written.extend(self._drain(pending, output_dir, mm, fd.fileno(), progress, writer))
+                        break
+                written.extend(self._drain(pending, output_dir, mm, fd.fileno(), progress, writer, wait_all=True))
+                writer.close()
+            finally:
+                writer.close(cancel=True)
+                if deep_pool:
+                    deep_pool.shutdown(cancel_futures=True)
+                mm.close()
+                self._remember_outputs(image_id, written)
+        results.extend(written)
+        results.sort(key=lambda r: r["offset"])
+        self._report(progress)
         return results
 
-    def _scan_stream(self, fd, file_type: Optional[str], output_dir: str, seen_offsets: List[int]) -> List[Dict]:
-        results = []
-        buffer = b""
-        offset = 0
-        while True:
-            chunk = fd.read(CHUNK_LOG_BYTES)
-            if not chunk:
-                break
-            buffer += chunk
-            for sig in self.compiled:
-                if not self._matches_type(file_type, sig):
+    def _existing_output(self, cand: Dict, output_dir: str, known: Dict[Tuple[int, str], Tuple]) -> Optional[Dict]:
+        """
+        Result for a carve an earlier query of the same indexed image already
+        wrote, so it isn't copied again. known is query_outputs() for the
+        index. Output names are positional and OUTPUT_DIR is shared by every
+        image, so the file must still be the one recorded for this image (same
+        inode, size and mtime), not another image's carve at the same offset.
+        """
+        path = self._safe_path(output_dir, self._output_name(cand))
+        size = cand["end"] - cand["offset"]
+        entry = known.get((cand["offset"], cand["sig"]["name"]))
+        if entry is None or entry[0] != path:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if (st.st_size, st.st_ino, st.st_mtime_ns) != (size, entry[2], entry[3]) or entry[1] != size:
+            return None
+        return {"path": path, "type": cand["sig"]["name"], "size": size, "offset": cand["offset"]}
+
+    def _remember_outputs(self, image_id: int, written: List[Dict]) -> None:
+        rows = []
+        for r in written:
+            try:
+                st = os.stat(r["path"])
+            except OSError:
+                continue
+            rows.append((r["offset"], r["type"], r["path"], r["size"], st.st_ino, st.st_mtime_ns))
+        if rows:
+            record_outputs(image_id, rows)
+
+    def _index_hits(self, device_path: str, progress: Optional[ScanProgress] = None) -> Iterator[Tuple]:
+        """
+        Every header hit of every signature as (offset, signature, extension,
+        end_offset, status) rows for the scan index. Nothing is written and no
+        offsets are suppressed; scan_indexed() applies that per query.
+        """
+        groups, overhang = self._build_matcher(self.compiled)
+        with open(device_path, "rb") as fd:
+            filesize = os.fstat(fd.fileno()).st_size
+            try:
+                mm = mmap.mmap(fd.fileno(), length=0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                raise ValueError(f"Can't index {device_path}: {e}")
+            try:
+                if progress:
+                    progress.start(filesize)
+                metrics = progress.metrics if progress else None
+                for idx, header in self._iter_live_hits(mm, groups, overhang, 0, filesize, filesize, fd.fileno(), progress):
+                    for sig in groups[header]:
+                        end, ext, reason = self._try_signature(mm, idx, sig, filesize, metrics=metrics)
+                        yield idx, sig["name"], ext, end, reason or STATUS_OK
+            finally:
+                mm.close()
+
+    def _device_size(self, fd) -> int:
+        # st_size is 0 for block devices; seeking to the end reports their real size.
+        try:
+            size = fd.seek(0, os.SEEK_END)
+            fd.seek(0)
+            return size
+        except OSError:
+            return 0
+
+    def _parallel_size(self, device_path: str) -> Optional[int]:
+        """
+        Size of the image if it is worth splitting across workers, or None when it
+        can't be mapped (block devices on some kernels) or fits in one window, in
+        which case the caller falls back to the serial path.
+        """
+        with open(device_path, "rb") as fd:
+            filesize = os.fstat(fd.fileno()).st_size
+            try:
+                mmap.mmap(fd.fileno(), length=0, access=mmap.ACCESS_READ).close()
+            except Exception:
+                return None
+        return filesize if filesize > CHUNK_LOG_BYTES else None
+
+    def _scan_parallel(self, device_path: str, output_dir: str, file_type: FileTypes, workers: int, filesize: int,
+                       progress: Optional[ScanProgress] = None, alignment: Optional[Alignment] = None,
+                       embedded: FileTypes = None, exclude: Optional[IntervalSet] = None,
+                       sizes: SizeRange = (None, None)) -> Iterator[Dict]:
+        """
+        Split the image into regions and carve each in a worker process that maps
+        the file itself. Headers are only taken inside a region, but carving may
+        run up to the largest max_size past its end, so files crossing a boundary
+        are carved whole.
+        """
+        overlap = max((sig["max_size"] for sig in self.compiled), default=0)
+        region_size = -(-filesize // (workers * PARALLEL_REGIONS_PER_WORKER))
+        region_size = -(-region_size // CHUNK_LOG_BYTES) * CHUNK_LOG_BYTES
+        regions = [(start, min(start + region_size, filesize)) for start in range(0, filesize, region_size)]
+
+        if progress:
+            progress.start(filesize)
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(regions)))
+        try:
+            futures = []
+            for start, stop in regions:
+                fut = pool.submit(_scan_region, self, device_path, output_dir, file_type, start, stop,
+                                  min(stop + overlap, filesize), alignment, embedded, exclude, sizes)
+                if progress:
+                    fut.add_done_callback(lambda f, n=stop - start: progress.advance(n))
+                futures.append(fut)
+            # Regions are consumed in offset order, so results stay deterministic.
+            last_offset = None
+            for fut in futures:
+                while progress and not fut.done():
+                    progress.check()
+                    wait([fut], timeout=0.5)
+                results, skipped, metrics = fut.result()
+                if progress:
+                    progress.skip(skipped)
+                    progress.metrics.merge(metrics)
+                for r in results:
+                    if last_offset is not None and r["offset"] - last_offset < MIN_OFFSET_GAP:
+                        # The previous region already carved a file within the gap of this one.
+                        if r.get("duplicate_of") != r["path"]:
+                            self._discard(r["path"])
+                        continue
+                    last_offset = r["offset"]
+                    if progress:
+                        progress.add_hit()
+                    yield r
+        except (ScanCancelled, GeneratorExit):
+            # Regions already running can't be interrupted; let them finish in the
+            # background and drop their results.
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+        pool.shutdown(wait=True)
+
+    def _discard(self, path: str) -> None:
+        # Output names are positional, so the path may be reused for other
+        # content; the content store must not point at it any more.
+        if self.dedupe:
+            forget(path)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _scan_mmap(self, mm: mmap.mmap, filesize: int, file_type: FileTypes, output_dir: str, seen_offsets: OffsetIndex,
+                   start: int = 0, stop: Optional[int] = None, progress: Optional[ScanProgress] = None,
+                   fileno: Optional[int] = None, alignment: Optional[Alignment] = None,
+                   embedded: FileTypes = None, exclude: Optional[IntervalSet] = None,
+                   sizes: SizeRange = (None, None)) -> Iterator[Dict]:
+        groups, overhang = self._matcher_for(file_type)
+        if not groups:
+            return
+        grid = self._header_grid(groups, alignment, embedded)
+        stop = filesize if stop is None else stop
+        pending = deque()
+        deep_pool = self._deep_pool()
+        writer = self._output_writer()
+        metrics = progress.metrics if progress else None
+        clock = time.perf_counter
+        try:
+            for idx, header in self._iter_live_hits(mm, groups, overhang, start, stop, filesize, fileno, progress, grid,
+                                                    exclude):
+                checking = clock()
+                near = seen_offsets.near(idx, MIN_OFFSET_GAP)
+                if not near:
+                    seen_offsets.add(idx)
+                if metrics:
+                    metrics.add_time("offset_check", clock() - checking)
+                if near:
                     continue
-                header = sig["header"]
-                search_pos = 0
+                cand = self._resolve_hit(mm, idx, groups[header], filesize, metrics=metrics, sizes=sizes)
+                if cand:
+                    self._queue_candidate(pending, cand, deep_pool, mm, metrics)
+                    yield from self._drain(pending, output_dir, mm, fileno, progress, writer)
+            yield from self._drain(pending, output_dir, mm, fileno, progress, writer, wait_all=True)
+            writer.close()
+        finally:
+            # Queued writes read from mm, which the caller closes after this returns.
+            writer.close(cancel=True)
+            if deep_pool:
+                deep_pool.shutdown(cancel_futures=True)
+
+    def _iter_live_hits(self, mm: mmap.mmap, groups: Dict[bytes, List[Dict]], overhang: int, start: int, stop: int,
+                        filesize: int, fileno: Optional[int], progress: Optional[ScanProgress],
+                        grid: Optional[Dict[bytes, Optional[Alignment]]] = None,
+                        exclude: Optional[IntervalSet] = None) -> Iterator[Tuple[int, bytes]]:
+        """
+        Header hits starting in [start, stop) of a mapped source, in offset order.
+        Holes, constant-fill blocks and excluded ranges are not searched (see
+        _data_extents and _live_ranges); each searched range is widened by a
+        header length on both sides so headers straddling its edges still
+        match. Advances progress.
+        """
+        searched = start
+        done = start
+        metrics = progress.metrics if progress else None
+        extents = _data_extents(fileno, start, stop)
+        if exclude is not None:
+            extents = [gap for ext_start, ext_end in extents for gap in exclude.gaps(ext_start, ext_end)]
+        for ext_start, ext_end in extents:
+            if progress and ext_start > done:
+                progress.advance(ext_start - done)
+                progress.skip(ext_start - done)
+            pos = ext_start
+            while pos < ext_end:
+                if progress:
+                    progress.check()
+                window_end = min(pos + CHUNK_LOG_BYTES, ext_end)
+                live = 0
+                for live_start, live_end in _live_ranges(mm, pos, window_end):
+                    lo = max(live_start - overhang, searched)
+                    for idx, header in self._iter_hits(mm, groups, lo, min(live_end + overhang, filesize), metrics, grid):
+                        if idx >= live_end:
+                            break
+                        if progress:
+                            progress.check()
+                        yield idx, header
+                    searched = live_end
+                    live += live_end - live_start
+                if progress:
+                    progress.metrics.add_bytes(live)
+                    progress.advance(window_end - pos)
+                    progress.skip(window_end - pos - live)
+                pos = window_end
+            done = ext_end
+        if progress and stop > done:
+            progress.advance(stop - done)
+            progress.skip(stop - done)
+
+    def _resolve_hit(self, mm, idx: int, sigs: List[Dict], filesize: int, base: int = 0,
+                     metrics: Optional[ScanMetrics] = None, sizes: SizeRange = (None, None)) -> Optional[Dict]:
+        """
+        Carve range and structural check for a header hit; nothing is written yet.
+        mm is the mapping, or for the stream path a window of the device that
+        starts at offset base; the returned offsets are device offsets.
+        Rejected hits are only counted in metrics ("rejects" by reason): most
+        header matches on a disk are random bytes, so a line per reject would
+        flood the log. Read errors are still reported by _try_signature.
+        When the accepted carve is outside sizes (min, max) the offset yields
+        nothing, as in scan_indexed().
+        """
+        for sig in sigs:
+            end, ext, reason = self._try_signature(mm, idx, sig, filesize, base, metrics)
+            if reason is None:
+                if not _size_ok(end - idx, sizes):
+                    if metrics:
+                        metrics.count("rejects", "size_filter")
+                    return None
+                return {"sig": sig, "offset": base + idx, "end": base + end, "ext": ext, "data": None}
+        return None
+
+    def _try_signature(self, mm, idx: int, sig: Dict, filesize: int, base: int = 0,
+                       metrics: Optional[ScanMetrics] = None) -> Tuple[Optional[int], Optional[str], Optional[str]]:
+        """
+        (end, ext, reason) for one signature at a hit; reason is None if the carve
+        is accepted. Reports "carve" and "validate" time and rejects by reason.
+        """
+        header = sig["header"]
+        started = time.perf_counter()
+        validating = None
+        end = ext = reason = None
+        try:
+            end = resolve_length(sig["length"], mm, idx, min(idx + sig["max_size"], filesize), sig["form"])
+            if end is None:
+                end = (
+                    self._carve_with_footer_mmap(mm, idx, header, sig["footer"], sig["max_size"], filesize)
+                    if sig.get("footer")
+                    else self._carve_fixed_mmap(mm, idx, header, sig["max_size"], filesize)
+                )
+            if end is None:
+                reason = "no_carve"
+            elif end - idx < MIN_VALID_SIZE:
+                reason = "too_small"
+            else:
+                ext = self._output_ext(sig, mm[idx:idx + 16])
+                validating = time.perf_counter()
+                reason = validate(ext, mm, idx, end)
+        except InvalidStructure as e:
+            end, ext, reason = None, None, str(e)
+        except Exception as e:
+            print(f"[error] Failed at offset {base + idx}: {e}")
+            end, ext, reason = None, None, "error"
+        if metrics:
+            now = time.perf_counter()
+            metrics.add_time("carve", (validating or now) - started)
+            if validating:
+                metrics.add_time("validate", now - validating)
+            if reason:
+                metrics.count("rejects", reason)
+        return end, ext, reason
+
+    def _scan_stream(self, fd, file_type: FileTypes, output_dir: str, seen_offsets: OffsetIndex,
+                     progress: Optional[ScanProgress] = None, alignment: Optional[Alignment] = None,
+                     embedded: FileTypes = None, exclude: Optional[IntervalSet] = None,
+                     sizes: SizeRange = (None, None)) -> Iterator[Dict]:
+        """
+        Sequential scan for sources that can't be mapped. Chunks are read into one
+        preallocated ring with readinto(); the last few bytes of each chunk are
+        carried to the front of the ring so headers straddling a chunk edge still
+        match. Carves that run past the ring are read with positioned reads, so
+        the main read cursor only ever moves forward one chunk at a time.
+        Excluded ranges are seeked over, and a read never runs into one.
+        """
+        groups, overhang = self._matcher_for(file_type)
+        if not groups:
+            return
+        grid = self._header_grid(groups, alignment, embedded)
+        ring = bytearray(overhang + CHUNK_LOG_BYTES)
+        pending = deque()
+        deep_pool = self._deep_pool()
+        writer = self._output_writer()
+        metrics = progress.metrics if progress else None
+        try:
+            with memoryview(ring) as view:
+                keep = 0
+                base = fd.tell()
+                free_end = None
                 while True:
-                    idx = buffer.find(header, search_pos)
-                    if idx == -1:
+                    if progress:
+                        progress.check()
+                    want = len(ring) - keep
+                    if exclude is not None:
+                        pos = base + keep
+                        free_start, free_end = next(exclude.gaps(pos, _STREAM_END))
+                        if free_start > pos:
+                            fd.seek(free_start)
+                            if progress:
+                                progress.advance(free_start - pos)
+                                progress.skip(free_start - pos)
+                            base, keep = free_start, 0
+                            want = len(ring)
+                        want = min(want, free_end - base - keep)
+                    reading = time.perf_counter()
+                    n = _read_full(fd, view[keep:keep + want])
+                    if metrics:
+                        metrics.add_time("read", time.perf_counter() - reading)
+                        metrics.add_bytes(n)
+                    if not n:
                         break
-                    abs_offset = offset + idx
-                    try:
-                        if any(abs(abs_offset - s) < MIN_OFFSET_GAP for s in seen_offsets):
-                            search_pos = idx + len(header)
-                            continue
-                        seen_offsets.append(abs_offset)
+                    valid = keep + n
+                    eof = n < want
+                    # Nothing follows the read until the excluded range ahead is passed.
+                    cut = free_end is not None and base + valid >= free_end
+                    # Hits in the carried-over tail are taken on the next pass, once the
+                    # rest of their header has been read.
+                    scan_end = valid if eof or cut else valid - overhang
+                    searched = 0
+                    live = 0
+                    for live_start, live_end in _live_ranges(ring, 0, scan_end):
+                        lo = max(live_start - overhang, searched)
+                        for idx, header in self._iter_hits(ring, groups, lo, min(live_end + overhang, valid), metrics,
+                                                           grid, base):
+                            if idx >= live_end:
+                                break
+                            abs_offset = base + idx
+                            if progress:
+                                progress.check()
+                            checking = time.perf_counter()
+                            near = seen_offsets.near(abs_offset, MIN_OFFSET_GAP)
+                            if not near:
+                                seen_offsets.add(abs_offset)
+                            if metrics:
+                                metrics.add_time("offset_check", time.perf_counter() - checking)
+                            if near:
+                                continue
+                            cand = self._resolve_hit_stream(fd, view, valid, idx, abs_offset, groups[header], metrics,
+                                                            sizes)
+                            if cand:
+                                self._queue_candidate(pending, cand, deep_pool, metrics=metrics)
+                                yield from self._drain(pending, output_dir, None, None, progress, writer)
+                        searched = live_end
+                        live += live_end - live_start
+                    if progress:
+                        progress.advance(n)
+                        progress.skip(scan_end - live)
+                    if eof:
+                        break
+                    if cut:
+                        base, keep = base + valid, 0
+                        continue
+                    view[:overhang] = view[valid - overhang:valid]
+                    base += valid - overhang
+                    keep = overhang
+            yield from self._drain(pending, output_dir, None, None, progress, writer, wait_all=True)
+            writer.close()
+        finally:
+            writer.close(cancel=True)
+            if deep_pool:
+                deep_pool.shutdown(cancel_futures=True)
 
-                        data = (
-                            self._read_until_footer_stream(fd, buffer, idx, header, sig["footer"], sig["max_size"])
-                            if sig.get("footer")
-                            else self._read_fixed_stream(fd, buffer, idx, header, sig["max_size"])
-                        )
+    def _resolve_hit_stream(self, fd, view: memoryview, valid: int, idx: int, abs_offset: int,
+                            sigs: List[Dict], metrics: Optional[ScanMetrics] = None,
+                            sizes: SizeRange = (None, None)) -> Optional[Dict]:
+        """
+        Resolve a hit from the ring when its largest possible carve is already
+        buffered; otherwise build a window of the buffered bytes plus a pread()
+        lookahead. Either way the candidate carries a copy of its bytes, since the
+        ring is overwritten by the next chunk.
+        """
+        max_size = max(sig["max_size"] for sig in sigs)
+        if idx + max_size <= valid:
+            window, start, limit = view.obj, idx, valid
+        else:
+            window = bytearray(view[idx:valid])
+            reading = time.perf_counter()
+            _pread_into(fd, window, max_size - len(window), abs_offset + len(window))
+            if metrics:
+                metrics.add_time("read", time.perf_counter() - reading)
+                metrics.add_bytes(len(window) - (valid - idx))
+            start, limit = 0, len(window)
+        cand = self._resolve_hit(window, start, sigs, limit, base=abs_offset - start, metrics=metrics, sizes=sizes)
+        if cand:
+            cand["data"] = bytes(window[start:start + cand["end"] - cand["offset"]])
+        return cand
 
-                        if not data or len(data) < MIN_VALID_SIZE:
-                            search_pos = idx + len(header)
-                            continue
+    def _output_ext(self, sig: Dict, prefix: bytes) -> str:
+        return self.detect_format(prefix) if sig["extension"] in ["jpg", "png", "webp"] else sig["extension"]
 
-                        ext = self.detect_format(data) if sig["extension"] in ["jpg", "png", "webp"] else sig["extension"]
-                        name = f"recovered_{sig['name']}_{abs_offset}.{ext}"
-                        path = self._safe_write(output_dir, name, data)
+    def _deep_pool(self) -> Optional[ThreadPoolExecutor]:
+        if not self.deep_validate or Image is None:
+            return None
+        return ThreadPoolExecutor(max_workers=DEEP_VALIDATE_WORKERS, thread_name_prefix="deep-validate")
 
-                        if ext in ["jpg", "png", "webp"] and not self.is_valid_image(path):
-                            print(f"[warn] Skipping corrupt image: {path}")
-                            search_pos = idx + len(header)
-                            continue
+    def _output_writer(self) -> OutputWriter:
+        return OutputWriter(self.writer_threads, WRITE_BACKLOG, fsync=self.fsync)
 
-                        print(f"[write] {name} -> {path} ({len(data)} bytes)")
-                        results.append({"path": path, "type": sig["name"], "size": len(data), "offset": abs_offset})
-                    except Exception as e:
-                        print(f"[error] Failed at offset {abs_offset}: {e}")
-                    search_pos = idx + len(header)
-            if len(buffer) > FOOTER_WINDOW:
-                buffer = buffer[-FOOTER_WINDOW:]
-            offset += len(chunk)
-        return results
+    def _queue_candidate(self, pending: deque, cand: Dict, deep_pool: Optional[ThreadPoolExecutor],
+                         mm: Optional[mmap.mmap] = None, metrics: Optional[ScanMetrics] = None) -> None:
+        check = None
+        if deep_pool and cand["ext"] in DEEP_VALIDATE_EXTS:
+            data = cand["data"] if cand["data"] is not None else mm[cand["offset"]:cand["end"]]
+            check = deep_pool.submit(_deep_check, bytes(data), metrics)
+        # [candidate, PIL check, write]; write stays None until the candidate is
+        # handed to the writer and is False if the check rejected it.
+        pending.append([cand, check, None])
+
+    def _drain(self, pending: deque, output_dir: str, mm: Optional[mmap.mmap], fileno: Optional[int],
+               progress: Optional[ScanProgress], writer: OutputWriter, wait_all: bool = False) -> Iterator[Dict]:
+        """
+        Hand accepted candidates to the writer in offset order and yield results
+        once their file is written, also in offset order. Without deep validation
+        every candidate is submitted at once; with it, candidates are submitted as
+        PIL checks complete. Blocks once DEEP_VALIDATE_BACKLOG candidates await a
+        check or WRITE_BACKLOG await their write; submitting blocks too while the
+        writer's own queue is full.
+        """
+        for entry in pending:
+            cand, check, write = entry
+            if write is not None:
+                continue
+            if check is not None and not check.done() and not wait_all and len(pending) <= DEEP_VALIDATE_BACKLOG:
+                break
+            if check is not None and not check.result():
+                print(f"[warn] Skipping corrupt image at offset {cand['offset']}")
+                if progress:
+                    progress.metrics.count("rejects", "deep_validate")
+                entry[2] = False
+                continue
+            entry[2] = writer.submit(self._commit, cand, output_dir, mm, fileno, progress.metrics if progress else None)
+        while pending:
+            cand, check, write = pending[0]
+            if write is None:
+                break
+            if write is not False and not write.done() and not wait_all and len(pending) <= WRITE_BACKLOG:
+                break
+            pending.popleft()
+            result = write.result() if write is not False else None
+            if result:
+                writer.track(result["path"])
+                if progress:
+                    progress.add_hit()
+                    progress.metrics.count("hits", result["type"])
+                yield result
+
+    def _output_name(self, cand: Dict) -> str:
+        return f"recovered_{cand['sig']['name']}_{cand['offset']}.{cand['ext']}"
+
+    def _commit(self, cand: Dict, output_dir: str, mm: Optional[mmap.mmap], fileno: Optional[int],
+                metrics: Optional[ScanMetrics] = None) -> Optional[Dict]:
+        sig, idx, end = cand["sig"], cand["offset"], cand["end"]
+        name = self._output_name(cand)
+        digest = existing = None
+        clock = time.perf_counter
+        started = clock()
+        try:
+            if self.dedupe:
+                digest = self._digest(cand, mm)
+                if metrics:
+                    metrics.add_time("hash", clock() - started)
+                    started = clock()
+                with _DIGEST_LOCKS[hash(digest) % len(_DIGEST_LOCKS)]:
+                    existing = lookup(digest, end - idx)
+                    if existing:
+                        path = self._link_duplicate(output_dir, name, existing)
+                    else:
+                        # An older output under this name may be a hardlink; writing through
+                        # it would change the file it is linked to.
+                        self._discard(self._safe_path(output_dir, name))
+                        path = self._write_candidate(cand, output_dir, name, mm, fileno)
+                        record(digest, path, end - idx)
+            else:
+                path = self._write_candidate(cand, output_dir, name, mm, fileno)
+        except Exception as e:
+            print(f"[error] Failed at offset {idx}: {e}")
+            if metrics:
+                metrics.count("rejects", "write_error")
+            return None
+        if metrics:
+            metrics.add_time("write", clock() - started)
+        result = {"path": path, "type": sig["name"], "size": end - idx, "offset": idx}
+        if digest:
+            result["hash"] = digest
+        if existing:
+            print(f"[dedup] {name} -> {existing}")
+            result["duplicate_of"] = existing
+        else:
+            print(f"[write] {name} -> {path} ({end - idx} bytes)")
+        return result
+
+    def _write_candidate(self, cand: Dict, output_dir: str, name: str, mm: Optional[mmap.mmap],
+                         fileno: Optional[int]) -> str:
+        if cand["data"] is not None:
+            return self._safe_write(output_dir, name, cand["data"])
+        return self._safe_write_range(output_dir, name, fileno, mm, cand["offset"], cand["end"])
 
-    def _carve_with_footer_mmap(self, mm: mmap.mmap, start: int, header: bytes, footer: bytes, max_size: int, end: int) -> Optional[bytes]:
+    def _digest(self, cand: Dict, mm: Optional[mmap.mmap]) -> str:
+        if cand["data"] is not None:
+            return content_digest(cand["data"])
+        with memoryview(mm) as view, view[cand["offset"]:cand["end"]] as chunk:
+            return content_digest(chunk)
+
+    def _link_duplicate(self, base_dir: str, name: str, existing: str) -> str:
+        """
+        Hardlink name to a file with identical content. Where links aren't possible
+        (FAT, another filesystem) the existing file is returned as a reference.
+        """
+        out_path = self._safe_path(base_dir, name)
+        if os.path.exists(out_path) and os.path.samefile(out_path, existing):
+            return out_path
+        try:
+            self._discard(out_path)
+            os.link(existing, out_path)
+            return out_path
+        except OSError:
+            return existing
+
+    def _carve_with_footer_mmap(self, mm: mmap.mmap, start: int, header: bytes, footer: bytes, max_size: int, end: int) -> Optional[int]:
+        """End offset (exclusive) of the carve starting at start, or None to skip it."""
         search_end = min(start + FOOTER_WINDOW, end, start + max_size)
         fidx = mm.find(footer, start + len(header), search_end)
         if fidx != -1:
-            return mm[start:fidx + len(footer)]
-        return mm[start:min(start + max_size, end)] if FALLBACK_ON_NO_FOOTER else None
+            return fidx + len(footer)
+        return min(start + max_size, end) if FALLBACK_ON_NO_FOOTER else None
 
-    def _carve_fixed_mmap(self, mm: mmap.mmap, start: int, header: bytes, max_size: int, end: int) -> Optional[bytes]:
-        return mm[start:min(start + max_size, end)]
+    def _carve_fixed_mmap(self, mm: mmap.mmap, start: int, header: bytes, max_size: int, end: int) -> Optional[int]:
+        return min(start + max_size, end)
 
-    def _read_until_footer_stream(self, fd, buffer: bytes, start_idx: int, header: bytes, footer: bytes, max_size: int) -> Optional[bytes]:
-        data = buffer[start_idx:]
-        fidx = data.find(footer, len(header))
-        if fidx != -1:
-            return data[:fidx + len(footer)]
 
-        total = bytes(data)
-        to_read = min(FOOTER_WINDOW, max_size) - len(total)
-        while to_read > 0:
-            more = fd.read(min(to_read, 4 * 1024 * 1024))
-            if not more:
+def _scan_region(recoverer: Recoverer, device_path: str, output_dir: str, file_type: FileTypes,
+                 start: int, stop: int, limit: int, alignment: Optional[Alignment] = None,
+                 embedded: FileTypes = None, exclude: Optional[IntervalSet] = None,
+                 sizes: SizeRange = (None, None)) -> Tuple[List[Dict], int, Dict]:
+    """
+    Worker entry point for Recoverer._scan_parallel: carve headers found in
+    [start, stop). Returns the results, the number of bytes skipped and a
+    snapshot of the region's metrics.
+    """
+    progress = ScanProgress()
+    with open(device_path, "rb") as fd:
+        mm = mmap.mmap(fd.fileno(), length=0, access=mmap.ACCESS_READ)
+        try:
+            results = list(recoverer._scan_mmap(mm, limit, file_type, output_dir, OffsetIndex(), start, stop,
+                                                progress=progress, fileno=fd.fileno(), alignment=alignment,
+                                                embedded=embedded, exclude=exclude, sizes=sizes))
+        finally:
+            mm.close()
+    return results, progress.bytes_skipped, progress.metrics.snapshot()
+
+
+def _size_ok(size: int, sizes: SizeRange) -> bool:
+    min_size, max_size = sizes
+    return not (min_size and size < min_size) and not (max_size and size > max_size)
+
+
+def _data_extents(fileno: Optional[int], start: int, stop: int) -> List[Tuple[int, int]]:
+    """
+    Data extents of [start, stop) in a sparse image file. Holes read back as
+    zeros and can't hold a header, so they are never searched. Falls back to the
+    whole range where SEEK_DATA/SEEK_HOLE isn't supported (block devices, some
+    filesystems, Windows).
+    """
+    if fileno is None or not hasattr(os, "SEEK_DATA"):
+        return [(start, stop)]
+    extents = []
+    pos = start
+    try:
+        while pos < stop:
+            try:
+                data = os.lseek(fileno, pos, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    # Nothing but a hole from pos to the end of the file.
+                    break
+                raise
+            if data >= stop:
                 break
-            total += more
-            to_read -= len(more)
-            fidx = total.find(footer, len(header))
-            if fidx != -1:
-                return total[:fidx + len(footer)]
-
-        return total[:min(len(total), max_size)] if FALLBACK_ON_NO_FOOTER else None
-
-    def _read_fixed_stream(self, fd, buffer: bytes, start_idx: int, header: bytes, max_size: int) -> Optional[bytes]:
-        data = buffer[start_idx:]
-        if len(data) >= max_size:
-            return data[:max_size]
-
-        pieces = [data]
-        need = max_size - len(data)
-        while need > 0:
-            more = fd.read(min(4 * 1024 * 1024, need))
-            if not more:
+            hole = min(os.lseek(fileno, data, os.SEEK_HOLE), stop)
+            extents.append((data, hole))
+            pos = hole
+    except OSError:
+        return [(start, stop)]
+    return extents
+
+
+def _live_ranges(buf, start: int, end: int) -> Iterator[Tuple[int, int]]:
+    """
+    Split [start, end) around whole FILL_BLOCK_BYTES blocks holding a single
+    repeated byte (zeroed or erased space), which can't contain a header.
+    """
+    run_start = pos = start
+    while pos + FILL_BLOCK_BYTES <= end:
+        blk_end = pos + FILL_BLOCK_BYTES
+        if _is_fill(buf, pos, blk_end):
+            if run_start < pos:
+                yield run_start, pos
+            run_start = blk_end
+        pos = blk_end
+    if run_start < end:
+        yield run_start, end
+
+
+def _is_fill(buf, start: int, end: int) -> bool:
+    first = buf[start]
+    # Cheap probes reject almost every block with real data before the full count.
+    if buf[end - 1] != first or buf[(start + end) // 2] != first:
+        return False
+    return buf[start:end].count(buf[start:start + 1]) == end - start
+
+
+def _read_full(fd, view: memoryview) -> int:
+    """readinto() until view is full or the source is exhausted; block devices may return short reads."""
+    got = 0
+    while got < len(view):
+        n = fd.readinto(view[got:])
+        if not n:
+            break
+        got += n
+    return got
+
+
+def _pread_into(fd, out: bytearray, size: int, offset: int) -> None:
+    """Append up to size bytes read at offset to out without moving fd's read position."""
+    if hasattr(os, "pread"):
+        end = len(out) + size
+        while len(out) < end:
+            chunk = os.pread(fd.fileno(), end - len(out), offset)
+            if not chunk:
                 break
-            pieces.append(more)
-            need -= len(more)
+            out += chunk
+            offset += len(chunk)
+        return
+    pos = fd.tell()
+    try:
+        fd.seek(offset)
+        out += fd.read(size)
+    finally:
+        fd.seek(pos)
+
+
+def _kernel_copy(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    if hasattr(os, "copy_file_range"):
+        return os.copy_file_range(src_fd, dst_fd, count, offset)
+    if hasattr(os, "sendfile"):
+        return os.sendfile(dst_fd, src_fd, offset, count)
+    raise OSError("No kernel-side copy available")
+
 
-        return b"".join(pieces)[:max_size]
+def _deep_check(data: bytes, metrics: Optional[ScanMetrics] = None) -> bool:
+    started = time.perf_counter()
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+        return True
+    except Exception:
+        return False
+    finally:
+        if metrics:
+            metrics.add_time("deep_validate", time.perf_counter() - started)
@@ -0,0 +1,139 @@
+import sqlite3
+import os
+import hashlib
+from itertools import islice
+
+INDEX_PATH = os.path.join(os.path.dirname(__file__), "scan_index.db")
+SAMPLE_BYTES = 1024 * 1024
+# Hits written per transaction while an index is built, so the database is
+# never locked for the length of a device scan.
+STORE_BATCH = 5000
+
+# Status stored for a hit whose carve passed every check; anything else is the
+# rejection reason.
+STATUS_OK = "ok"
+
+def init_index():
+    with sqlite3.connect(INDEX_PATH) as conn:
+        # Readers don't wait for a build's batches, and batches of concurrent
+        # builds only wait for each other's short commits.
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sample_hash TEXT NOT NULL,
+                signatures TEXT NOT NULL,
+                complete INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (path, size, mtime_ns, sample_hash, signatures)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS hits (
+                image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+                offset INTEGER NOT NULL,
+                signature TEXT NOT NULL,
+                extension TEXT,
+                end_offset INTEGER,
+                status TEXT NOT NULL,
+                PRIMARY KEY (image_id, offset, signature)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS outputs (
+                image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+                offset INTEGER NOT NULL,
+                signature TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                PRIMARY KEY (image_id, offset, signature)
+            )
+        """)
+        conn.commit()
+
+def image_identity(path):
+    """
+    (path, size, mtime_ns, sample_hash) for an image. The hash covers the first,
+    middle and last SAMPLE_BYTES so a rewritten image with the same size and a
+    preserved mtime is still told apart without reading all of it.
+    """
+    st = os.stat(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        for pos in sorted({0, max(size // 2 - SAMPLE_BYTES // 2, 0), max(size - SAMPLE_BYTES, 0)}):
+            f.seek(pos)
+            digest.update(f.read(SAMPLE_BYTES))
+    digest.update(str(size).encode())
+    return os.path.realpath(path), size, st.st_mtime_ns, digest.hexdigest()
+
+def find_image(identity, signatures):
+    """id of a complete index for this image and signature set, or None."""
+    with sqlite3.connect(INDEX_PATH) as conn:
+        cur = conn.execute(
+            "SELECT id FROM images WHERE path = ? AND size = ? AND mtime_ns = ? AND sample_hash = ? "
+            "AND signatures = ? AND complete = 1",
+            (*identity, signatures))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+def store_scan(identity, signatures, hits):
+    """
+    Record every hit (offset, signature, extension, end_offset, status) of a full
+    scan. Older indexes for the same path are dropped. Hits are written
+    STORE_BATCH at a time, each batch in its own transaction, and the index is
+    only marked complete once all of them are in, so an interrupted scan is
+    never used.
+    """
+    with sqlite3.connect(INDEX_PATH) as conn:
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("DELETE FROM images WHERE path = ?", (identity[0],))
+        cur = conn.execute(
+            "INSERT INTO images (path, size, mtime_ns, sample_hash, signatures) VALUES (?, ?, ?, ?, ?)",
+            (*identity, signatures))
+        image_id = cur.lastrowid
+        conn.commit()
+        hits = iter(hits)
+        while True:
+            # Taken from the scan before the transaction opens; the scan runs
+            # between batches with nothing locked.
+            batch = [(image_id, *hit) for hit in islice(hits, STORE_BATCH)]
+            if not batch:
+                break
+            conn.executemany(
+                "INSERT OR REPLACE INTO hits (image_id, offset, signature, extension, end_offset, status) "
+                "VALUES (?, ?, ?, ?, ?, ?)", batch)
+            conn.commit()
+        conn.execute("UPDATE images SET complete = 1 WHERE id = ?", (image_id,))
+        conn.commit()
+        return image_id
+
+def query_hits(image_id, signatures=None):
+    """Hits for the given signature names (all if None) in offset order."""
+    sql = "SELECT offset, signature, extension, end_offset, status FROM hits WHERE image_id = ?"
+    params = [image_id]
+    if signatures is not None:
+        sql += " AND signature IN (%s)" % ",".join("?" * len(signatures))
+        params.extend(signatures)
+    with sqlite3.connect(INDEX_PATH) as conn:
+        return conn.execute(sql + " ORDER BY offset", params).fetchall()
+
+def query_outputs(image_id):
+    """{(offset, signature): (path, size, inode, mtime_ns)} for files written from this index."""
+    with sqlite3.connect(INDEX_PATH) as conn:
+        rows = conn.execute("SELECT offset, signature, path, size, inode, mtime_ns FROM outputs WHERE image_id = ?",
+                            (image_id,))
+        return {(row[0], row[1]): row[2:] for row in rows}
+
+def record_outputs(image_id, outputs):
+    """Remember written files as (offset, signature, path, size, inode, mtime_ns) rows for this index."""
+    with sqlite3.connect(INDEX_PATH) as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO outputs (image_id, offset, signature, path, size, inode, mtime_ns) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((image_id, *row) for row in outputs))
+        conn.commit()
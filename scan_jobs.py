@@ -0,0 +1,177 @@
+import os
+import time
+import tempfile
+import uuid
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from src.core.scan_metrics import TOTALS, profiled
+from src.core.scan_progress import ScanProgress, ScanCancelled
+
+MAX_CONCURRENT_SCANS = 2
+MAX_SCANS_PER_DEVICE = 1
+JOB_HISTORY = 200
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), "recoverease-profiles")
+
+
+class ScanJob:
+    def __init__(self, kind: str, device: str, fn: Callable[[ScanProgress], Any], profile: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.device = device
+        self.fn = fn
+        self.profile = profile
+        self.profile_path: Optional[str] = None
+        self.status = "queued"
+        self.progress = ScanProgress()
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def to_dict(self, include_result: bool = True) -> Dict:
+        info = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "device": self.device,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.progress.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.profile_path:
+            info["profile_path"] = self.profile_path
+        info.update(self.progress.snapshot())
+        if include_result and self.status == "done":
+            info["result"] = self.result
+        return info
+
+
+class JobManager:
+    """
+    Runs scans on a bounded thread pool. Jobs on the same device are serialized
+    (up to per_device scans at once); the rest wait in a per-device queue so they
+    don't hold a pool thread while the disk is busy.
+    A job submitted with profile ("cprofile" or "pyinstrument") runs under that
+    profiler and its report is written to profile_dir.
+    """
+
+    def __init__(self, max_workers: int = MAX_CONCURRENT_SCANS, per_device: int = MAX_SCANS_PER_DEVICE,
+                 profile_dir: str = PROFILE_DIR):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scan-job")
+        self._per_device = per_device
+        self._profile_dir = profile_dir
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, ScanJob]" = OrderedDict()
+        self._active: Dict[str, int] = {}
+        self._waiting: Dict[str, deque] = {}
+
+    def _device_key(self, device: str) -> str:
+        return os.path.normcase(os.path.realpath(device))
+
+    def submit(self, kind: str, device: str, fn: Callable[[ScanProgress], Any],
+               profile: Optional[str] = None) -> ScanJob:
+        job = ScanJob(kind, device, fn, profile)
+        key = self._device_key(device)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim_history()
+            if self._active.get(key, 0) < self._per_device:
+                self._active[key] = self._active.get(key, 0) + 1
+                self._pool.submit(self._run, job, key)
+            else:
+                self._waiting.setdefault(key, deque()).append(job)
+        return job
+
+    def run_now(self, kind: str, device: str, fn: Callable[[ScanProgress], Any]) -> Optional[ScanJob]:
+        """
+        Run a short job in the calling thread (work a request has to wait for)
+        if its device has a free slot, and return it finished; None when the
+        device is at its cap or has jobs waiting. The job holds a device slot
+        and is listed like any other, so it can be cancelled.
+        """
+        job = ScanJob(kind, device, fn)
+        key = self._device_key(device)
+        with self._lock:
+            if self._active.get(key, 0) >= self._per_device or self._waiting.get(key):
+                return None
+            self._active[key] = self._active.get(key, 0) + 1
+            self._jobs[job.id] = job
+            self._trim_history()
+        self._run(job, key)
+        return job
+
+    def get(self, job_id: str) -> Optional[ScanJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[ScanJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[ScanJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job.finished:
+                return job
+            job.progress.cancel()
+            if job.status == "queued":
+                waiting = self._waiting.get(self._device_key(job.device))
+                if waiting and job in waiting:
+                    waiting.remove(job)
+                    self._finish(job, "cancelled")
+        return job
+
+    def _run(self, job: ScanJob, key: str) -> None:
+        try:
+            if job.progress.cancelled:
+                self._finish(job, "cancelled")
+                return
+            job.status = "running"
+            job.progress.start()
+            try:
+                with profiled(job.profile, self._profile_dir, f"{job.kind}-{job.id[:8]}") as job.profile_path:
+                    job.result = job.fn(job.progress)
+                self._finish(job, "done")
+            except ScanCancelled:
+                self._finish(job, "cancelled")
+            except PermissionError:
+                self._finish(job, "failed", "Permission denied. Run as admin/root for raw devices.")
+            except Exception as e:
+                print(f"[job] {job.kind} {job.id} failed: {e}")
+                self._finish(job, "failed", str(e))
+        finally:
+            self._release(key)
+
+    def _release(self, key: str) -> None:
+        with self._lock:
+            waiting = self._waiting.get(key)
+            if waiting:
+                self._pool.submit(self._run, waiting.popleft(), key)
+                return
+            self._waiting.pop(key, None)
+            self._active[key] -= 1
+            if not self._active[key]:
+                del self._active[key]
+
+    def _finish(self, job: ScanJob, status: str, error: Optional[str] = None) -> None:
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        # Fold the job's stage timings into the process totals served by /api/metrics.
+        TOTALS.merge(job.progress.metrics.snapshot())
+        TOTALS.count("scans", status)
+
+    def _trim_history(self) -> None:
+        while len(self._jobs) > JOB_HISTORY:
+            oldest = next((jid for jid, j in self._jobs.items() if j.finished), None)
+            if oldest is None:
+                break
+            del self._jobs[oldest]
@@ -0,0 +1,186 @@
+import os
+import time
+import threading
+import cProfile
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    from pyinstrument import Profiler
+    HAS_PYINSTRUMENT = True
+except ImportError:
+    HAS_PYINSTRUMENT = False
+
+METRIC_PREFIX = "recoverease"
+# Label name each counter family is exported with.
+COUNTER_LABELS = {"hits": "signature", "rejects": "reason", "files": "type", "scans": "status"}
+PROFILERS = ("cprofile", "pyinstrument")
+# One profiling session at a time: since Python 3.12 a second cProfile can't be
+# enabled while another one is active.
+_PROFILE_LOCK = threading.Lock()
+
+
+class ScanMetrics:
+    """
+    Per-stage timers and labelled counters for a scan. Scanners time each stage
+    (search, carve, validate, write, ...) and count hits and rejects; all
+    methods are thread-safe, so writer and extraction threads report into the
+    same object. snapshot() is a plain dict that merge() accepts, which is how
+    worker processes and finished jobs are folded into a total.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bytes_read = 0
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage: str, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + calls
+
+    def add_bytes(self, nbytes: int) -> None:
+        with self._lock:
+            self.bytes_read += nbytes
+
+    def count(self, name: str, label: str, n: int = 1) -> None:
+        with self._lock:
+            family = self.counters.setdefault(name, {})
+            family[label] = family.get(label, 0) + n
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "bytes_read": self.bytes_read,
+                "stages": {s: {"seconds": round(self.seconds[s], 6), "calls": self.calls[s]} for s in self.seconds},
+                "counters": {name: dict(family) for name, family in self.counters.items()},
+            }
+
+    def merge(self, snapshot: Dict) -> None:
+        with self._lock:
+            self.bytes_read += snapshot.get("bytes_read", 0)
+            for stage, t in snapshot.get("stages", {}).items():
+                self.seconds[stage] = self.seconds.get(stage, 0.0) + t["seconds"]
+                self.calls[stage] = self.calls.get(stage, 0) + t["calls"]
+            for name, family in snapshot.get("counters", {}).items():
+                mine = self.counters.setdefault(name, {})
+                for label, n in family.items():
+                    mine[label] = mine.get(label, 0) + n
+
+    def summary(self) -> str:
+        """Two-line human summary for the console."""
+        snap = self.snapshot()
+        stages = " | ".join(f"{s} {t['seconds']:.2f}s/{t['calls']}" for s, t in sorted(snap["stages"].items()))
+        lines = [f"[metrics] read {snap['bytes_read'] / (1024 * 1024):.1f} MiB | {stages or 'no stages timed'}"]
+        families = []
+        for name, family in sorted(snap["counters"].items()):
+            top = sorted(family.items(), key=lambda kv: -kv[1])
+            families.append(f"{name}: " + " ".join(f"{label}={n}" for label, n in top))
+        if families:
+            lines.append("[metrics] " + " | ".join(families))
+        return "\n".join(lines)
+
+
+# Totals over every finished scan in this process, for /api/metrics.
+TOTALS = ScanMetrics()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_prometheus(snapshot: Dict, gauges: Optional[Dict[Tuple[str, str, str], float]] = None) -> str:
+    """
+    Prometheus text exposition of a ScanMetrics snapshot. gauges maps
+    (name, label, value) to a number for point-in-time values such as jobs by
+    status; label may be empty for an unlabelled gauge.
+    """
+    p = METRIC_PREFIX
+    out = [
+        f"# HELP {p}_bytes_read_total Bytes read from scanned sources.",
+        f"# TYPE {p}_bytes_read_total counter",
+        f"{p}_bytes_read_total {snapshot.get('bytes_read', 0)}",
+        f"# HELP {p}_stage_seconds_total Time spent in each scan stage.",
+        f"# TYPE {p}_stage_seconds_total counter",
+    ]
+    stages = sorted(snapshot.get("stages", {}).items())
+    out += [f'{p}_stage_seconds_total{{stage="{_escape(s)}"}} {t["seconds"]}' for s, t in stages]
+    out += [f"# HELP {p}_stage_calls_total Timed calls of each scan stage.",
+            f"# TYPE {p}_stage_calls_total counter"]
+    out += [f'{p}_stage_calls_total{{stage="{_escape(s)}"}} {t["calls"]}' for s, t in stages]
+    for name, family in sorted(snapshot.get("counters", {}).items()):
+        label = COUNTER_LABELS.get(name, "label")
+        out += [f"# TYPE {p}_{name}_total counter"]
+        out += [f'{p}_{name}_total{{{label}="{_escape(v)}"}} {n}' for v, n in sorted(family.items())]
+    seen = set()
+    for (name, label, value), n in sorted((gauges or {}).items()):
+        if name not in seen:
+            out.append(f"# TYPE {p}_{name} gauge")
+            seen.add(name)
+        out.append(f'{p}_{name}{{{label}="{_escape(value)}"}} {n}' if label else f"{p}_{name} {n}")
+    return "\n".join(out) + "\n"
+
+
+@contextmanager
+def profiled(profiler: Optional[str], out_dir: str, name: str) -> Iterator[Optional[str]]:
+    """
+    Profile the calling thread while the block runs and write the result to
+    out_dir: a .prof file (pstats/snakeviz) for "cprofile", an .html report for
+    "pyinstrument". Yields the report path, or None when profiler is empty or
+    another profile is already running. Writer threads and worker processes
+    are not included.
+    """
+    if not profiler:
+        yield None
+        return
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler {profiler!r}; expected one of {', '.join(PROFILERS)}")
+    if profiler == "pyinstrument" and not HAS_PYINSTRUMENT:
+        print("[warn] pyinstrument is not installed; using cProfile")
+        profiler = "cprofile"
+    if not _PROFILE_LOCK.acquire(blocking=False):
+        print(f"[warn] Another profile is running; {name} is not profiled")
+        yield None
+        return
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        if profiler == "pyinstrument":
+            path = os.path.join(out_dir, f"{name}-{stamp}.html")
+            prof = Profiler()
+            prof.start()
+            try:
+                yield path
+            finally:
+                prof.stop()
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(prof.output_html())
+                print(f"[profile] {name} -> {path}")
+        else:
+            path = os.path.join(out_dir, f"{name}-{stamp}.prof")
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError as e:
+                # A profiler started outside this module (debugger, coverage tool).
+                print(f"[warn] Cannot profile {name}: {e}")
+                yield None
+                return
+            try:
+                yield path
+            finally:
+                prof.disable()
+                prof.dump_stats(path)
+                print(f"[profile] {name} -> {path}")
+    finally:
+        _PROFILE_LOCK.release()
@@ -0,0 +1,78 @@
+import threading
+import time
+from typing import Dict, Optional
+
+from src.core.scan_metrics import ScanMetrics
+
+
+class ScanCancelled(Exception):
+    pass
+
+
+class ScanProgress:
+    """
+    Live counters for one scan, shared between the scanner and whoever launched it.
+    Scanners call advance()/add_hit() as they go and check() between units of work
+    so a cancel request stops them at the next window or directory entry.
+    Per-stage timers and counters for the same scan live in metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self.total_bytes = 0
+        self.bytes_scanned = 0
+        self.bytes_skipped = 0
+        self.hits = 0
+        self.started_at: Optional[float] = None
+        self.metrics = ScanMetrics()
+
+    def start(self, total_bytes: int = 0) -> None:
+        with self._lock:
+            self.total_bytes = total_bytes
+            if self.started_at is None:
+                self.started_at = time.time()
+
+    def advance(self, nbytes: int) -> None:
+        with self._lock:
+            self.bytes_scanned += nbytes
+
+    def skip(self, nbytes: int) -> None:
+        """Record bytes that were passed over without searching (holes, constant fill)."""
+        with self._lock:
+            self.bytes_skipped += nbytes
+
+    def add_hit(self, count: int = 1) -> None:
+        with self._lock:
+            self.hits += count
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check(self) -> None:
+        if self._cancel.is_set():
+            raise ScanCancelled("Scan cancelled")
+
+    def eta(self) -> Optional[float]:
+        with self._lock:
+            if not self.started_at or not self.total_bytes or not self.bytes_scanned:
+                return None
+            elapsed = time.time() - self.started_at
+            remaining = max(self.total_bytes - self.bytes_scanned, 0)
+            return elapsed * remaining / self.bytes_scanned
+
+    def snapshot(self) -> Dict:
+        eta = self.eta()
+        with self._lock:
+            return {
+                "total_bytes": self.total_bytes,
+                "bytes_scanned": self.bytes_scanned,
+                "bytes_skipped": self.bytes_skipped,
+                "hits": self.hits,
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "metrics": self.metrics.snapshot(),
+            }
@@ -28,6 +28,11 @@ async function scanUnified() {
 
   statusEl.textContent = `Scanning (${mode})...`;
 
+  if (mode === "carve") {
+    streamScan(device_path, fileType || "jpg", statusEl);
+    return;
+  }
+
   let endpoint = mode === "deleted" ? "/api/deleted_scan" : "/api/scan";
   let payload = {
     image_path: device_path,
@@ -43,7 +48,8 @@ async function scanUnified() {
       start_date: start_date || null,
       end_date: end_date || null,
       min_size: minSize,
-      name_filter: nameFilter || null
+      name_filter: nameFilter || null,
+      list_only: true
     };
   }
 
@@ -60,27 +66,123 @@ async function scanUnified() {
       return;
     }
 
-    statusEl.textContent = `Recovered ${data.count} file(s).`;
-    renderResults(data.results);
+    const job = await waitForJob(data.job_id, statusEl);
+    if (job.status !== "done") {
+      statusEl.textContent = job.status === "cancelled" ? "Scan cancelled." : "Error: " + (job.error || "Unknown error");
+      return;
+    }
+
+    statusEl.textContent = job.result.listing
+      ? `Found ${job.result.count} deleted file(s). Files are extracted when downloaded.`
+      : `Recovered ${job.result.count} file(s).`;
+    renderResults(job.result.results);
   } catch (e) {
     statusEl.textContent = "Error: " + e.message;
   }
 }
 
+let currentJobId = null;
+
+async function waitForJob(jobId, statusEl) {
+  currentJobId = jobId;
+  document.getElementById("cancel-scan").style.display = "inline-block";
+  try {
+    while (true) {
+      const resp = await fetch(`/api/jobs/${jobId}`);
+      const job = await resp.json();
+      if (!resp.ok) {
+        throw new Error(job.error || "Unknown job");
+      }
+      if (["done", "failed", "cancelled"].includes(job.status)) {
+        return job;
+      }
+      statusEl.textContent = formatProgress(job);
+      await new Promise(r => setTimeout(r, 1000));
+    }
+  } finally {
+    currentJobId = null;
+    document.getElementById("cancel-scan").style.display = "none";
+  }
+}
+
+function formatProgress(job) {
+  if (job.status === "queued") {
+    return "Waiting for the device to become free...";
+  }
+  let text = `Scanning... ${(job.bytes_scanned / 1048576).toFixed(0)} MB`;
+  if (job.total_bytes) {
+    text += ` of ${(job.total_bytes / 1048576).toFixed(0)} MB`;
+  }
+  if (job.bytes_skipped) {
+    text += ` (${(job.bytes_skipped / 1048576).toFixed(0)} MB empty, skipped)`;
+  }
+  text += `, ${job.hits} hit(s)`;
+  if (job.eta_seconds !== null) {
+    text += `, ~${Math.ceil(job.eta_seconds)}s left`;
+  }
+  return text;
+}
+
+async function cancelScan() {
+  if (currentJobId) {
+    await fetch(`/api/jobs/${currentJobId}/cancel`, { method: "POST" });
+  }
+}
+
+function streamScan(device_path, extension, statusEl) {
+  const params = new URLSearchParams({ image_path: device_path, extension: extension });
+  const source = new EventSource(`/api/scan/stream?${params}`);
+  let count = 0;
+
+  document.querySelector("#results-table tbody").innerHTML = "";
+
+  source.addEventListener("job", e => {
+    currentJobId = JSON.parse(e.data).job_id;
+    document.getElementById("cancel-scan").style.display = "inline-block";
+  });
+  source.addEventListener("result", e => {
+    count += 1;
+    appendResult(JSON.parse(e.data));
+  });
+  source.addEventListener("progress", e => {
+    statusEl.textContent = formatProgress(JSON.parse(e.data));
+  });
+  source.addEventListener("done", e => {
+    const job = JSON.parse(e.data);
+    source.close();
+    currentJobId = null;
+    document.getElementById("cancel-scan").style.display = "none";
+    if (job.status === "done") {
+      statusEl.textContent = `Recovered ${count} file(s).`;
+    } else {
+      statusEl.textContent = job.status === "cancelled" ? "Scan cancelled." : "Error: " + (job.error || "Unknown error");
+    }
+  });
+  source.onerror = () => {
+    // Don't let EventSource reconnect: that would start a second scan.
+    source.close();
+    currentJobId = null;
+    document.getElementById("cancel-scan").style.display = "none";
+    statusEl.textContent = "Error: connection to the scan was lost.";
+  };
+}
+
+function appendResult(r) {
+  const tr = document.createElement("tr");
+  tr.innerHTML = `
+    <td>${r.filename}</td>
+    <td>${r.type}</td>
+    <td>${(r.size / 1024).toFixed(1)} KB</td>
+    <td>${r.mtime || "—"}</td>
+    <td><a href="/downloads/${encodeURIComponent(r.filename)}" download>Download</a></td>
+  `;
+  document.querySelector("#results-table tbody").appendChild(tr);
+}
+
 function renderResults(results) {
   const tbody = document.querySelector("#results-table tbody");
   tbody.innerHTML = "";
-  results.forEach(r => {
-    const tr = document.createElement("tr");
-    tr.innerHTML = `
-      <td>${r.filename}</td>
-      <td>${r.type}</td>
-      <td>${(r.size / 1024).toFixed(1)} KB</td>
-      <td>${r.mtime || "—"}</td>
-      <td><a href="/downloads/${encodeURIComponent(r.filename)}" download>Download</a></td>
-    `;
-    tbody.appendChild(tr);
-  });
+  results.forEach(appendResult);
 }
 function runDeepCarve(imagePath, tool = "photorec") {
     fetch("/api/deep_carve", {
@@ -101,5 +203,6 @@ document.addEventListener("DOMContentLoaded", () => {
     e.preventDefault();
     scanUnified();
   });
+  document.getElementById("cancel-scan").addEventListener("click", cancelScan);
 });
 
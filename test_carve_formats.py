@@ -0,0 +1,37 @@
+import json
+import os
+import struct
+
+import pytest
+
+from carve_formats import InvalidStructure, resolve_length
+
+SIGNATURE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "file_signatures.json")
+
+
+def riff(form, body):
+    return b"RIFF" + struct.pack("<I", 4 + len(body)) + form + body
+
+
+def signatures():
+    with open(SIGNATURE_FILE, "r", encoding="utf-8") as f:
+        specs = json.load(f)
+    return {name: (spec["length"], spec["form"].encode("ascii")) for name, spec in specs.items() if "form" in spec}
+
+
+def test_riff_form_picks_the_signature():
+    wav = riff(b"WAVE", b"fmt " + struct.pack("<I", 16) + bytes(16) + b"data" + struct.pack("<I", 64) + bytes(64))
+    avi = riff(b"AVI ", b"LIST" + struct.pack("<I", 4) + b"hdrl")
+    image = bytes(512) + wav + bytes(512) + avi + bytes(512)
+    wav_at, avi_at = 512, 1024 + len(wav)
+    sigs = signatures()
+
+    length, form = sigs["WAV"]
+    assert resolve_length(length, image, wav_at, len(image), form) == wav_at + len(wav)
+    with pytest.raises(InvalidStructure):
+        resolve_length(length, image, avi_at, len(image), form)
+
+    length, form = sigs["AVI"]
+    assert resolve_length(length, image, avi_at, len(image), form) == avi_at + len(avi)
+    with pytest.raises(InvalidStructure):
+        resolve_length(length, image, wav_at, len(image), form)
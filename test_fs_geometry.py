@@ -0,0 +1,68 @@
+import os
+import stat
+import types
+
+import pytest
+
+from src.core import fs_geometry
+
+
+@pytest.fixture
+def block_device(tmp_path, monkeypatch):
+    """A fake block device node whose sysfs write counters live in tmp_path, and a count of table walks."""
+    node = str(tmp_path / "sdx")
+    counters = tmp_path / "8:16.stat"
+    real_stat = os.stat
+
+    def fake_stat(path, *args, **kwargs):
+        if path == node:
+            return types.SimpleNamespace(st_mode=stat.S_IFBLK | 0o660, st_size=0, st_mtime_ns=1,
+                                         st_rdev=os.makedev(8, 16))
+        return real_stat(path, *args, **kwargs)
+
+    walks = []
+
+    def fake_walk(img, offset, prefix, depth, found):
+        walks.append(offset)
+        found.append({"id": "1", "offset": 1048576, "size": 4096, "desc": "Linux", "block_size": 4096})
+        return True
+
+    fake_tsk = types.SimpleNamespace(Img_Info=lambda path: types.SimpleNamespace(get_size=lambda: 8192))
+    monkeypatch.setattr(fs_geometry.os, "stat", fake_stat)
+    monkeypatch.setattr(fs_geometry, "SYSFS_BLOCK_STAT", str(tmp_path / "{}:{}.stat"))
+    monkeypatch.setattr(fs_geometry, "HAS_PYTSK", True)
+    monkeypatch.setattr(fs_geometry, "pytsk3", fake_tsk, raising=False)
+    monkeypatch.setattr(fs_geometry, "_walk_volumes", fake_walk)
+    return node, counters, walks
+
+
+def write_counters(path, writes, sectors):
+    path.write_text(f"10 0 80 5 {writes} 0 {sectors} 3 0 8 8 0 0 0 0 0 0\n")
+
+
+def test_block_device_cache_invalidated_by_writes(block_device):
+    node, counters, walks = block_device
+    write_counters(counters, 1, 8)
+    fs_geometry.list_filesystems(node)
+    fs_geometry.list_filesystems(node)
+    assert len(walks) == 1
+
+    write_counters(counters, 2, 16)
+    fs_geometry.list_filesystems(node)
+    assert len(walks) == 2
+
+
+def test_block_device_without_counters_is_not_cached(block_device):
+    node, counters, walks = block_device
+    assert fs_geometry.image_key(node) is None
+    fs_geometry.list_filesystems(node)
+    fs_geometry.list_filesystems(node)
+    assert len(walks) == 2
+
+
+def test_regular_image_key_follows_mtime(tmp_path):
+    image = tmp_path / "disk.img"
+    image.write_bytes(b"\0" * 512)
+    before = fs_geometry.image_key(str(image))
+    os.utime(image, ns=(0, 1))
+    assert fs_geometry.image_key(str(image)) != before
@@ -1,12 +1,19 @@
 import os
+import json
+import time
+import queue
 import datetime
 import psutil
 import subprocess
-from flask import Flask, request, jsonify, send_from_directory, session, redirect
+from flask import Flask, Response, request, jsonify, send_from_directory, session, redirect
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from src.core.recoverer import Recoverer
-from src.core.deleted_scanner import DeletedScanner
+from src.core.deleted_scanner import DeletedScanner, find_listed
+from src.core.fs_geometry import allocated_space, detect_alignment, list_filesystems
+from src.core.scan_jobs import JobManager
+from src.core.scan_metrics import TOTALS, render_prometheus
+from src.core.scan_progress import ScanCancelled
 from src.utils.os_helpers import ensure_temp_dir, resolve_device_path, is_admin
 from src.auth.db import init_db, register_user, verify_user
 
@@ -16,12 +23,20 @@ DATA_DIR = os.path.abspath(os.path.join(APP_ROOT, "..", "data"))
 OUTPUT_DIR = os.path.abspath(os.path.join(APP_ROOT, "..", "temp_downloads"))
 DELETED_DIR = os.path.abspath(os.path.join(APP_ROOT, "..", "temp_deleted"))
 SIGNATURE_FILE = os.path.join(DATA_DIR, "file_signatures.json")
+STREAM_QUEUE_SIZE = 256
+STREAM_PROGRESS_INTERVAL = 1.0
+PROFILE_DIR = os.path.abspath(os.path.join(APP_ROOT, "..", "profiles"))
+# Profiler for every job ("cprofile" or "pyinstrument") unless a request names one.
+DEFAULT_PROFILER = os.environ.get("RECOVER_PROFILE")
+ALIGN_ERROR = 'align must be true, "auto" or a cluster size in bytes'
+SIZE_ERROR = "min_size and max_size must be whole numbers of bytes"
 
 app = Flask(__name__, static_folder=STATIC_DIR, template_folder=STATIC_DIR)
 app.secret_key = "your-secret-key"
 init_db()
 
 recoverer = Recoverer(SIGNATURE_FILE)
+jobs = JobManager(profile_dir=PROFILE_DIR)
 ensure_temp_dir(OUTPUT_DIR)
 ensure_temp_dir(DELETED_DIR)
 
@@ -88,6 +103,16 @@ def scan():
     extension = payload.get("extension", "jpg")
     start_date = payload.get("start_date")
     end_date = payload.get("end_date")
+    embedded = payload.get("embedded")
+    unallocated = bool(payload.get("unallocated"))
+    try:
+        workers = max(1, min(int(payload.get("workers", 1)), os.cpu_count() or 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "workers must be an integer"}), 400
+    try:
+        align = _align_option(payload.get("align"))
+    except (TypeError, ValueError):
+        return jsonify({"error": ALIGN_ERROR}), 400
 
     try:
         image_path = resolve_device_path(raw_path)
@@ -97,11 +122,16 @@ def scan():
     if not image_path:
         return jsonify({"error": "Missing image_path"}), 400
 
-    try:
+    def run(progress):
         results = recoverer.scan_device(
             device_path=image_path,
             output_dir=OUTPUT_DIR,
-            file_type=extension
+            file_type=extension,
+            workers=workers,
+            progress=progress,
+            alignment=_alignment(image_path, align),
+            embedded=embedded,
+            exclude=_excluded(image_path, unallocated, progress)
         )
 
         def parse_date(d):
@@ -126,14 +156,143 @@ def scan():
             r["mtime"] = datetime.datetime.fromtimestamp(mtime).isoformat() if mtime else None
             filtered.append(r)
 
-        return jsonify({"count": len(filtered), "results": filtered})
+        return {"count": len(filtered), "results": filtered}
+
+    job = jobs.submit("scan", image_path, run, profile=payload.get("profile") or DEFAULT_PROFILER)
+    return jsonify({"job_id": job.id, "status": job.status}), 202
+
+def _align_option(value):
+    """
+    The "align" option of the carving endpoints: false/absent searches every
+    offset, true or "auto" aligns to the detected cluster size, a number is the
+    cluster size in bytes. Returns None, 0 (detect) or the size.
+    """
+    if not value or str(value).lower() in ("false", "0", "off"):
+        return None
+    if value is True or str(value).lower() in ("true", "auto"):
+        return 0
+    size = int(value)
+    if size < 1:
+        raise ValueError(f"invalid cluster size {size}")
+    return size
+
+def _size_option(value):
+    """A min_size/max_size option: None when absent, otherwise a non-negative byte count."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"invalid size {value!r}")
+    size = int(value)
+    if size < 0:
+        raise ValueError(f"invalid size {size}")
+    return size
+
+def _alignment(device_path, align):
+    return None if align is None else detect_alignment(device_path, align or None)
+
+def _excluded(device_path, unallocated, progress):
+    """Allocated space to leave out of a carve that was asked for unallocated space only."""
+    return allocated_space(device_path, progress) if unallocated else None
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/api/scan/stream", methods=["GET"])
+def scan_stream():
+    """
+    Server-Sent Events variant of /api/scan: emits a "result" event per carved
+    file as it is written, "progress" events every STREAM_PROGRESS_INTERVAL
+    seconds, and a final "done" event. Closing the stream cancels the scan.
+    """
+    if "user" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    raw_path = request.args.get("image_path")
+    extension = request.args.get("extension", "jpg")
+    embedded = request.args.get("embedded")
+    unallocated = request.args.get("unallocated", "").lower() in ("1", "true", "yes")
+    try:
+        workers = max(1, min(int(request.args.get("workers", 1)), os.cpu_count() or 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "workers must be an integer"}), 400
+    try:
+        align = _align_option(request.args.get("align"))
+    except (TypeError, ValueError):
+        return jsonify({"error": ALIGN_ERROR}), 400
 
-    except PermissionError:
-        return jsonify({"error": "Permission denied. Run as admin/root for raw devices."}), 403
-    except FileNotFoundError as e:
-        return jsonify({"error": str(e)}), 404
+    try:
+        image_path = resolve_device_path(raw_path)
     except Exception as e:
-        return jsonify({"error": f"Scan failed: {e}"}), 500
+        return jsonify({"error": f"Invalid device path: {e}"}), 400
+
+    if not image_path:
+        return jsonify({"error": "Missing image_path"}), 400
+
+    # Bounded so a slow client applies backpressure to the scan instead of
+    # letting results pile up in memory.
+    events = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+    def run(progress):
+        count = 0
+        for r in recoverer.iter_scan(image_path, OUTPUT_DIR, extension, workers=workers, progress=progress,
+                                     alignment=_alignment(image_path, align), embedded=embedded,
+                                     exclude=_excluded(image_path, unallocated, progress)):
+            item = {
+                "filename": os.path.basename(r["path"]),
+                "type": r["type"],
+                "size": r["size"],
+                "offset": r["offset"]
+            }
+            while True:
+                progress.check()
+                try:
+                    events.put(item, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            count += 1
+        return {"count": count}
+
+    job = jobs.submit("scan_stream", image_path, run, profile=request.args.get("profile") or DEFAULT_PROFILER)
+
+    def stream():
+        try:
+            yield _sse("job", {"job_id": job.id})
+            last_progress = time.time()
+            while True:
+                try:
+                    yield _sse("result", events.get(timeout=STREAM_PROGRESS_INTERVAL))
+                except queue.Empty:
+                    if job.finished:
+                        break
+                if time.time() - last_progress >= STREAM_PROGRESS_INTERVAL:
+                    yield _sse("progress", job.to_dict(include_result=False))
+                    last_progress = time.time()
+            yield _sse("done", job.to_dict())
+        finally:
+            if not job.finished:
+                jobs.cancel(job.id)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/partitions", methods=["GET"])
+def partitions():
+    """Filesystems found on an image, with the ids /api/deleted_scan accepts in "partitions"."""
+    if "user" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        image_path = resolve_device_path(request.args.get("image_path"))
+    except Exception as e:
+        return jsonify({"error": f"Invalid device path: {e}"}), 400
+    if not image_path:
+        return jsonify({"error": "Missing image_path"}), 400
+
+    try:
+        return jsonify({"partitions": list_filesystems(image_path)})
+    except (ValueError, OSError) as e:
+        return jsonify({"error": f"Can't read partitions: {e}"}), 500
 
 @app.route("/api/deleted_scan", methods=["POST"])
 def scan_deleted():
@@ -145,45 +304,111 @@ def scan_deleted():
     extensions = payload.get("extensions", [])
     start_date = payload.get("start_date")
     end_date = payload.get("end_date")
-    min_size = payload.get("min_size", 512)
+    try:
+        # _passes compares min_size directly, so an explicit null means no minimum.
+        min_size = _size_option(payload.get("min_size", 512)) or 0
+        max_size = _size_option(payload.get("max_size"))
+    except (TypeError, ValueError):
+        return jsonify({"error": SIZE_ERROR}), 400
+    hash_algo = payload.get("hash")
     name_filter = payload.get("name_filter")
+    list_only = bool(payload.get("list_only"))
+    # Partition ids from /api/partitions; every filesystem on the image by default.
+    partitions = payload.get("partitions")
 
     try:
         image_path = resolve_device_path(raw_path)
     except Exception as e:
         return jsonify({"error": f"Invalid device path: {e}"}), 400
 
-    try:
-        scanner = DeletedScanner(image_path, DELETED_DIR)
+    def run(progress):
+        try:
+            scanner = DeletedScanner(image_path, DELETED_DIR, partitions)
+        except Exception as e:
+            print(f"[deleted scan] FS_Info failed: {e}")
+            try:
+                results = recoverer.scan_device(image_path, DELETED_DIR, file_type="mp3", progress=progress)
+            except ScanCancelled:
+                raise
+            except Exception as e2:
+                raise RuntimeError(f"Fallback carving failed: {e2}")
+            formatted = [{
+                "filename": os.path.basename(r["path"]),
+                "type": r["type"],
+                "size": r["size"],
+                "mtime": r.get("mtime")
+            } for r in results]
+            return {"count": len(formatted), "results": formatted, "note": "Fallback to signature carving."}
+
+        if list_only:
+            listed = scanner.list_deleted_files(
+                extensions=extensions,
+                start_date=start_date,
+                end_date=end_date,
+                min_size=min_size,
+                name_filter=name_filter,
+                progress=progress,
+                max_size=max_size
+            )
+            return {"count": len(listed), "results": listed, "listing": True}
+
         results = scanner.scan_deleted_files(
             extensions=extensions,
             start_date=start_date,
             end_date=end_date,
             min_size=min_size,
-            name_filter=name_filter
+            name_filter=name_filter,
+            progress=progress,
+            max_size=max_size,
+            hash_algo=hash_algo
         )
 
         formatted = [{
             "filename": os.path.basename(r["path"]),
+            "partition": r["partition"],
             "type": r["type"],
             "size": r["size"],
-            "mtime": r["mtime"]
+            "mtime": r["mtime"],
+            "hash": r.get("hash")
         } for r in results]
 
-        return jsonify({"count": len(formatted), "results": formatted})
+        return {"count": len(formatted), "results": formatted}
+
+    job = jobs.submit("deleted_scan", image_path, run, profile=payload.get("profile") or DEFAULT_PROFILER)
+    return jsonify({"job_id": job.id, "status": job.status}), 202
+
+@app.route("/api/deleted_extract", methods=["POST"])
+def extract_deleted():
+    if "user" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    payload = request.get_json(force=True)
+    raw_path = payload.get("image_path")
+    inodes = payload.get("inodes") or []
+    hash_algo = payload.get("hash")
+    if not inodes:
+        return jsonify({"error": "No inodes selected"}), 400
+
+    try:
+        image_path = resolve_device_path(raw_path)
     except Exception as e:
-        print(f"[deleted scan] FS_Info failed: {e}")
-        try:
-            results = recoverer.scan_device(image_path, DELETED_DIR, file_type="mp3")
-            formatted = [{
-                "filename": os.path.basename(r["path"]),
-                "type": r["type"],
-                "size": r["size"],
-                "mtime": r.get("mtime")
-            } for r in results]
-            return jsonify({"count": len(formatted), "results": formatted, "note": "Fallback to signature carving."})
-        except Exception as e2:
-            return jsonify({"error": f"Fallback carving failed: {e2}"}), 500
+        return jsonify({"error": f"Invalid device path: {e}"}), 400
+
+    def run(progress):
+        scanner = DeletedScanner(image_path, DELETED_DIR)
+        results = scanner.extract_files(inodes, progress=progress, hash_algo=hash_algo)
+        formatted = [{
+            "filename": os.path.basename(r["path"]),
+            "partition": r["partition"],
+            "type": r["type"],
+            "size": r["size"],
+            "mtime": r["mtime"],
+            "hash": r.get("hash")
+        } for r in results]
+        return {"count": len(formatted), "results": formatted}
+
+    job = jobs.submit("deleted_extract", image_path, run, profile=payload.get("profile") or DEFAULT_PROFILER)
+    return jsonify({"job_id": job.id, "status": job.status}), 202
 
 @app.route("/api/deep_carve", methods=["POST"])
 def deep_carve():
@@ -233,25 +458,45 @@ def scan_carve():
         return jsonify({"error": "Missing image_path"}), 400
 
     try:
-        try:
-            target_path = resolve_device_path(raw_path)
-        except ValueError:
-            target_path = raw_path
-
-        carve_exts = None
-        if extension and extension.lower() != "all":
-            carve_exts = [e.strip().lstrip(".").lower() for e in extension.split(",") if e.strip()]
+        target_path = resolve_device_path(raw_path)
+    except ValueError:
+        target_path = raw_path
 
-        all_results = []
-        if carve_exts:
-            for ext in carve_exts:
-                try:
-                    partial = recoverer.scan_device(device_path=target_path, output_dir=OUTPUT_DIR, file_type=ext)
-                    all_results.extend(partial)
-                except Exception as e:
-                    print(f"[carve] failed for ext {ext}: {e}")
-        else:
-            all_results = recoverer.scan_device(target_path, OUTPUT_DIR, None)
+    try:
+        min_size = _size_option(payload.get("min_size"))
+        max_size = _size_option(payload.get("max_size"))
+    except (TypeError, ValueError):
+        return jsonify({"error": SIZE_ERROR}), 400
+    embedded = payload.get("embedded")
+    # Carve only what no live file occupies; DeletedScanner covers deleted
+    # entries the filesystem still describes.
+    unallocated = bool(payload.get("unallocated"))
+    try:
+        align = _align_option(payload.get("align"))
+    except (TypeError, ValueError):
+        return jsonify({"error": ALIGN_ERROR}), 400
+
+    carve_exts = None
+    if extension and extension.lower() != "all":
+        carve_exts = [e.strip().lstrip(".").lower() for e in extension.split(",") if e.strip()]
+
+    def run(progress):
+        all_results = None
+        alignment = _alignment(target_path, align)
+        exclude = _excluded(target_path, unallocated, progress)
+        try:
+            # Repeated queries against the same image are answered from the scan index.
+            all_results = recoverer.scan_indexed(target_path, OUTPUT_DIR, carve_exts, progress=progress,
+                                                 min_size=min_size, max_size=max_size, alignment=alignment,
+                                                 embedded=embedded, exclude=exclude)
+        except ValueError as e:
+            print(f"[carve] scan index unavailable: {e}")
+
+        if all_results is None:
+            # One pass over the device covers every requested type (None = all).
+            all_results = recoverer.scan_device(target_path, OUTPUT_DIR, carve_exts, progress=progress,
+                                                alignment=alignment, embedded=embedded, exclude=exclude,
+                                                min_size=min_size, max_size=max_size)
 
         out_results = []
         for r in all_results:
@@ -271,13 +516,57 @@ def scan_carve():
                 print(f"[postprocess] {e}")
                 continue
 
-        return jsonify({
+        return {
             "count": len(out_results),
             "results": out_results,
-            "note": "Signature carving mode used (fallback)."
-        })
-    except Exception as e:
-        return jsonify({"error": f"Carving failed: {e}"}), 500
+            "note": "Signature carving of unallocated space." if unallocated else "Signature carving mode used (fallback)."
+        }
+
+    job = jobs.submit("scan_carve", target_path, run, profile=payload.get("profile") or DEFAULT_PROFILER)
+    return jsonify({"job_id": job.id, "status": job.status}), 202
+
+@app.route("/api/jobs", methods=["GET"])
+def list_jobs():
+    if "user" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({"jobs": [job.to_dict(include_result=False) for job in jobs.list()]})
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    if "user" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    if "user" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    job = jobs.cancel(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict(include_result=False))
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics():
+    """
+    Prometheus text format. Counters cover finished jobs only, so they never go
+    backwards; running jobs are reported as gauges, and their per-stage numbers
+    are in /api/jobs/<id>. Scrapers without a session are allowed from loopback.
+    """
+    if "user" not in session and request.remote_addr not in ("127.0.0.1", "::1"):
+        return jsonify({"error": "Unauthorized"}), 401
+    gauges = {}
+    for job in jobs.list():
+        key = ("jobs", "status", job.status)
+        gauges[key] = gauges.get(key, 0) + 1
+        if not job.finished:
+            key = ("running_bytes_scanned", "", "")
+            gauges[key] = gauges.get(key, 0) + job.progress.bytes_scanned
+    body = render_prometheus(TOTALS.snapshot(), gauges)
+    return Response(body, mimetype="text/plain; version=0.0.4")
 
 @app.route("/downloads/<path:filename>", methods=["GET"])
 def downloads(filename):
@@ -289,6 +578,26 @@ def downloads(filename):
         if os.path.exists(path):
             return send_from_directory(folder, filename, as_attachment=True)
 
+    # Entries from a metadata-only listing are extracted the first time they're downloaded.
+    listed = find_listed(filename)
+    if listed:
+        image_path, partition, inode = listed
+
+        def extract(progress):
+            scanner = DeletedScanner(image_path, DELETED_DIR, [partition])
+            return scanner.extract_files([f"{partition}:{inode}"], progress=progress)
+
+        # Counted against the device's scan cap like any job; a busy device is
+        # not read from a second place at once.
+        job = jobs.run_now("deleted_extract", image_path, extract)
+        if job is None:
+            return "Device is busy with another scan, try again later", 503, {"Retry-After": "30"}
+        if job.status != "done":
+            print(f"[download] Extracting {filename} failed: {job.error}")
+            return "File could not be extracted", 500
+        if os.path.exists(os.path.join(DELETED_DIR, filename)):
+            return send_from_directory(DELETED_DIR, filename, as_attachment=True)
+
     return "File not found", 404
 
 @app.route("/api/chat", methods=["POST"])